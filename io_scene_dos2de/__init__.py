@@ -17,6 +17,34 @@
 
 if "bpy" in locals():
     import importlib
+    if "scene_index" in locals():
+        importlib.reload(scene_index) # noqa
+    if "instancing" in locals():
+        importlib.reload(instancing) # noqa
+    if "serializer" in locals():
+        importlib.reload(serializer) # noqa
+    if "mesh_buffers" in locals():
+        importlib.reload(mesh_buffers) # noqa
+    if "mesh_fragments" in locals():
+        importlib.reload(mesh_fragments) # noqa
+    if "lru_cache" in locals():
+        importlib.reload(lru_cache) # noqa
+    if "change_tracker" in locals():
+        importlib.reload(change_tracker) # noqa
+    if "output_manifest" in locals():
+        importlib.reload(output_manifest) # noqa
+    if "conversion_cache" in locals():
+        importlib.reload(conversion_cache) # noqa
+    if "conversion_server" in locals():
+        importlib.reload(conversion_server) # noqa
+    if "divine_log" in locals():
+        importlib.reload(divine_log) # noqa
+    if "conversion_pool" in locals():
+        importlib.reload(conversion_pool) # noqa
+    if "batch_conversion" in locals():
+        importlib.reload(batch_conversion) # noqa
+    if "conversion_queue" in locals():
+        importlib.reload(conversion_queue) # noqa
     if "export_dae" in locals():
         importlib.reload(export_dae) # noqa
 
@@ -26,7 +54,8 @@ import bpy
 import bmesh
 import os
 import os.path
-import subprocess
+import shlex
+import time
 import xml.etree.ElementTree as et
 
 from bpy.types import Operator, AddonPreferences, PropertyGroup, UIList, Panel
@@ -36,6 +65,20 @@ from bpy_extras.io_utils import ExportHelper, ImportHelper
 from math import radians, degrees
 from mathutils import Euler, Matrix
 
+from . import scene_index
+from . import instancing
+from . import serializer
+from . import mesh_buffers
+from . import mesh_fragments
+from . import lru_cache
+from . import change_tracker
+from . import output_manifest
+from . import conversion_cache
+from . import conversion_server
+from . import divine_log
+from . import conversion_pool
+from . import batch_conversion
+from . import conversion_queue
 from . import export_dae
 
 bl_info = {
@@ -75,6 +118,8 @@ IS_TRACING = True
 def report(msg, reportType="WARNING"):
     if current_operator is not None:
         current_operator.report(set((reportType, )), msg)
+    else:
+        conversion_queue.queue.report(msg, reportType)
     print("{} ({})".format(msg, reportType))
 
 def trace(msg):
@@ -84,6 +129,36 @@ def trace(msg):
 def get_prefs(context):
     return context.preferences.addons["io_scene_dos2de"].preferences
 
+def get_cache_directory(prefs, name):
+    """Subfolder of the cache folder set in the preferences, or of the
+    system temp folder"""
+    root = bpy.path.abspath(prefs.cache_directory) if prefs.cache_directory else ""
+    if root == "":
+        root = os.path.join(tempfile.gettempdir(), "dos2de_collada_exporter")
+    return os.path.join(root, name)
+
+def get_fragment_cache(prefs):
+    if not prefs.use_fragment_cache or not mesh_buffers.HAS_NUMPY:
+        return None
+    try:
+        return lru_cache.open_cache(
+            get_cache_directory(prefs, "fragments"),
+            prefs.fragment_cache_size * 1024 * 1024, ".frag")
+    except OSError as e:
+        report("Mesh fragment cache is unavailable: {}".format(e))
+        return None
+
+def get_gr2_cache(prefs):
+    if not prefs.use_gr2_cache:
+        return None
+    try:
+        return lru_cache.open_cache(
+            get_cache_directory(prefs, "gr2"),
+            prefs.gr2_cache_size * 1024 * 1024, ".gr2")
+    except OSError as e:
+        report("GR2 conversion cache is unavailable: {}".format(e))
+        return None
+
 class ProjectData(PropertyGroup):
     project_folder: StringProperty(
         name="Project Folder",
@@ -131,6 +206,17 @@ class DIVINITYEXPORTER_OT_remove_project(Operator):
 
         return {'FINISHED'}
 
+class DIVINITYEXPORTER_OT_clear_gr2_cache(Operator):
+    bl_idname = "divinityexporter.clear_gr2_cache"
+    bl_label = "Clear GR2 Cache"
+    bl_description = "Delete all cached GR2 conversions"
+
+    def execute(self, context):
+        cache = get_gr2_cache(get_prefs(context))
+        if cache is not None:
+            cache.clear()
+        return {'FINISHED'}
+
 class DIVINITYEXPORTER_UL_project_list(UIList):
     def draw_item(self, context, layout, data, item, icon, active_data, active_propname):
         if self.layout_type in {'DEFAULT', 'COMPACT'}:
@@ -160,6 +246,39 @@ class DIVINITYEXPORTER_AddonPreferences(AddonPreferences):
         description="Models will be converted to gr2 by default if the Divine Path is set"
     )
 
+    conversion_workers: IntProperty(
+        name="Conversion Workers",
+        description="How many divine conversions may run at the same time (0 = one per CPU core)",
+        default=0,
+        min=0,
+        max=256
+    )
+
+    conversion_timeout: IntProperty(
+        name="Conversion Timeout (s)",
+        description="Stop divine when a conversion takes longer than this (0 = no limit)",
+        default=600,
+        min=0
+    )
+
+    use_conversion_server: BoolProperty(
+        name="Use Conversion Server (Experimental)",
+        description="Send conversions to long-running server processes instead of starting divine for every file. Experimental: needs an external server hosting LSLib, which is not included with the addon. Falls back to divine when the server can't be started",
+        default=False
+    )
+
+    use_batch_conversion: BoolProperty(
+        name="Batch GR2 Conversions",
+        description="When an export writes several GR2 files, convert all of them with a single divine run instead of one run per file",
+        default=True
+    )
+
+    conversion_server_command: StringProperty(
+        name="Server Command",
+        description="Command line starting an external conversion server that keeps LSLib loaded between jobs (see conversion_server.py for its protocol). The included divine_server_standin.py is only a protocol test harness: it starts divine for every job and saves no time",
+        default=""
+    )
+
     default_preset: EnumProperty(
         name="Default Preset",
         description="The default preset to load when the exporter is opened for the first time",
@@ -182,14 +301,78 @@ class DIVINITYEXPORTER_AddonPreferences(AddonPreferences):
         description="Project pathways to auto-detect when exporting"
     )
 
+    cache_directory: StringProperty(
+        name="Cache Folder",
+        description="Folder for cached export data. Defaults to a folder in the system temp directory",
+        subtype='DIR_PATH',
+    )
+
+    use_fragment_cache: BoolProperty(
+        name="Cache Mesh Fragments",
+        description="Keep the serialized geometry and skin of exported meshes on disk, so meshes that didn't change are copied instead of written again on the next export. Meshes are still evaluated and their vertex data hashed to find their cached data. A hit saves computing tangents, building the vertex buffers and writing them; a miss costs an extra read of the mesh",
+        default=False
+    )
+
+    fragment_cache_size: IntProperty(
+        name="Mesh Cache Size (MB)",
+        description="Least recently used meshes are removed from the cache when it grows over this size",
+        default=256,
+        min=1,
+        max=65536
+    )
+
+    use_gr2_cache: BoolProperty(
+        name="Cache GR2 Conversions",
+        description="Keep converted GR2 files, and copy them instead of running divine when the same DAE is converted again with the same options and divine version",
+        default=True
+    )
+
+    gr2_cache_size: IntProperty(
+        name="GR2 Cache Size (MB)",
+        description="Least recently used conversions are removed from the cache when it grows over this size",
+        default=1024,
+        min=1,
+        max=65536
+    )
+
     def draw(self, context):
         layout = self.layout
         layout.label(text="Divinity Export Addon Preferences")
         layout.prop(self, "lslib_path")
         layout.prop(self, "gr2_default_enabled")
+        row = layout.row()
+        row.prop(self, "conversion_workers")
+        row.prop(self, "conversion_timeout")
+        layout.prop(self, "use_batch_conversion")
+        layout.prop(self, "use_conversion_server")
+        if self.use_conversion_server:
+            layout.prop(self, "conversion_server_command")
+            if not self.conversion_server_command.strip():
+                layout.label(text="Set a server command to use the conversion server.", icon="ERROR")
+            layout.label(text="Experimental: needs an external server hosting LSLib.", icon="INFO")
         layout.prop(self, "default_preset")
         layout.prop(self, "auto_export_subfolder")
 
+        layout.separator()
+        layout.label(text="Cache")
+        layout.prop(self, "cache_directory")
+        layout.prop(self, "use_fragment_cache")
+        row = layout.row()
+        row.enabled = self.use_fragment_cache
+        row.prop(self, "fragment_cache_size")
+        layout.prop(self, "use_gr2_cache")
+        if self.use_gr2_cache:
+            row = layout.row()
+            row.prop(self, "gr2_cache_size")
+            row.operator("divinityexporter.clear_gr2_cache")
+            cache = None
+            if os.path.isdir(get_cache_directory(self, "gr2")):
+                cache = get_gr2_cache(self)
+            if cache is not None:
+                stats = cache.stats
+                layout.label(text="{:.1f} MB in {} files, {} of {} conversions cached this session ({:.0f}% hit rate)".format(
+                    cache.size / (1024 * 1024), len(cache.entries), stats.hits, stats.lookups, 100.0 * stats.hit_rate))
+
         layout.separator()
         layout.label(text="Projects")
         layout.template_list("DIVINITYEXPORTER_UL_project_list", "", self.projects, "project_data", self.projects, "index")
@@ -398,63 +581,177 @@ class DivineInvoker:
 
         return export_str
 
-    def dae_to_gr2(self, collada_path, gr2_path):
+    def conversion_signature(self):
+        """Game and options a GR2 is converted with"""
+        return "{} {}".format(bpy.context.scene.ls_properties.game, self.build_gr2_options())
+
+    def timeout(self):
+        """Seconds a conversion may take, None for no limit"""
+        return self.addon_prefs.conversion_timeout or None
+
+    def conversion_server(self):
+        """Servers to run conversions on, None to start divine directly"""
+        command = self.addon_prefs.conversion_server_command.strip()
+        if not self.addon_prefs.use_conversion_server or not command:
+            return None
+        return conversion_server.get_server_pool(
+            shlex.split(command, posix=(os.name != "nt")))
+
+    def cached_gr2_job(self, collada_path, gr2_path):
+        """Look up the conversion of a DAE in the GR2 cache, and copy the
+        cached GR2 to gr2_path on a hit.
+        Returns (finished job for the hit or None, (cache, key) to store the
+        conversion under or None). The cache is resolved here, as the
+        conversion may be stored from a worker thread."""
+        cache = get_gr2_cache(self.addon_prefs)
+        if cache is None:
+            return None, None
+
+        # Converting the same DAE the same way gives the same GR2
+        try:
+            cache_key = conversion_cache.conversion_key(
+                collada_path, bpy.context.scene.ls_properties.game,
+                self.build_gr2_options(), self.addon_prefs.lslib_path)
+        except OSError as e:
+            print("[DOS2DE-Collada] GR2 cache lookup failed: {}".format(e))
+            return None, None
+
+        # Copied right away, another export could evict the entry before a
+        # worker thread gets to it
+        try:
+            if not cache.copy(cache_key, gr2_path):
+                return None, (cache, cache_key)
+        except OSError as e:
+            print("[DOS2DE-Collada] Could not copy cached GR2, converting it again: {}".format(e))
+            return None, (cache, cache_key)
+        print("[DOS2DE-Collada] Using cached GR2 conversion {}.".format(cache_key))
+        return conversion_pool.ConversionJob(None, collada_path, gr2_path), None
+
+    @staticmethod
+    def store_gr2(cache_entry, gr2_path):
+        """Store a conversion under a (cache, key) of cached_gr2_job. Doesn't
+        touch bpy, so it can run on any thread."""
+        cache, cache_key = cache_entry
+        try:
+            cache.put_file(cache_key, gr2_path)
+        except OSError as e:
+            print("[DOS2DE-Collada] Could not cache GR2 conversion: {}".format(e))
+
+    def dae_to_gr2_job(self, collada_path, gr2_path):
+        """Prepare the conversion of a DAE into a GR2, or None if it can't be
+        done. The returned job can run on any thread."""
         if not self.check_lslib():
-            return False
+            return None
         gr2_options_str = self.build_gr2_options()
-        divine_exe = '"{}"'.format(self.addon_prefs.lslib_path)
         game_ver = bpy.context.scene.ls_properties.game
-        proccess_args = "{} --loglevel all -g {} -s {} -d {} -i dae -o gr2 -a convert-model {}".format(
-            divine_exe, game_ver, '"{}"'.format(collada_path), '"{}"'.format(gr2_path), gr2_options_str
-        )
-        
-        print("[DOS2DE-Collada] Starting GR2 conversion using divine.exe.")
-        print("[DOS2DE-Collada] Sending command: {}".format(proccess_args))
 
-        process = subprocess.run(proccess_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        cached_job, cache_entry = self.cached_gr2_job(collada_path, gr2_path)
+        if cached_job is not None:
+            return cached_job
 
-        print(process.stdout)
-        print(process.stderr)
-        
-        if process.returncode != 0:
-            error_message = "Failed to convert Collada to GR2. {}".format(
-                '\n'.join(process.stdout.splitlines()[-1:]) + '\n' + process.stderr)
-            report(error_message, "ERROR")
-            return False
-        else:
-            return True
+        def store_in_cache(job):
+            self.store_gr2(cache_entry, job.destination)
 
-    def gr2_to_dae(self, gr2_path, collada_path):
+        process_args = [
+            self.addon_prefs.lslib_path, "--loglevel", "all", "-g", game_ver,
+            "-s", collada_path, "-d", gr2_path, "-i", "dae", "-o", "gr2",
+            "-a", "convert-model"] + gr2_options_str.split()
+        job = conversion_pool.ConversionJob(
+            process_args, collada_path, gr2_path, self.timeout(),
+            store_in_cache if cache_entry is not None else None,
+            self.conversion_server())
+
+        print("[DOS2DE-Collada] Starting GR2 conversion using divine.exe.")
+        print("[DOS2DE-Collada] Sending command: {}".format(job.command))
+        return job
+
+    def batch_jobs(self, batch):
+        """Prepare the conversion of every DAE of a BatchConversion. DAEs
+        found in the GR2 cache get their own job and leave the batch, the
+        others are converted by a single divine run."""
         if not self.check_lslib():
-            return False
-        divine_exe = '"{}"'.format(self.addon_prefs.lslib_path)
-        proccess_args = "{} --loglevel all -g bg3 -s {} -d {} -i gr2 -o dae -a convert-model -e flip-uvs".format(
-            divine_exe, '"{}"'.format(gr2_path), '"{}"'.format(collada_path)
-        )
-        
+            return []
+        jobs = []
+        for item in list(batch.items):
+            cached_job, item.cache_entry = self.cached_gr2_job(item.collada_path, item.gr2_path)
+            if cached_job is not None:
+                batch.discard(item.collada_path)
+                jobs.append(cached_job)
+        if not batch.items:
+            return jobs
+
+        timeout = self.timeout()
+        if timeout is not None:
+            timeout *= len(batch.items)
+        process_args = batch.divine_args(
+            self.addon_prefs.lslib_path, bpy.context.scene.ls_properties.game,
+            self.build_gr2_options())
+        job = conversion_pool.ConversionJob(
+            process_args, batch.input_dir, batch.output_dir, timeout,
+            server=self.conversion_server())
+        jobs.append(job)
+
+        print("[DOS2DE-Collada] Converting {} files to GR2 using divine.exe.".format(len(batch.items)))
+        print("[DOS2DE-Collada] Sending command: {}".format(job.command))
+        return jobs
+
+    def finish_batch(self, job, batch):
+        """Move the GR2 files of a finished batch job to their paths and
+        report every file that failed. Returns whether all succeeded."""
+        batch.collect(job.stdout + "\n" + job.stderr, job.error)
+        succeeded = True
+        for item in batch.items:
+            if not item.succeeded:
+                report("Failed to convert \"{}\" to GR2. {}".format(
+                    os.path.basename(item.gr2_path), item.error), "ERROR")
+                succeeded = False
+            elif item.cache_entry is not None:
+                self.store_gr2(item.cache_entry, item.gr2_path)
+        return succeeded
+
+    def gr2_to_dae_job(self, gr2_path, collada_path):
+        if not self.check_lslib():
+            return None
+        process_args = [
+            self.addon_prefs.lslib_path, "--loglevel", "all", "-g", "bg3",
+            "-s", gr2_path, "-d", collada_path, "-i", "gr2", "-o", "dae",
+            "-a", "convert-model", "-e", "flip-uvs"]
+        job = conversion_pool.ConversionJob(
+            process_args, gr2_path, collada_path, self.timeout(),
+            server=self.conversion_server())
+
         print("[DOS2DE-Collada] Starting DAE conversion using divine.exe.")
-        print("[DOS2DE-Collada] Sending command: {}".format(proccess_args))
+        print("[DOS2DE-Collada] Sending command: {}".format(job.command))
+        return job
+
+    def finish_job(self, job, error_prefix):
+        """Report the failure of a finished job, its output was logged
+        while it ran. Returns whether it succeeded."""
+        if not job.succeeded:
+            report("{} {}".format(error_prefix, job.error_message()), "ERROR")
+            return False
+        return True
 
-        process = subprocess.run(proccess_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    def dae_to_gr2(self, collada_path, gr2_path):
+        job = self.dae_to_gr2_job(collada_path, gr2_path)
+        if job is None:
+            return False
+        return self.finish_job(job.run(), "Failed to convert Collada to GR2.")
 
-        print(process.stdout)
-        print(process.stderr)
-        
-        if process.returncode != 0:
-            error_message = "Failed to convert GR2 to Collada. {}".format(
-                '\n'.join(process.stdout.splitlines()[-1:]) + '\n' + process.stderr)
-            report(error_message, "ERROR")
+    def gr2_to_dae(self, gr2_path, collada_path):
+        job = self.gr2_to_dae_job(gr2_path, collada_path)
+        if job is None:
             return False
-        else:
-            return True
+        return self.finish_job(job.run(), "Failed to convert GR2 to Collada.")
 
 
 class ExportTargetCollection:
-    __slots__ = ("targets", "ordered_targets")
+    __slots__ = ("targets", "ordered_targets", "scene_index")
 
-    def __init__(self):
+    def __init__(self, index):
         self.targets = {}
         self.ordered_targets = []
+        self.scene_index = index
 
     def should_export(self, obj):
         return obj.name in self.targets
@@ -473,7 +770,7 @@ class ExportTargetCollector:
         self.options = options
 
     def collect(self, objects):
-        collection = ExportTargetCollection()
+        collection = ExportTargetCollection(scene_index.SceneIndex(objects))
         trace(f'Collecting objects to export:')
         self.collect_objects(objects, collection)
         if 'ARMATURE' in self.options.object_types:
@@ -492,7 +789,7 @@ class ExportTargetCollector:
 
 
     def build_target_children(self, collection: ExportTargetCollection, obj):
-        for child in obj.children:
+        for child in collection.scene_index.children_of(obj):
             if collection.should_export(child):
                 collection.ordered_targets.append(child)
                 self.build_target_children(collection, child)
@@ -501,7 +798,7 @@ class ExportTargetCollector:
     def collect_objects(self, objects, collection: ExportTargetCollection):
         for obj in objects:
             if not collection.should_export(obj):
-                if self.should_export_object(obj):
+                if self.should_export_object(obj, collection.scene_index):
                     collection.add(obj)
                     #self.add_objects_recursive(obj.children, collection)
 
@@ -510,7 +807,7 @@ class ExportTargetCollector:
         for obj in objects:
             trace(f' - {obj.name}: Marked for export because a parent will export')
             collection.add(obj)
-            self.add_objects_recursive(obj.children, collection)
+            self.add_objects_recursive(collection.scene_index.children_of(obj), collection)
 
 
     def collect_parents(self, collection: ExportTargetCollection):
@@ -520,7 +817,7 @@ class ExportTargetCollector:
                 collection.add(obj.parent)
 
 
-    def should_export_object(self, obj):
+    def should_export_object(self, obj, index):
         if obj.type not in self.options.object_types:
             trace(f' - {obj.name}: Not exporting objects of type {obj.type}')
             return False
@@ -531,13 +828,7 @@ class ExportTargetCollector:
             trace(f' - {obj.name}: Not selected')
             return False
         if self.options.use_active_layers:
-            valid = True
-            for col in obj.users_collection:
-                if col.hide_viewport == True:
-                    valid = False
-                    break
-                    
-            if not valid:
+            if not index.in_visible_collections(obj):
                 trace(f' - {obj.name}: Not visible in any user collections')
                 return False
 
@@ -766,6 +1057,15 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
         description="Normalize all vertex groups",
         default=True
         )
+    weight_quantization: FloatProperty(
+        name="Weight Quantization",
+        description="Round skin weights to multiples of this step, e.g. 0.00392 (1/255) "
+                    "to match 8 bit weights (0 = off)",
+        min=0.0,
+        max=0.1,
+        precision=5,
+        default=0.0
+        )
     use_rest_pose: BoolProperty(
         name="Use Rest Pose",
         description="Revert any armatures to their rest poses when exporting (on the copy only)",
@@ -806,6 +1106,102 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
         name="(DEBUG) Keep Object Copies",
         default=False
         )
+    use_geometry_dedup: BoolProperty(
+        name="Deduplicate Geometry",
+        description="Write identical meshes (e.g. duplicated instead of linked) once, "
+                    "and reference that geometry from every object using it",
+        default=True
+        )
+    use_instancing: BoolProperty(
+        name="Export Linked Meshes as Instances",
+        description="Write the geometry of objects linking the same mesh once, and keep their object "
+                    "transforms in their nodes instead of applying them to the geometry. The game "
+                    "sees the same vertices, but as a node transform and local geometry",
+        default=False
+        )
+    use_depsgraph_export: BoolProperty(
+        name="Export Without Copies",
+        description="Read evaluated objects straight from the scene instead of duplicating them, "
+                    "and apply Y-up rotation and object transforms while writing the file. "
+                    "Animation and batch exports always use copies",
+        default=False
+        )
+    use_change_tracking: BoolProperty(
+        name="Skip Unchanged Exports",
+        description="Skip the export and GR2 conversion when nothing it depends on changed since "
+                    "the last export to the same file. When only some objects changed, the meshes "
+                    "of the others are reused if Cache Mesh Fragments is enabled in the add-on "
+                    "preferences; otherwise every mesh is exported again",
+        default=True
+        )
+    use_timestamp: BoolProperty(
+        name="Write Timestamps",
+        description="Write the export time into the file. Without it, exporting the same scene "
+                    "always produces the same file",
+        default=True
+        )
+    use_output_manifest: BoolProperty(
+        name="Skip Identical Files",
+        description="Fingerprint the exported document and keep it in a .manifest.json file next "
+                    "to the output. When the fingerprint is unchanged, the output is neither "
+                    "written nor converted again, so its modification time stays the same",
+        default=False
+        )
+    use_background_conversion: BoolProperty(
+        name="Convert in Background",
+        description="Finish the export without waiting for the GR2 conversion. Progress is shown "
+                    "in the status bar, and failures in a popup once the conversion is done",
+        default=False
+        )
+    use_bounded_memory: BoolProperty(
+        name="Low Memory Mode",
+        description="Free each evaluated mesh and its vertex buffers as soon as it is written, "
+                    "and report the peak memory usage of the export",
+        default=False
+        )
+
+    precision_positions: IntProperty(
+        name="Positions",
+        description="Significant digits written for positions (0 = full precision)",
+        min=0,
+        max=17,
+        default=0
+        )
+    precision_normals: IntProperty(
+        name="Normals/Tangents",
+        description="Significant digits written for normals, tangents and bitangents (0 = full precision)",
+        min=0,
+        max=17,
+        default=0
+        )
+    precision_uvs: IntProperty(
+        name="UVs",
+        description="Significant digits written for UVs (0 = full precision)",
+        min=0,
+        max=17,
+        default=0
+        )
+    precision_colors: IntProperty(
+        name="Colors",
+        description="Significant digits written for vertex colors (0 = full precision)",
+        min=0,
+        max=17,
+        default=0
+        )
+    precision_weights: IntProperty(
+        name="Weights",
+        description="Significant digits written for skin weights (0 = full precision)",
+        min=0,
+        max=17,
+        default=0
+        )
+    precision_matrices: IntProperty(
+        name="Matrices",
+        description="Significant digits written for node, bone and animation matrices (0 = full precision)",
+        min=0,
+        max=17,
+        default=0
+        )
 
     applying_preset: BoolProperty(default=False)
     yup_local_override: BoolProperty(default=False)
@@ -923,7 +1319,7 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
 
     batch_mode: BoolProperty(
         name="Batch Export",
-        description="Export all active layers as separate files, or every action as separate animation files",
+        description="Export every visible top-level collection as a separate file",
         default=False
     )
 
@@ -980,7 +1376,25 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
         if self.misc_settings_visible:
             box = layout.box()
             box.prop(self, "use_exclude_ctrl_bones")
+            box.prop(self, "weight_quantization")
             box.prop(self, "keep_copies")
+            box.prop(self, "use_geometry_dedup")
+            box.prop(self, "use_instancing")
+            box.prop(self, "use_depsgraph_export")
+            box.prop(self, "use_change_tracking")
+            box.prop(self, "use_timestamp")
+            box.prop(self, "use_output_manifest")
+            box.prop(self, "use_background_conversion")
+            box.prop(self, "use_bounded_memory")
+
+            box.label(text="Float Precision (Significant Digits)")
+            col = box.column(align=True)
+            col.prop(self, "precision_positions")
+            col.prop(self, "precision_normals")
+            col.prop(self, "precision_uvs")
+            col.prop(self, "precision_colors")
+            col.prop(self, "precision_weights")
+            col.prop(self, "precision_matrices")
             
     @property
     def check_extension(self):
@@ -1101,12 +1515,20 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
     def copy_obj(self, context, obj, old_parent):
         copy = obj.copy()
         copy.use_fake_user = False
+        self.created_ids.add(copy)
         trace(f" - Copy '{obj.name}' -> '{copy.name}'")
 
         data = getattr(obj, "data", None)
-        if data != None:
+        instance_key = self.instance_keys.get(obj)
+        if instance_key is not None and instance_key in self.instance_data:
+            trace(f"    - Share data of instance '{obj.data.name}'")
+            copy.data = self.instance_data[instance_key]
+        elif data != None:
             copy.data = data.copy()
             copy.data.use_fake_user = False
+            self.created_ids.add(copy.data)
+            if instance_key is not None:
+                self.instance_data[instance_key] = copy.data
         
         export_props = getattr(obj, "llexportprops", None)
         if export_props is not None:
@@ -1144,12 +1566,30 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
         pass
 
 
+    def apply_script_preset(self, context):
+        """Presets are applied when selected_preset is changed in the UI, which
+        doesn't happen when the operator is called from a script. Settings
+        passed along with the preset take precedence over it."""
+        passed = {}
+        for prop in self.properties.bl_rna.properties:
+            name = prop.identifier
+            if (prop.type not in {"POINTER", "COLLECTION"} and name != "selected_preset"
+                    and self.properties.is_property_set(name)):
+                passed[name] = getattr(self, name)
+        self.apply_preset(context)
+        for name, value in passed.items():
+            setattr(self, name, value)
+
     def execute(self, context):
         global current_operator
         try:
             current_operator = self
+            if not self.initialized and self.selected_preset != "NONE":
+                self.apply_script_preset(context)
+            change_tracker.tracker.begin_export(context)
             return self.really_execute(context)
         finally:
+            change_tracker.tracker.end_export(context)
             current_operator = None
 
 
@@ -1170,7 +1610,7 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
             if armature_mod is not None:
                 copy.modifiers.remove(armature_mod)
 
-        for child in obj.children:
+        for child in self.objects_to_export.scene_index.children_of(obj):
             if self.objects_to_export.should_export(child):
                 self.make_copy_recursive(context, child, copies, obj)
 
@@ -1202,12 +1642,22 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
             new_mod.vertex_group = mod.vertex_group
 
 
-    def apply_modifiers(self, obj):
-        self.transform_apply(obj, location=True, rotation=True, scale=True)
+    def apply_modifiers(self, obj, instance_key=None):
+        # Instances keep their transform as node matrix, as it can't be
+        # applied to mesh data shared with other objects
+        if instance_key is None:
+            self.transform_apply(obj, location=True, rotation=True, scale=True)
 
         modifiers = [mod for mod in obj.modifiers if mod.type != 'ARMATURE']
         if len(modifiers) == 0:
             return
+
+        if instance_key is not None and instance_key in self.instance_meshes:
+            trace(f"    - Reuse modifiers applied on another instance for '{obj.name}'")
+            for modifier in modifiers:
+                obj.modifiers.remove(modifier)
+            obj.data = self.instance_meshes[instance_key]
+            return
         
         trace(f"    - Apply modifiers on '{obj.name}'")
         if self.use_rest_pose:
@@ -1222,6 +1672,8 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
         old_mesh = obj.data
         dg = bpy.context.evaluated_depsgraph_get()
         mesh = obj.to_mesh(preserve_all_data_layers=True, depsgraph=dg).copy()
+        self.created_ids.add(mesh)
+        obj.to_mesh_clear()
 
         # Reset poses
         if self.use_rest_pose:
@@ -1233,7 +1685,12 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
                 obj.modifiers.remove(modifier)
         
         obj.data = mesh
-        bpy.data.meshes.remove(old_mesh)
+        if instance_key is not None:
+            self.instance_meshes[instance_key] = mesh
+        # Other instances may still use the old data
+        if old_mesh.users == 0:
+            self.created_ids.discard(old_mesh)
+            bpy.data.meshes.remove(old_mesh)
 
 
     def reparent_object(self, copies, orig, obj):
@@ -1270,7 +1727,7 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
         if export_props is not None:
             if not obj.parent:
                 export_props.prepare(context, obj)
-                for childobj in obj.children:
+                for childobj in self.copies_index.children_of(obj):
                     childobj.llexportprops.prepare(context, childobj)
                     childobj.llexportprops.prepare_name(context, childobj)
             export_props.prepare_name(context, obj)
@@ -1278,9 +1735,11 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
         if self.yup_enabled == "ROTATE" and self.objects_to_export.is_root(orig):
             self.apply_yup_transform(obj)
         
-        self.apply_modifiers(obj)
+        self.apply_modifiers(obj, self.instance_keys.get(orig))
 
-        if obj.type == "MESH" and obj.vertex_groups:
+        # The exporter limits and normalizes the extracted weights itself,
+        # these operators are only needed for its fallback without NumPy
+        if obj.type == "MESH" and obj.vertex_groups and not mesh_buffers.HAS_NUMPY:
             bpy.context.view_layer.objects.active = obj
             obj.select_set(True)
             bpy.ops.object.mode_set(mode="WEIGHT_PAINT")
@@ -1299,36 +1758,114 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
                 obj.select_set(False)
 
 
-    def remove_copies(self, copies):
-        bpy.ops.object.select_all(action='DESELECT')
-
-        for obj in copies.values():
-            if obj is not None:
-                obj.select_set(True)
-
-        bpy.ops.object.delete(use_global=True)
+    def remove_copies(self):
+        # Only what the export created: object copies and their data
+        trace(f'Removing {len(self.created_ids)} temporary datablocks')
+        bpy.data.batch_remove(self.created_ids)
+        self.created_ids = set()
+    
 
-        #Cleanup
-        for block in bpy.data.meshes:
-            if block.users == 0:
-                bpy.data.meshes.remove(block)
+    def batch_collections(self, context):
+        """Top-level collections of the scene batch mode exports as separate
+        files, the ones that are neither excluded nor hidden."""
+        return scene_index.visible_top_collections(context.view_layer.layer_collection)
 
-        for block in bpy.data.armatures:
-            if block.users == 0:
-                bpy.data.armatures.remove(block)
+    def submit_conversion(self, context, job):
+        workers = get_prefs(context).conversion_workers
+        if self.use_background_conversion:
+            # Jobs outlive the operator
+            conversion_queue.queue.get_pool(workers).submit(job)
+        else:
+            if self.conversion_pool is None:
+                self.conversion_pool = conversion_pool.ConversionPool(workers)
+            self.conversion_pool.submit(job)
+        self.conversion_jobs.append(job)
+
+    def start_conversion(self, context, collada_path, gr2_path):
+        """Start converting an exported DAE into a GR2 on the conversion
+        pool, so it runs while the export continues."""
+        job = DivineInvoker(get_prefs(context), self.divine_settings).dae_to_gr2_job(
+            collada_path, gr2_path)
+        if job is not None:
+            self.submit_conversion(context, job)
+        return job
+
+    def stage_conversion(self, context, gr2_path):
+        """Path to export the DAE converted into gr2_path to. With batch
+        conversions it is converted by finish_conversions, otherwise it has
+        to be passed to start_conversion."""
+        if not get_prefs(context).use_batch_conversion:
+            return self.temporary_collada_path()
+        if self.conversion_batch is None:
+            self.conversion_batch = batch_conversion.BatchConversion()
+        return self.conversion_batch.add(gr2_path).collada_path
+
+    def finish_conversions(self, context, on_finish):
+        """Wait for every started conversion, report failures and call
+        on_finish(). With background conversions this happens once the
+        conversions finished, after the operator returned; nothing used
+        from then on may refer to the operator."""
+        divine = DivineInvoker(get_prefs(context), self.divine_settings)
+        batch = self.conversion_batch
+        self.conversion_batch = None
+        batch_job = None
+        if batch is not None and batch.items:
+            for job in divine.batch_jobs(batch):
+                self.submit_conversion(context, job)
+                if job.args is not None:
+                    batch_job = job
+        jobs = self.conversion_jobs
+        self.conversion_jobs = []
+
+        def finish():
+            try:
+                for job in jobs:
+                    if job is batch_job:
+                        divine.finish_batch(job, batch)
+                    else:
+                        divine.finish_job(job, "Failed to convert Collada to GR2.")
+            finally:
+                if batch is not None:
+                    batch.cleanup()
+            on_finish()
+
+        if self.use_background_conversion and jobs:
+            conversion_queue.queue.add(jobs, finish)
+            report("Exported, converting {} file(s) to GR2 in the background.".format(len(jobs)), "INFO")
+            return False
 
-        for block in bpy.data.materials:
-            if block.users == 0:
-                bpy.data.materials.remove(block)
+        if self.conversion_pool is not None:
+            # The cursor shows how many conversions are done
+            wm = context.window_manager
+            wm.progress_begin(0, len(jobs))
+            try:
+                while not all(job.finished for job in jobs):
+                    wm.progress_update(sum(1 for job in jobs if job.finished))
+                    time.sleep(0.1)
+                self.conversion_pool.wait()
+            finally:
+                wm.progress_end()
+                self.conversion_pool.shutdown()
+                self.conversion_pool = None
+        finish()
+        return True
 
-        for block in bpy.data.textures:
-            if block.users == 0:
-                bpy.data.textures.remove(block)
+    def temporary_collada_path(self):
+        temp = tempfile.NamedTemporaryFile(suffix=".dae", delete=False)
+        temp.close()
+        self.temporary_files.append(Path(temp.name))
+        return temp.name
 
-        for block in bpy.data.images:
-            if block.users == 0:
-                bpy.data.images.remove(block)
-    
+    def export_signature(self, context, targets):
+        """Everything an export depends on besides the exported objects"""
+        settings = self.as_keywords(ignore=("check_existing",
+                                            "filter_glob",
+                                            "filepath",
+                                            "use_background_conversion"
+                                            ))
+        return change_tracker.signature(
+            settings, [obj.name for obj in targets],
+            change_tracker.scene_signature(context.scene), get_prefs(context).lslib_path)
 
     def really_execute(self, context):
         output_path = Path(self.properties.filepath)
@@ -1356,6 +1893,12 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
         
         selectedObjects = []
         copies = {}
+        self.created_ids = set()
+        self.conversion_pool = None
+        self.conversion_batch = None
+        self.conversion_jobs = []
+        self.temporary_files = []
+        conversion_job = None
 
         if activeObject is not None and not activeObject.hide_get():
             bpy.ops.object.mode_set(mode="OBJECT")
@@ -1373,24 +1916,56 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
         
         context.scene.ls_properties.metadata_version = ColladaMetadataLoader.LSLIB_METADATA_VERSION
 
-        trace(f'Copying objects:')
-        for obj in self.objects_to_export.ordered_targets:
-            if obj.parent is None or not self.objects_to_export.should_export(obj.parent):
-                self.make_copy_recursive(context, obj, copies, None)
+        # Changes are tracked per output file, for single file exports
+        tracker = change_tracker.tracker
+        export_record = None
+        previous_export = None
+        unchanged = False
+        if self.use_change_tracking and not self.batch_mode:
+            export_record = change_tracker.ExportRecord(
+                tracker.generation,
+                self.export_signature(context, self.objects_to_export.ordered_targets))
+            previous_export = tracker.previous_export(str(output_path), export_record.signature)
+            unchanged = (previous_export is not None and tracker.is_unchanged(
+                previous_export, str(output_path), self.objects_to_export.ordered_targets))
+
+        # The exporter bakes transforms itself when reading from the depsgraph;
+        # animations and batch exports still work on copies
+        use_depsgraph_export = (self.use_depsgraph_export and not self.use_anim
+                                and not self.batch_mode and mesh_buffers.HAS_NUMPY)
+
+        # With instancing, objects sharing mesh data keep sharing it on their
+        # copies, so the exporter writes their geometry once
+        self.instance_keys = {}
+        self.instance_data = {}
+        self.instance_meshes = {}
 
         ordered_copies = []
-        for obj in self.objects_to_export.ordered_targets:
-            ordered_copies.append((obj, copies[obj.name]))
+        if not use_depsgraph_export and not unchanged:
+            if self.use_instancing:
+                self.instance_keys = instancing.instance_groups(
+                    self.objects_to_export.ordered_targets, self.use_mesh_modifiers)
+
+            trace(f'Copying objects:')
+            for obj in self.objects_to_export.ordered_targets:
+                if obj.parent is None or not self.objects_to_export.should_export(obj.parent):
+                    self.make_copy_recursive(context, obj, copies, None)
 
-        trace(f'Preparing hierarchy:')
-        # Update parents of copied objects before performing any modifications;
-        # otherwise the transforms may not propagate to children properly
-        for (orig, obj) in ordered_copies:
-            self.update_hierarchy(context, copies, orig, obj)
+            for obj in self.objects_to_export.ordered_targets:
+                ordered_copies.append((obj, copies[obj.name]))
 
-        trace(f'Applying transforms:')
-        for (orig, obj) in ordered_copies:
-            self.apply_all_object_transforms(context, copies, orig, obj)
+            trace(f'Preparing hierarchy:')
+            # Update parents of copied objects before performing any modifications;
+            # otherwise the transforms may not propagate to children properly
+            for (orig, obj) in ordered_copies:
+                self.update_hierarchy(context, copies, orig, obj)
+
+            # Hierarchy of the copies is final from here on
+            self.copies_index = scene_index.SceneIndex(copies.values())
+
+            trace(f'Applying transforms:')
+            for (orig, obj) in ordered_copies:
+                self.apply_all_object_transforms(context, copies, orig, obj)
 
         keywords = self.as_keywords(ignore=("axis_forward",
                                             "axis_up",
@@ -1400,6 +1975,20 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
                                             "xna_validate",
                                             "filepath"
                                             ))
+        keywords["use_depsgraph_export"] = use_depsgraph_export
+        keywords["export_record"] = export_record
+        keywords["previous_export"] = previous_export
+        # Copies are tracked by the objects they were made from
+        keywords["export_sources"] = {copy: orig for (orig, copy) in ordered_copies}
+
+        manifest = None
+        if self.use_output_manifest and not self.batch_mode:
+            conversion = None
+            if tempfile_path is not None:
+                conversion = DivineInvoker(addon_prefs, self.divine_settings).conversion_signature()
+            manifest = output_manifest.OutputManifest(str(output_path), conversion)
+        keywords["output_manifest"] = manifest
+        keywords["fragment_cache"] = get_fragment_cache(get_prefs(context))
 
         exported_pathways = []
 
@@ -1410,34 +1999,58 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
                 single_mode = True
             else:
                 if self.use_active_layers:
-                    progress_total = len(list(i for i in range(20) if context.scene.layers[i]))
-                    for i in range(20):
-                        if context.scene.layers[i]:
-                            export_list = list(filter(lambda orig, obj: obj.layers[i], ordered_copies))
-                            export_name = "{}_Layer{}".format(bpy.path.basename(bpy.context.blend_data.filepath), i)
-
-                            if self.auto_name == "LAYER" and "namedlayers" in bpy.data.scenes[context.scene.name]:
-                                namedlayers = getattr(bpy.data.scenes[context.scene.name], "namedlayers", None)
-                                if namedlayers is not None:
-                                    export_name = namedlayers.layers[i].name
-                            
-                            export_filepath = bpy.path.ensure_ext("{}\\{}".format(self.directory, export_name), self.filename_ext)
-                            print("[DOS2DE-Exporter] Batch exporting layer '{}' as '{}'.".format(i, export_filepath))
-
-                            if export_dae.save(self, context, export_list, filepath=export_filepath, **keywords) == {"FINISHED"}:
-                                exported_pathways.append(export_filepath)
-                            else:
-                                report( "[DOS2DE-Exporter] Failed to export '{}'.".format(export_filepath))
+                    # Layers are the top-level collections of the scene since 2.80
+                    blend_name = bpy.path.display_name_from_filepath(bpy.data.filepath)
+                    directory = self.directory or str(output_path.parent)
+                    for collection in self.batch_collections(context):
+                        members = set(collection.all_objects)
+                        export_list = [obj for (orig, obj) in ordered_copies if orig in members]
+                        if not export_list:
+                            continue
+
+                        if self.auto_name == "LAYER" or not blend_name:
+                            export_name = collection.name
+                        else:
+                            export_name = "{}_{}".format(blend_name, collection.name)
+
+                        export_filepath = bpy.path.ensure_ext(os.path.join(directory, bpy.path.clean_name(export_name)), self.filename_ext)
+                        print("[DOS2DE-Exporter] Batch exporting collection '{}' as '{}'.".format(collection.name, export_filepath))
+
+                        collada_filepath = export_filepath
+                        if export_filepath.lower().endswith(".gr2"):
+                            collada_filepath = self.stage_conversion(context, export_filepath)
+
+                        if export_dae.save(self, context, export_list, filepath=collada_filepath, **keywords) == {"FINISHED"}:
+                            exported_pathways.append(export_filepath)
+                            # Converts while the next collection is exported,
+                            # or with the whole batch at the end
+                            if collada_filepath != export_filepath and self.conversion_batch is None:
+                                self.start_conversion(context, collada_filepath, export_filepath)
+                        else:
+                            report( "[DOS2DE-Exporter] Failed to export '{}'.".format(export_filepath))
+                            if self.conversion_batch is not None:
+                                self.conversion_batch.discard(collada_filepath)
                 else:
                     single_mode = True
 
-        if single_mode:
-            result = export_dae.save(self, context, copies.values(), filepath=str(collada_path), **keywords)
+        if single_mode and unchanged:
+            report("Nothing changed since the last export to \"{}\", skipped it.".format(
+                output_path.name), "INFO")
+        elif single_mode:
+            if use_depsgraph_export:
+                export_objects = self.objects_to_export.ordered_targets
+            else:
+                export_objects = copies.values()
+            result = export_dae.save(self, context, export_objects, filepath=str(collada_path), **keywords)
             if result == {"FINISHED"}:
                 exported_pathways.append(str(collada_path))
+                # Converts while the copies are removed and the scene restored;
+                # the GR2 of an identical document is up to date already
+                if tempfile_path is not None and not (manifest is not None and manifest.unchanged):
+                    conversion_job = self.start_conversion(context, str(tempfile_path), str(output_path))
 
-        if not self.keep_copies:
-            self.remove_copies(copies)
+        if self.created_ids and not self.keep_copies:
+            self.remove_copies()
 
         bpy.ops.object.select_all(action='DESELECT')
         
@@ -1457,11 +2070,35 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
         except Exception as e:
             print("[DOS2DE-Collada] Error setting viewport mode:\n{}".format(e))
 
-        if tempfile_path is not None:
-            divine = DivineInvoker(addon_prefs, self.divine_settings)
-            for collada_file in exported_pathways:
-                divine.dae_to_gr2(str(tempfile_path), str(output_path))
-            tempfile_path.unlink()
+        temporary_files = self.temporary_files
+
+        def conversions_finished():
+            for path in temporary_files:
+                path.unlink()
+
+            exported = str(collada_path) in exported_pathways
+            identical = manifest is not None and manifest.unchanged
+            if tempfile_path is not None:
+                if not identical:
+                    exported = conversion_job is not None and conversion_job.succeeded
+                tempfile_path.unlink()
+
+            if manifest is not None and not identical and not unchanged:
+                if exported:
+                    manifest.save()
+                else:
+                    manifest.remove()
+
+            if export_record is not None and not unchanged:
+                if exported:
+                    tracker.store(str(output_path), export_record)
+                else:
+                    tracker.forget(str(output_path))
+
+        finished = self.finish_conversions(context, conversions_finished)
+
+        if unchanged or not finished:
+            return {"FINISHED"}
 
         report("Export completed successfully.", "INFO")
         return {"FINISHED"}
@@ -1859,6 +2496,7 @@ classes = (
     DIVINITYEXPORTER_OT_import_collada,
     DIVINITYEXPORTER_OT_add_project,
     DIVINITYEXPORTER_OT_remove_project,
+    DIVINITYEXPORTER_OT_clear_gr2_cache,
     DIVINITYEXPORTER_UL_project_list,
     DIVINITYEXPORTER_AddonPreferences,
     LSMeshProperties,
@@ -1882,6 +2520,8 @@ def register():
     bpy.types.Bone.ls_properties = PointerProperty(type=LSBoneProperties)
     bpy.types.Scene.ls_properties = PointerProperty(type=LSSceneProperties)
 
+    change_tracker.register()
+
     wm = bpy.context.window_manager
     km = wm.keyconfigs.addon.keymaps.new('Window', space_type='EMPTY', region_type='WINDOW', modal=False)
 
@@ -1898,6 +2538,10 @@ def unregister():
     for cls in classes:
         bpy.utils.unregister_class(cls)
 
+    change_tracker.unregister()
+    conversion_queue.unregister()
+    conversion_server.shutdown_servers()
+
     del bpy.types.Scene.ls_properties
     del bpy.types.Bone.ls_properties
     del bpy.types.Armature.ls_properties
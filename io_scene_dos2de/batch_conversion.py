@@ -0,0 +1,130 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""
+Conversion of many DAEs with a single divine run.
+
+Exported DAEs are written into the input folder of a staging directory,
+divine's convert-models action converts the whole folder into the output
+folder, and the GR2 files are then moved to their final paths. divine goes
+on with the next file when one fails, so the outcome of every file is taken
+from the error lines of the log and the files that were produced.
+"""
+
+import os
+import re
+import shutil
+import tempfile
+
+# Log lines look like "[ERROR] message"
+LOG_LEVEL = re.compile(r"^\[(\w+)\]")
+ERROR_LEVELS = ("ERROR", "FATAL")
+
+
+class BatchItem:
+    """One DAE of a batch, staged under name."""
+
+    __slots__ = ("name", "collada_path", "gr2_path", "cache_entry", "error")
+
+    def __init__(self, name, collada_path, gr2_path):
+        self.name = name
+        self.collada_path = collada_path
+        self.gr2_path = gr2_path
+        self.cache_entry = None
+        self.error = None
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+
+class BatchConversion:
+    __slots__ = ("directory", "input_dir", "output_dir", "items")
+
+    def __init__(self, parent=None):
+        self.directory = tempfile.mkdtemp(prefix="dos2de_batch_", dir=parent)
+        self.input_dir = os.path.join(self.directory, "dae")
+        self.output_dir = os.path.join(self.directory, "gr2")
+        os.mkdir(self.input_dir)
+        os.mkdir(self.output_dir)
+        self.items = []
+
+    def add(self, gr2_path):
+        """Stage the conversion into gr2_path; the DAE is exported to the
+        collada_path of the returned item."""
+        # Outputs of different folders may share a file name
+        stem = os.path.splitext(os.path.basename(gr2_path))[0]
+        name = "{:04d}_{}".format(len(self.items), stem)
+        item = BatchItem(name, os.path.join(self.input_dir, name + ".dae"), gr2_path)
+        self.items.append(item)
+        return item
+
+    def discard(self, collada_path):
+        """Leave a DAE out of the batch, e.g. because its export failed."""
+        for item in self.items:
+            if item.collada_path == collada_path:
+                self.items.remove(item)
+                try:
+                    os.remove(collada_path)
+                except OSError:
+                    pass
+                return
+
+    def divine_args(self, divine_path, game, options):
+        """Command line converting the whole batch"""
+        return [divine_path, "--loglevel", "all", "-g", game,
+                "-s", self.input_dir, "-d", self.output_dir, "-i", "dae", "-o", "gr2",
+                "-a", "convert-models"] + options.split()
+
+    def output_path(self, item):
+        return os.path.join(self.output_dir, item.name + ".gr2")
+
+    def collect(self, log, error=None):
+        """Move the converted files to their paths, and set the error of
+        every item that failed. error fails the whole batch (e.g. divine
+        could not be started)."""
+        errors = failed_files(log, [item.name for item in self.items])
+        for item in self.items:
+            item.error = error or errors.get(item.name)
+            if item.error is not None:
+                continue
+            output = self.output_path(item)
+            if not os.path.isfile(output):
+                item.error = "divine did not produce a GR2 file."
+                continue
+            try:
+                shutil.move(output, item.gr2_path)
+            except OSError as e:
+                item.error = str(e)
+
+    def cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def failed_files(log, names):
+    """name -> first error line of the log about the staged file name"""
+    patterns = {name: re.compile(r"[\\/]" + re.escape(name) + r"\.") for name in names}
+    errors = {}
+    for line in log.splitlines():
+        line = line.strip()
+        level = LOG_LEVEL.match(line)
+        if level is None or level.group(1).upper() not in ERROR_LEVELS:
+            continue
+        for name, pattern in patterns.items():
+            if name not in errors and pattern.search(line):
+                errors[name] = line
+    return errors
@@ -0,0 +1,236 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""
+Headless export of many .blend files.
+
+    python batch_export.py manifest.json [--blender PATH] [--workers N]
+                           [--timeout SECONDS] [--summary summary.json]
+
+The manifest lists the files to export:
+
+    {
+        "blender": "C:/Program Files/Blender Foundation/Blender 3.6/blender.exe",
+        "workers": 0,
+        "timeout": 3600,
+        "defaults": {"preset": "MODEL", "options": {"use_change_tracking": false}},
+        "jobs": [
+            {"blend": "Models/Chair.blend", "output": "Export/Chair.GR2"},
+            {"blend": "Anims/Walk.blend", "output": "Export/Walk.GR2",
+             "preset": "ANIMATION", "options": {"use_mesh_modifiers": false}}
+        ]
+    }
+
+Relative paths are relative to the manifest. preset is one of the presets
+of the export operator, options are export operator settings. Every job
+runs in its own background Blender process, with up to workers (0 = one
+per CPU core) running at a time. The timings and errors of all jobs are
+written to a JSON summary, by default next to the manifest.
+
+Inside Blender, the open file is exported with export_current():
+
+    blender -b Chair.blend --python-expr "import io_scene_dos2de.batch_export as b; b.export_current('Chair.GR2', 'MODEL')"
+
+Nothing but export_current() needs bpy, so the manifest can be run by any
+Python 3 interpreter.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ADDON_NAME = "io_scene_dos2de"
+ADDON_PARENT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SUMMARY_SUFFIX = ".summary.json"
+# Lines of Blender's output kept in the summary of a failed job
+LOG_TAIL_LINES = 20
+
+
+def export_current(output, preset="NONE", options=None):
+    """Export the open .blend file to output with a preset and export
+    operator settings. Raises RuntimeError when nothing was exported."""
+    import addon_utils
+    import bpy
+
+    if ADDON_NAME not in bpy.context.preferences.addons:
+        addon_utils.enable(ADDON_NAME, default_set=False)
+
+    options = dict(options or {})
+    # Nothing polls background conversions in a background Blender
+    options["use_background_conversion"] = False
+    output = os.path.abspath(output)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+
+    result = bpy.ops.export_scene.dos2de_collada(
+        filepath=output, selected_preset=preset, **options)
+    if "FINISHED" not in result or not os.path.isfile(output):
+        raise RuntimeError("Failed to export \"{}\".".format(output))
+
+
+class ExportJob:
+    __slots__ = ("blend", "output", "preset", "options", "returncode",
+                 "timed_out", "errors", "log", "duration")
+
+    def __init__(self, blend, output, preset="NONE", options=None):
+        self.blend = blend
+        self.output = output
+        self.preset = preset
+        self.options = options or {}
+        self.returncode = None
+        self.timed_out = False
+        self.errors = []
+        self.log = ""
+        self.duration = 0.0
+
+    @property
+    def succeeded(self):
+        return self.returncode == 0 and not self.errors
+
+    def command(self, blender):
+        expr = ("import sys, json; sys.path.append({!r}); "
+                "import {}.batch_export as batch; "
+                "batch.export_current({!r}, {!r}, json.loads({!r}))").format(
+                    ADDON_PARENT, ADDON_NAME, self.output, self.preset,
+                    json.dumps(self.options))
+        return [blender, "-b", self.blend, "--python-exit-code", "1",
+                "--python-expr", expr]
+
+    def run(self, blender, timeout=None):
+        start = time.monotonic()
+        try:
+            process = subprocess.run(
+                self.command(blender), stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                universal_newlines=True, errors="replace", timeout=timeout)
+            self.returncode = process.returncode
+            self.log = process.stdout
+        except subprocess.TimeoutExpired as e:
+            self.timed_out = True
+            self.log = e.stdout.decode("utf-8", "replace") if isinstance(e.stdout, bytes) else (e.stdout or "")
+            self.errors.append("Blender did not finish within {} seconds and was stopped.".format(timeout))
+        except OSError as e:
+            self.errors.append("Could not start Blender: {}".format(e))
+        self.duration = time.monotonic() - start
+
+        # The exporter reports errors as "message (ERROR)"
+        self.errors.extend(line.strip() for line in self.log.splitlines()
+                           if line.rstrip().endswith("(ERROR)"))
+        if self.returncode not in (0, None) and not self.errors:
+            self.errors.append("Blender exited with code {}.".format(self.returncode))
+        return self
+
+    def summary(self):
+        data = {
+            "blend": self.blend,
+            "output": self.output,
+            "preset": self.preset,
+            "succeeded": self.succeeded,
+            "duration": round(self.duration, 3),
+            "returncode": self.returncode,
+            "timed_out": self.timed_out,
+            "errors": self.errors,
+        }
+        if not self.succeeded:
+            data["log"] = self.log.splitlines()[-LOG_TAIL_LINES:]
+        return data
+
+
+def read_manifest(path):
+    """(settings, jobs) of a manifest file. Raises ValueError for manifests
+    that aren't valid."""
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if not isinstance(manifest, dict):
+        raise ValueError("The manifest must be a JSON object.")
+
+    base = os.path.dirname(os.path.abspath(path))
+    defaults = manifest.get("defaults", {})
+    jobs = []
+    for number, entry in enumerate(manifest.get("jobs", []), 1):
+        for field in ("blend", "output"):
+            if not entry.get(field):
+                raise ValueError("Job {} of the manifest has no \"{}\".".format(number, field))
+        options = dict(defaults.get("options", {}))
+        options.update(entry.get("options", {}))
+        jobs.append(ExportJob(
+            os.path.join(base, entry["blend"]),
+            os.path.join(base, entry["output"]),
+            entry.get("preset", defaults.get("preset", "NONE")),
+            options))
+    return manifest, jobs
+
+
+def run_jobs(jobs, blender, workers=0, timeout=None):
+    workers = max(1, workers or os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(job.run, blender, timeout) for job in jobs]
+        for job, future in zip(jobs, futures):
+            future.result()
+            print("[DOS2DE-Batch] {} {} ({:.1f}s)".format(
+                "Exported" if job.succeeded else "FAILED", job.output, job.duration))
+            for error in job.errors:
+                print("    {}".format(error))
+    return workers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export .blend files listed in a manifest.")
+    parser.add_argument("manifest", help="JSON manifest of the files to export")
+    parser.add_argument("--blender", help="Blender executable (default: manifest, $BLENDER or blender)")
+    parser.add_argument("--workers", type=int, help="Blender processes at a time (0 = one per CPU core)")
+    parser.add_argument("--timeout", type=float, help="Seconds a single export may take")
+    parser.add_argument("--summary", help="Where to write the JSON summary")
+    args = parser.parse_args(argv)
+
+    try:
+        manifest, jobs = read_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        parser.error("Could not read the manifest: {}".format(e))
+    blender = (args.blender or manifest.get("blender") or
+               os.environ.get("BLENDER") or "blender")
+    workers = args.workers if args.workers is not None else manifest.get("workers", 0)
+    timeout = args.timeout if args.timeout is not None else manifest.get("timeout")
+    summary_path = args.summary or os.path.splitext(args.manifest)[0] + SUMMARY_SUFFIX
+
+    started = time.strftime("%Y-%m-%dT%H:%M:%S")
+    start = time.monotonic()
+    workers = run_jobs(jobs, blender, workers, timeout)
+    failed = sum(1 for job in jobs if not job.succeeded)
+
+    summary = {
+        "manifest": os.path.abspath(args.manifest),
+        "started": started,
+        "duration": round(time.monotonic() - start, 3),
+        "workers": workers,
+        "succeeded": len(jobs) - failed,
+        "failed": failed,
+        "jobs": [job.summary() for job in jobs],
+    }
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent="\t")
+
+    print("[DOS2DE-Batch] Exported {} of {} files in {:.1f}s, summary written to {}.".format(
+        len(jobs) - failed, len(jobs), summary["duration"], summary_path))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
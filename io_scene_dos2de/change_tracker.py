@@ -0,0 +1,243 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""
+Tracking of datablocks changed since the last export of each output file.
+
+A depsgraph_update_post handler stamps every updated datablock with a
+generation number. An export remembers the generation it ran at, so any
+datablock with a later stamp changed since then. Changes made by the
+exporter itself (copies, selection, temporarily disabled modifiers) happen
+while tracking is suspended and are not recorded.
+
+Nothing is stored in the .blend file: after loading a file or restarting
+Blender, the first export of every output is a full one.
+"""
+
+import os
+import bpy
+from bpy.app.handlers import persistent
+
+
+def id_key(id_data):
+    return (type(id_data).__name__, id_data.name_full)
+
+
+def dependencies(obj):
+    """Datablocks the exported data of obj is built from, besides what the
+    depsgraph already propagates to obj itself."""
+    yield obj
+    if obj.data is not None:
+        yield obj.data
+    for slot in obj.material_slots:
+        if slot.material is not None:
+            yield slot.material
+
+    anim = obj.animation_data
+    if anim is not None:
+        if anim.action is not None:
+            yield anim.action
+        for track in anim.nla_tracks:
+            for strip in track.strips:
+                if strip.action is not None:
+                    yield strip.action
+
+    # Skeleton info (bone indices, bind poses) is written into the skin
+    armatures = [m.object for m in obj.modifiers
+                 if m.type == "ARMATURE" and m.object is not None]
+    if obj.parent is not None and obj.parent.type == "ARMATURE":
+        armatures.append(obj.parent)
+    for armature in armatures:
+        yield armature
+        if armature.data is not None:
+            yield armature.data
+
+
+def signature_value(value):
+    """Comparable form of an operator setting; property groups are expanded
+    into their own settings."""
+    if isinstance(value, (bool, int, float, str)) or value is None:
+        return value
+    if isinstance(value, set):
+        return tuple(sorted(value))
+    if isinstance(value, bpy.types.PropertyGroup):
+        return tuple(
+            (prop.identifier, signature_value(getattr(value, prop.identifier)))
+            for prop in value.bl_rna.properties
+            if prop.identifier != "rna_type")
+    try:
+        return tuple(signature_value(v) for v in value)
+    except TypeError:
+        return repr(value)
+
+
+def signature(settings, *extra):
+    """Settings of an export: a dict of operator settings and any other
+    values the output depends on."""
+    return (tuple((k, signature_value(v)) for k, v in sorted(settings.items())),
+            signature_value(extra))
+
+
+def scene_signature(scene):
+    """Scene settings the export reads. The Scene datablock itself can't be
+    tracked like objects, since frame changes and selection update it too."""
+    return (scene.name_full, scene.frame_start, scene.frame_end, scene.frame_current,
+            scene.render.fps, scene.render.fps_base, scene.unit_settings.scale_length,
+            signature_value(scene.ls_properties),
+            signature_value(scene.get("dos2de_yup_local_override")))
+
+
+def output_state(path):
+    """(modification time, size) of an output file, None if it is missing."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class ExportRecord:
+    """State of one export to an output file.
+    fragment_keys maps source object names to the mesh fragment key they
+    were written with, see DaeExporter.export_mesh."""
+
+    __slots__ = ("generation", "signature", "output_state", "fragment_keys")
+
+    def __init__(self, generation, signature):
+        self.generation = generation
+        self.signature = signature
+        self.output_state = None
+        self.fragment_keys = {}
+
+
+class ChangeTracker:
+    __slots__ = ("generation", "changed", "reset_generation", "suspended",
+                 "records")
+
+    def __init__(self):
+        self.generation = 0
+        # id_key -> generation of the last change
+        self.changed = {}
+        # Everything counts as changed at this generation (undo, ...)
+        self.reset_generation = 0
+        self.suspended = False
+        # output path -> ExportRecord
+        self.records = {}
+
+    def record_updates(self, updates):
+        if self.suspended:
+            return
+
+        keys = []
+        for update in updates:
+            id_data = update.id.original
+            # Objects are also updated for selection or visibility changes,
+            # which don't change what is exported
+            if (isinstance(id_data, bpy.types.Object) and
+                    not update.is_updated_geometry and
+                    not update.is_updated_transform):
+                continue
+            keys.append(id_key(id_data))
+
+        if keys:
+            self.generation += 1
+            for key in keys:
+                self.changed[key] = self.generation
+
+    def invalidate(self):
+        """Treat every datablock as changed."""
+        self.generation += 1
+        self.reset_generation = self.generation
+
+    def reset(self):
+        self.invalidate()
+        self.changed = {}
+        self.records = {}
+
+    def changed_since(self, id_data, generation):
+        return max(self.changed.get(id_key(id_data), 0),
+                   self.reset_generation) > generation
+
+    def is_clean(self, obj, generation):
+        """Whether nothing obj is exported from changed after generation."""
+        return not any(self.changed_since(id_data, generation)
+                       for id_data in dependencies(obj))
+
+    def begin_export(self, context):
+        # Pending changes still belong to the user, the ones made during the
+        # export don't
+        context.evaluated_depsgraph_get()
+        self.suspended = True
+
+    def end_export(self, context):
+        context.evaluated_depsgraph_get()
+        self.suspended = False
+
+    def previous_export(self, path, signature):
+        """Record of the last export to path with the same settings."""
+        record = self.records.get(path)
+        if record is None or record.signature != signature:
+            return None
+        return record
+
+    def is_unchanged(self, record, path, objects):
+        """Whether exporting objects again would reproduce the output of
+        the recorded export, which is still there."""
+        if record.output_state is None or output_state(path) != record.output_state:
+            return False
+        return all(self.is_clean(obj, record.generation) for obj in objects)
+
+    def store(self, path, record):
+        record.output_state = output_state(path)
+        self.records[path] = record
+
+    def forget(self, path):
+        self.records.pop(path, None)
+
+
+tracker = ChangeTracker()
+
+
+@persistent
+def on_depsgraph_update(scene, depsgraph):
+    tracker.record_updates(depsgraph.updates)
+
+
+@persistent
+def on_load(*args):
+    tracker.reset()
+
+
+@persistent
+def on_undo(*args):
+    tracker.invalidate()
+
+
+def register():
+    bpy.app.handlers.depsgraph_update_post.append(on_depsgraph_update)
+    bpy.app.handlers.load_post.append(on_load)
+    bpy.app.handlers.undo_post.append(on_undo)
+    bpy.app.handlers.redo_post.append(on_undo)
+
+
+def unregister():
+    for handlers, handler in ((bpy.app.handlers.depsgraph_update_post, on_depsgraph_update),
+                              (bpy.app.handlers.load_post, on_load),
+                              (bpy.app.handlers.undo_post, on_undo),
+                              (bpy.app.handlers.redo_post, on_undo)):
+        if handler in handlers:
+            handlers.remove(handler)
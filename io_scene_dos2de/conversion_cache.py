@@ -0,0 +1,100 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""
+Keys of the GR2 conversion cache.
+
+A converted GR2 only depends on the DAE content, the target game, the
+conversion options and the divine build doing the conversion, so those are
+hashed into the key of the cached file. The export time written into the
+<asset> header is left out of the DAE content, otherwise no two exports
+would share a key.
+"""
+
+import hashlib
+import os
+import re
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Libraries next to divine.exe that do the actual conversion
+DIVINE_LIBRARIES = ("LSLib.dll", "LSLibNative.dll")
+
+# <created>/<modified> of the <asset> header
+ASSET_END = b"</asset>"
+ASSET_TIMESTAMP = re.compile(rb"<(created|modified)>[^<]*</\1>")
+
+# (path, mtime, size) -> digest, so binaries are hashed once per session
+file_digests = {}
+
+
+def file_digest(path):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def document_digest(dae_path):
+    """file_digest of a DAE without the timestamps of its <asset> header."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(dae_path, "rb") as f:
+        block = f.read(HASH_BLOCK_SIZE)
+        # The header comes first; a document whose header doesn't fit the
+        # first block is hashed as is
+        end = block.find(ASSET_END)
+        if end >= 0:
+            block = ASSET_TIMESTAMP.sub(rb"<\1></\1>", block[:end]) + block[end:]
+        while block:
+            digest.update(block)
+            block = f.read(HASH_BLOCK_SIZE)
+    return digest.hexdigest()
+
+
+def stable_file_digest(path):
+    """file_digest of a file that rarely changes, remembered until its
+    modification time or size changes."""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    digest = file_digests.get(key)
+    if digest is None:
+        digest = file_digests[key] = file_digest(path)
+    return digest
+
+
+def divine_identity(divine_path):
+    """Digest of the divine executable and its conversion libraries."""
+    digests = [stable_file_digest(divine_path)]
+    directory = os.path.dirname(divine_path)
+    for name in DIVINE_LIBRARIES:
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            digests.append(name + ":" + stable_file_digest(path))
+    return " ".join(digests)
+
+
+def conversion_key(dae_path, game, options, divine_path):
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(document_digest(dae_path).encode("utf-8"))
+    for value in (game, options, divine_identity(divine_path)):
+        digest.update(b"\0")
+        digest.update(value.encode("utf-8"))
+    return digest.hexdigest()
@@ -0,0 +1,239 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""
+Divine conversions running in parallel with the export.
+
+Jobs run on worker threads, which spend their time waiting for the divine
+process, so exporting the next file continues on the main thread meanwhile.
+Nothing here touches bpy: jobs are prepared and their results reported on
+the main thread.
+"""
+
+import os
+import queue
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import conversion_server
+from . import divine_log
+
+# Error records quoted in the report of a failed job
+MAX_REPORTED_ERRORS = 5
+
+
+def default_worker_count():
+    return os.cpu_count() or 1
+
+
+class ConversionJob:
+    """One divine run converting source into destination.
+    args is None for jobs that don't need divine (e.g. cache hits); the work
+    is then done by on_success alone. on_success runs on the worker thread
+    after a successful conversion, and may raise OSError to fail the job.
+    With a server (conversion_server.ServerPool), divine runs there instead
+    of in a new process, unless the server is unavailable.
+    The output of divine is parsed into records (divine_log.LogRecord) while
+    it runs, and divine is stopped as soon as it reports a fatal error."""
+
+    __slots__ = ("args", "source", "destination", "timeout", "on_success",
+                 "server", "returncode", "stdout", "stderr", "records",
+                 "last_record", "timed_out", "error", "duration", "finished")
+
+    def __init__(self, args, source, destination, timeout=None, on_success=None,
+                 server=None):
+        self.args = args
+        self.source = source
+        self.destination = destination
+        # Seconds, None to wait forever
+        self.timeout = timeout
+        self.on_success = on_success
+        self.server = server
+        self.returncode = None
+        self.stdout = ""
+        self.stderr = ""
+        self.records = []
+        # Latest record about the progress, read by other threads
+        self.last_record = None
+        self.timed_out = False
+        self.error = None
+        self.duration = 0.0
+        # Set last, once the results can be read from other threads
+        self.finished = False
+
+    @property
+    def succeeded(self):
+        return self.returncode == 0 and self.error is None
+
+    @property
+    def status(self):
+        """What divine is doing, e.g. "Body: save"."""
+        record = self.last_record
+        if record is None:
+            return ""
+        if record.subject and record.phase:
+            return "{}: {}".format(record.subject, record.phase)
+        return record.subject or record.phase or ""
+
+    @property
+    def command(self):
+        return subprocess.list2cmdline(self.args) if self.args else ""
+
+    def run(self):
+        start = time.monotonic()
+        try:
+            if self.args is None:
+                self.returncode = 0
+            else:
+                self.run_process()
+            if self.succeeded and self.on_success is not None:
+                self.on_success(self)
+        except OSError as e:
+            self.error = str(e)
+        except Exception as e:
+            # Raising would lose the results of the other jobs in wait()
+            self.error = "Conversion failed: {}".format(e)
+        finally:
+            self.duration = time.monotonic() - start
+            self.finished = True
+        return self
+
+    def run_process(self):
+        if self.server is not None:
+            try:
+                # The server knows its divine, only the arguments are sent
+                self.returncode, self.stdout, self.stderr = self.server.convert(
+                    self.args[1:], self.timeout)
+                self.add_output(self.stdout, self.stderr)
+                if any(record.is_fatal for record in self.records):
+                    self.returncode = self.returncode or 1
+                return
+            except conversion_server.ServerTimeout:
+                self.timed_out = True
+                self.error = "divine did not finish within {} seconds and the conversion server was stopped.".format(
+                    self.timeout)
+                return
+            except conversion_server.ServerUnavailable as e:
+                print("[DOS2DE-Collada] {}, running divine directly.".format(e))
+
+        try:
+            process = subprocess.Popen(
+                self.args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True, errors="replace", bufsize=1)
+        except OSError as e:
+            self.error = str(e)
+            return
+
+        # Both pipes are read at once, so neither can fill up and block divine
+        lines = queue.Queue()
+        readers = [threading.Thread(target=read_lines, args=(stream, name, lines), daemon=True)
+                   for stream, name in ((process.stdout, "stdout"), (process.stderr, "stderr"))]
+        for reader in readers:
+            reader.start()
+
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        output = {"stdout": [], "stderr": []}
+        open_streams = len(readers)
+        stop = False
+        while open_streams and not stop:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                self.timed_out = True
+                self.error = "divine did not finish within {} seconds and was stopped.".format(
+                    self.timeout)
+                break
+            try:
+                name, line = lines.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if line is None:
+                open_streams -= 1
+                continue
+            output[name].append(line)
+            record = self.add_line(line, name)
+            if record is not None and record.is_fatal:
+                self.error = "divine stopped after a fatal error: {}".format(record.message)
+                stop = True
+
+        if open_streams:
+            # Timed out or failed, no use waiting for the rest
+            process.kill()
+        self.returncode = process.wait()
+        for reader in readers:
+            reader.join(5)
+        self.stdout = "".join(output["stdout"])
+        self.stderr = "".join(output["stderr"])
+
+    def add_line(self, line, stream):
+        """Log a line of output and parse it into a record."""
+        print("[{}] {}".format(os.path.basename(self.source), line.rstrip()))
+        record = divine_log.parse_line(
+            line, stream, self.records[-1] if self.records else None)
+        if record is not None:
+            self.records.append(record)
+            if record.phase or record.subject:
+                self.last_record = record
+        return record
+
+    def add_output(self, stdout, stderr):
+        """Parse the output of a finished divine run."""
+        for name, text in (("stdout", stdout), ("stderr", stderr)):
+            for line in text.splitlines():
+                self.add_line(line, name)
+
+    def error_message(self):
+        """Why the job failed, for the export report"""
+        if self.error is not None:
+            return self.error
+        errors = [str(record) for record in self.records if record.is_error]
+        if errors:
+            return '\n'.join(errors[:MAX_REPORTED_ERRORS])
+        return '\n'.join(self.stdout.splitlines()[-1:]) + '\n' + self.stderr
+
+
+def read_lines(stream, name, lines):
+    for line in stream:
+        lines.put((name, line))
+    # End of output
+    lines.put((name, None))
+
+
+class ConversionPool:
+    """Runs submitted jobs on up to workers threads, in submission order."""
+
+    __slots__ = ("executor", "futures")
+
+    def __init__(self, workers=None):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, workers or default_worker_count()),
+            thread_name_prefix="divine")
+        self.futures = []
+
+    def submit(self, job):
+        self.futures.append(self.executor.submit(job.run))
+        return job
+
+    def wait(self):
+        """Wait for all jobs, returns them in submission order."""
+        jobs = [future.result() for future in self.futures]
+        self.futures = []
+        return jobs
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
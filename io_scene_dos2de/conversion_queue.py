@@ -0,0 +1,182 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""
+GR2 conversions finishing in the background, after the export operator
+returned.
+
+The jobs of an export run on a pool shared by all exports, and a timer
+polls them on the main thread: it shows the progress in the status bar and
+runs the completion callback of an export once all its jobs finished.
+Messages reported by callbacks are shown in a popup, since there is no
+operator left to report them.
+"""
+
+import bpy
+
+from . import conversion_pool
+
+# Seconds between polls of the running jobs
+POLL_INTERVAL = 0.25
+# Seconds the summary stays in the status bar
+SUMMARY_SECONDS = 5.0
+
+REPORT_ICONS = {"ERROR": "CANCEL", "WARNING": "ERROR"}
+
+
+class ConversionTask:
+    """Jobs of one export; on_finish runs on the main thread once all of
+    them finished."""
+
+    __slots__ = ("jobs", "on_finish")
+
+    def __init__(self, jobs, on_finish):
+        self.jobs = jobs
+        self.on_finish = on_finish
+
+    @property
+    def finished(self):
+        return all(job.finished for job in self.jobs)
+
+
+class ConversionQueue:
+    __slots__ = ("pool", "tasks", "reports", "finishing", "failed")
+
+    def __init__(self):
+        self.pool = None
+        self.tasks = []
+        # (message, level) reported while a task finishes
+        self.reports = []
+        self.finishing = False
+        self.failed = 0
+
+    def get_pool(self, workers):
+        if self.pool is None:
+            self.pool = conversion_pool.ConversionPool(workers)
+        return self.pool
+
+    def add(self, jobs, on_finish):
+        """Call on_finish once jobs (already submitted to the pool of
+        get_pool) finished."""
+        self.tasks.append(ConversionTask(jobs, on_finish))
+        if not bpy.app.timers.is_registered(poll):
+            bpy.app.timers.register(poll, first_interval=POLL_INTERVAL, persistent=True)
+        self.show_progress()
+
+    def report(self, message, level):
+        if self.finishing:
+            self.reports.append((message, level))
+
+    def jobs(self):
+        return [job for task in self.tasks for job in task.jobs]
+
+    def show_progress(self):
+        jobs = self.jobs()
+        done = sum(1 for job in jobs if job.finished)
+        text = "Converting to GR2: {} of {} done".format(done, len(jobs))
+        running = [job.status for job in jobs if not job.finished and job.status]
+        if running:
+            text += " ({})".format(", ".join(running))
+        set_status_text(text)
+
+    def poll(self):
+        """Finish the tasks whose jobs are done. Returns the delay until the
+        next poll, None when nothing is left to wait for."""
+        for task in [task for task in self.tasks if task.finished]:
+            self.tasks.remove(task)
+            self.finish(task)
+
+        if self.tasks:
+            self.show_progress()
+            return POLL_INTERVAL
+
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.failed:
+            set_status_text("GR2 conversion finished, {} failed".format(self.failed))
+        else:
+            set_status_text("GR2 conversion finished")
+        self.failed = 0
+        bpy.app.timers.register(clear_status_text, first_interval=SUMMARY_SECONDS)
+        return None
+
+    def finish(self, task):
+        self.failed += sum(1 for job in task.jobs if not job.succeeded)
+        self.finishing = True
+        try:
+            task.on_finish()
+        except Exception as e:
+            # Must not stop the timer, other tasks still have to finish
+            self.reports.append(("Finishing GR2 conversion failed: {}".format(e), "ERROR"))
+        finally:
+            self.finishing = False
+
+        reports, self.reports = self.reports, []
+        problems = [(message, level) for message, level in reports
+                    if level in REPORT_ICONS]
+        if problems:
+            show_reports(problems)
+
+    def shutdown(self):
+        """Wait for the running jobs without finishing their tasks."""
+        if bpy.app.timers.is_registered(poll):
+            bpy.app.timers.unregister(poll)
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        self.tasks = []
+        clear_status_text()
+
+
+def set_status_text(text):
+    for window in bpy.context.window_manager.windows:
+        window.workspace.status_text_set(text)
+
+
+def clear_status_text():
+    # Another conversion may have started meanwhile
+    if not queue.tasks:
+        set_status_text(None)
+    return None
+
+
+def show_reports(reports):
+    def draw(menu, context):
+        for message, level in reports:
+            for i, line in enumerate(message.splitlines()):
+                menu.layout.label(text=line, icon=REPORT_ICONS[level] if i == 0 else "BLANK1")
+
+    wm = bpy.context.window_manager
+    for window in wm.windows:
+        try:
+            with bpy.context.temp_override(window=window):
+                wm.popup_menu(draw, title="GR2 Conversion", icon="ERROR")
+            return
+        except (RuntimeError, TypeError):
+            continue
+
+
+queue = ConversionQueue()
+
+
+def poll():
+    return queue.poll()
+
+
+def unregister():
+    queue.shutdown()
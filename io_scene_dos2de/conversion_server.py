@@ -0,0 +1,214 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""
+Client of long-lived conversion server processes.
+
+Starting divine for every file spends most of the time on runtime startup
+and LSLib initialization. A conversion server is started once and receives
+jobs over its stdin/stdout pipes, one JSON object per line:
+
+    server:  {"ready": true, "protocol": 1}
+    client:  {"id": 1, "args": ["-g", "bg3", "-s", "in.dae", ...]}
+    server:  {"id": 1, "returncode": 0, "stdout": "...", "stderr": "..."}
+    client:  {"shutdown": true}
+
+args are the divine command line arguments without the executable.
+divine_server_standin.py is a test harness for the protocol: it fakes
+conversions, or forwards them to divine, which saves no startup time.
+
+Servers that crash are restarted once per job; when that fails, callers
+fall back to running divine themselves.
+"""
+
+import json
+import queue
+import subprocess
+import threading
+
+PROTOCOL_VERSION = 1
+
+# Seconds to wait for a starting server to report it is ready
+STARTUP_TIMEOUT = 60
+
+
+class ServerUnavailable(Exception):
+    pass
+
+
+class ServerTimeout(Exception):
+    pass
+
+
+def read_lines(stream, lines):
+    for line in stream:
+        lines.put(line)
+    # End of output, the process exited
+    lines.put(None)
+
+
+class ConversionServer:
+    """One server process, running one job at a time."""
+
+    __slots__ = ("command", "process", "lines", "next_id")
+
+    def __init__(self, command):
+        self.command = command
+        self.process = None
+        self.lines = None
+        self.next_id = 0
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        try:
+            self.process = subprocess.Popen(
+                self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                universal_newlines=True, encoding="utf-8", bufsize=1)
+        except OSError as e:
+            self.process = None
+            raise ServerUnavailable("could not start the conversion server: {}".format(e))
+
+        self.lines = queue.Queue()
+        threading.Thread(
+            target=read_lines, args=(self.process.stdout, self.lines),
+            daemon=True).start()
+
+        try:
+            hello = self.receive(STARTUP_TIMEOUT)
+        except ServerTimeout:
+            self.stop()
+            raise ServerUnavailable("the conversion server did not start in time")
+        if not hello.get("ready") or hello.get("protocol") != PROTOCOL_VERSION:
+            self.stop()
+            raise ServerUnavailable("the conversion server speaks another protocol")
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            try:
+                self.send({"shutdown": True})
+                self.process.wait(5)
+            except (OSError, ValueError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+        self.lines = None
+
+    def send(self, message):
+        self.process.stdin.write(json.dumps(message) + "\n")
+        self.process.stdin.flush()
+
+    def receive(self, timeout):
+        """Next message of the server"""
+        while True:
+            try:
+                line = self.lines.get(timeout=timeout)
+            except queue.Empty:
+                raise ServerTimeout()
+            if line is None:
+                raise ServerUnavailable("the conversion server exited")
+            line = line.strip()
+            # Anything else the server prints is passed on to the console
+            if line.startswith("{"):
+                try:
+                    return json.loads(line)
+                except ValueError:
+                    pass
+            print(line)
+
+    def run(self, args, timeout=None):
+        """Run a job, returns (returncode, stdout, stderr).
+        A job that doesn't finish in time stops the server."""
+        self.next_id += 1
+        job_id = self.next_id
+        try:
+            self.send({"id": job_id, "args": args})
+            while True:
+                response = self.receive(timeout)
+                if response.get("id") == job_id:
+                    break
+        except ServerTimeout:
+            self.process.kill()
+            self.stop()
+            raise
+        except (OSError, ValueError) as e:
+            self.stop()
+            raise ServerUnavailable("lost the conversion server: {}".format(e))
+
+        return (int(response.get("returncode", 1)), response.get("stdout", ""),
+                response.get("stderr", ""))
+
+    def convert(self, args, timeout=None):
+        """run(), (re)starting the server when needed."""
+        for attempt in range(2):
+            try:
+                if not self.running:
+                    self.start()
+                return self.run(args, timeout)
+            except ServerUnavailable:
+                self.stop()
+                if attempt == 1:
+                    raise
+
+
+class ServerPool:
+    """Servers for one command, one per job running at the same time.
+    Idle servers are kept for the next jobs."""
+
+    __slots__ = ("command", "idle", "lock")
+
+    def __init__(self, command):
+        self.command = command
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def convert(self, args, timeout=None):
+        with self.lock:
+            server = self.idle.pop() if self.idle else ConversionServer(self.command)
+        try:
+            return server.convert(args, timeout)
+        finally:
+            with self.lock:
+                self.idle.append(server)
+
+    def shutdown(self):
+        with self.lock:
+            servers, self.idle = self.idle, []
+        for server in servers:
+            server.stop()
+
+
+# command -> ServerPool, kept for the whole session
+server_pools = {}
+
+
+def get_server_pool(command):
+    command = tuple(command)
+    pool = server_pools.get(command)
+    if pool is None:
+        pool = server_pools[command] = ServerPool(list(command))
+    return pool
+
+
+def shutdown_servers():
+    for pool in server_pools.values():
+        pool.shutdown()
+    server_pools.clear()
@@ -0,0 +1,115 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""
+Parsing of divine's output into log records.
+
+divine prefixes its messages with their level, e.g. "[ERROR] ...". Lines
+without a prefix continue the previous message (exception traces) or come
+from the .NET runtime, which writes unhandled exceptions to stderr. The
+phase of the conversion and the mesh or bone a message is about are
+guessed from its text.
+"""
+
+import re
+
+LEVELS = ("TRACE", "DEBUG", "INFO", "WARN", "ERROR", "FATAL")
+LEVEL_ALIASES = {"WARNING": "WARN"}
+
+LEVEL_PREFIX = re.compile(r"^\[(\w+)\]\s*")
+
+# Keywords of the messages starting each phase, in the order the phases run
+PHASES = (
+    ("load", ("load", "read", "import", "pars")),
+    ("conform", ("conform",)),
+    ("process", ("convert", "generat", "build", "calculat", "dedup")),
+    ("save", ("sav", "writ", "export")),
+)
+PHASE_WORD = re.compile(r"\b[a-z]+")
+
+# Mesh 'Body', bone "Dummy_Root", mesh: Body_LOD0
+SUBJECT = re.compile(
+    r"\b(mesh|bone)\b(?:\s*:\s*|\s+)(?:'([^']+)'|\"([^\"]+)\"|(?<=:)\s*([\w.\-]+))",
+    re.IGNORECASE)
+
+# Written by the runtime when divine crashes; it may hang afterwards
+RUNTIME_FATAL = ("unhandled exception",)
+
+
+class LogRecord:
+    __slots__ = ("level", "message", "phase", "mesh", "bone", "stream")
+
+    def __init__(self, level, message, phase=None, mesh=None, bone=None, stream="stdout"):
+        self.level = level
+        self.message = message
+        self.phase = phase
+        self.mesh = mesh
+        self.bone = bone
+        self.stream = stream
+
+    @property
+    def is_error(self):
+        return self.level in ("ERROR", "FATAL")
+
+    @property
+    def is_fatal(self):
+        return self.level == "FATAL"
+
+    @property
+    def subject(self):
+        return self.mesh or self.bone
+
+    def __str__(self):
+        return "[{}] {}".format(self.level, self.message)
+
+
+def parse_phase(message):
+    words = PHASE_WORD.findall(message.lower())
+    for word in words:
+        for phase, keywords in PHASES:
+            if word.startswith(keywords):
+                return phase
+    return None
+
+
+def parse_line(line, stream="stdout", previous=None):
+    """Record of a line of output, None for empty lines. previous is the
+    record of the line before, continued by lines without a level."""
+    line = line.rstrip()
+    if not line.strip():
+        return None
+
+    prefix = LEVEL_PREFIX.match(line)
+    if prefix is not None:
+        level = prefix.group(1).upper()
+        level = LEVEL_ALIASES.get(level, level)
+        if level in LEVELS:
+            message = line[prefix.end():]
+            record = LogRecord(level, message, parse_phase(message), stream=stream)
+            for match in SUBJECT.finditer(message):
+                name = match.group(2) or match.group(3) or match.group(4)
+                setattr(record, match.group(1).lower(), name)
+            return record
+
+    message = line.strip()
+    if message.lower().startswith(RUNTIME_FATAL):
+        return LogRecord("FATAL", message, stream=stream)
+    if previous is not None and previous.stream == stream:
+        # Continues a message, e.g. the stack trace of an error
+        return LogRecord(previous.level, message, previous.phase,
+                         previous.mesh, previous.bone, stream)
+    return LogRecord("ERROR" if stream == "stderr" else "INFO", message, stream=stream)
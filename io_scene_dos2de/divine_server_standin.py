@@ -0,0 +1,135 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""
+Stand-in conversion server, speaking the protocol of conversion_server.py.
+
+    python divine_server_standin.py [--divine PATH] [--delay SECONDS]
+
+This is a test harness for the protocol, not a faster divine: with
+--divine, every job still starts divine with the job arguments. Without
+it, conversions are faked by copying the source (-s) to the destination
+(-d), or every .dae of the source folder into the destination folder for
+convert-models, which is enough to test the addon without divine. Fake
+batch conversions of DAEs containing FAKE_FAILURE fail with an error in the
+log, like divine does. --delay makes each job take longer.
+
+This file is a standalone script and is not imported by the addon.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+PROTOCOL_VERSION = 1
+
+FAKE_FAILURE = "FAKE_FAILURE"
+
+
+def argument(args, flag):
+    try:
+        return args[args.index(flag) + 1]
+    except (ValueError, IndexError):
+        return None
+
+
+def fake_conversion(args):
+    source = argument(args, "-s")
+    destination = argument(args, "-d")
+    if source is None or destination is None:
+        return 1, "", "Missing source or destination path.\n"
+    if argument(args, "-a") == "convert-models":
+        return fake_batch_conversion(source, destination)
+    try:
+        shutil.copyfile(source, destination)
+    except OSError as e:
+        return 1, "", "{}\n".format(e)
+    return 0, "Converted {} to {}.\n".format(source, destination), ""
+
+
+def fake_batch_conversion(source, destination):
+    log = []
+    for name in sorted(os.listdir(source)):
+        if not name.lower().endswith(".dae"):
+            continue
+        path = os.path.join(source, name)
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                failed = FAKE_FAILURE in f.read()
+            if not failed:
+                shutil.copyfile(path, os.path.join(destination, name[:-4] + ".gr2"))
+        except OSError as e:
+            log.append("[ERROR] Failed to convert {}: {}".format(path, e))
+            continue
+        if failed:
+            log.append("[ERROR] Failed to convert {}: fake failure".format(path))
+        else:
+            log.append("[INFO] Converted {}".format(path))
+    return 0, "".join(line + "\n" for line in log), ""
+
+
+def divine_conversion(divine, args):
+    try:
+        process = subprocess.run(
+            [divine] + args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True)
+    except OSError as e:
+        return 1, "", "{}\n".format(e)
+    return process.returncode, process.stdout, process.stderr
+
+
+def send(message):
+    sys.stdout.write(json.dumps(message) + "\n")
+    sys.stdout.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--divine", help="divine.exe running the conversions")
+    parser.add_argument("--delay", type=float, default=0.0,
+                        help="seconds added to every job")
+    options = parser.parse_args(argv)
+
+    send({"ready": True, "protocol": PROTOCOL_VERSION})
+
+    for line in sys.stdin:
+        try:
+            request = json.loads(line)
+        except ValueError:
+            continue
+        if request.get("shutdown"):
+            break
+
+        args = [str(arg) for arg in request.get("args", [])]
+        if options.delay:
+            time.sleep(options.delay)
+        if options.divine:
+            returncode, stdout, stderr = divine_conversion(options.divine, args)
+        else:
+            returncode, stdout, stderr = fake_conversion(args)
+        send({"id": request.get("id"), "returncode": returncode,
+              "stdout": stdout, "stderr": stderr})
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
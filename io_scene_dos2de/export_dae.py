@@ -28,12 +28,23 @@ import os
 import time
 import math
 import re
+import sys
+import hashlib
 import shutil
+import tempfile
 import bpy
 import bmesh
 from mathutils import Vector, Matrix
 from bpy_extras import node_shader_utils
 
+from . import mesh_buffers
+from . import mesh_fragments
+from . import serializer
+from . import lru_cache
+from . import change_tracker
+from .scene_index import SceneIndex
+from . import instancing
+
 # According to collada spec, order matters
 S_ASSET = 0
 S_IMGS = 1
@@ -54,48 +65,149 @@ S_EXTRA = 14
 # FP32 epsilon https://en.wikipedia.org/wiki/Machine_epsilon
 CMP_EPSILON = 2 ** -23
 
+def memory_usage():
+    """Current resident memory of this (Blender) process in bytes, or None
+    when the platform doesn't tell. Where only the peak is known (macOS and
+    other POSIX systems without /proc), that is returned instead: growth
+    then only counts memory beyond any earlier peak of the process."""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD),
+                            ("PageFaultCount", wintypes.DWORD),
+                            ("PeakWorkingSetSize", ctypes.c_size_t),
+                            ("WorkingSetSize", ctypes.c_size_t),
+                            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                            ("PagefileUsage", ctypes.c_size_t),
+                            ("PeakPagefileUsage", ctypes.c_size_t)]
+
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            if not ctypes.windll.psapi.GetProcessMemoryInfo(
+                    process, ctypes.byref(counters), counters.cb):
+                return None
+            return counters.WorkingSetSize
+
+        if os.path.exists("/proc/self/statm"):
+            # Linux: size and resident pages
+            with open("/proc/self/statm", "r") as f:
+                resident = int(f.read().split()[1])
+            return resident * os.sysconf("SC_PAGE_SIZE")
+
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Bytes on macOS, kilobytes elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
+    except Exception:
+        return None
+
+
+class MemorySampler:
+    """Highest resident memory seen at the sample points of one export,
+    relative to its start. The process-wide peak would include anything
+    Blender did before the export."""
+
+    __slots__ = ("start", "peak")
+
+    def __init__(self):
+        self.start = memory_usage()
+        self.peak = self.start
+
+    def sample(self):
+        if self.start is None:
+            return
+        current = memory_usage()
+        if current is not None and current > self.peak:
+            self.peak = current
+
+    @property
+    def growth(self):
+        if self.start is None:
+            return None
+        return self.peak - self.start
+
+
+def transform_points(values, matrix):
+    """Flat xyz coordinates transformed by a 4x4 matrix."""
+    points = []
+    for i in range(0, len(values), 3):
+        points.extend(matrix @ Vector(values[i:i + 3]))
+    return points
+
+
+DOCUMENT_HEADER = (
+    "<?xml version=\"1.0\" encoding=\"utf-8\"?>\n"
+    "<COLLADA xmlns=\"http://www.collada.org/2005/11/COLLADASchema\" "
+    "version=\"1.4.1\">\n").encode("utf-8")
+DOCUMENT_FOOTER = "</COLLADA>\n".encode("utf-8")
+
+# Written instead of the export time when timestamps are disabled, and used
+# for the document fingerprint
+NO_TIMESTAMP = "1970-01-01T00:00:00Z"
 
-def snap_tup(tup):
-    ret = ()
-    for x in tup:
-        ret += (x - math.fmod(x, 0.0001), )
+# Meshes evaluated at once in low memory mode, see evaluate_pending_meshes
+BOUNDED_EVALUATION_CHUNK = 8
 
-    return tup
 
+# Sections are kept in memory up to this size, then spill to a temp file
+SECTION_SPOOL_SIZE = 16 * 1024 * 1024
+COPY_BLOCK_SIZE = 1024 * 1024
 
-def strmtx(mtx):
-    s = ""
-    for x in range(4):
-        for y in range(4):
-            s += "{} ".format(mtx[x][y])
-    s = " {} ".format(s)
-    return s
 
+class DaeSection:
+    """Encoded lines of one document section, buffered in a spooled
+    temporary file so large documents don't have to live in memory."""
 
-def numarr(a, mult=1.0):
-    s = " "
-    for x in a:
-        s += " {}".format(x * mult)
-    s += " "
-    return s
+    __slots__ = ("buffer", "line_count", "head")
 
+    def __init__(self):
+        self.buffer = tempfile.SpooledTemporaryFile(max_size=SECTION_SPOOL_SIZE)
+        self.line_count = 0
+        # First lines, enough to tell whether the section is an empty node
+        self.head = []
 
-def numarr_alpha(a, mult=1.0):
-    s = " "
-    for x in a:
-        s += " {}".format(x * mult)
-    if len(a) == 3:
-        s += " 1.0"
-    s += " "
-    return s
+    def write_line(self, line):
+        if self.line_count < 2:
+            self.head.append(line)
+        self.line_count += 1
+        self.buffer.write((line + "\n").encode("utf-8"))
 
+    def append_section(self, other):
+        for line in other.head[:2 - self.line_count]:
+            self.head.append(line)
+        self.line_count += other.line_count
+        other.copy_to(self.buffer)
 
-def strarr(arr):
-    s = " "
-    for x in arr:
-        s += " {}".format(x)
-    s += " "
-    return s
+    def size(self):
+        return self.buffer.tell()
+
+    def is_empty_node(self):
+        return (self.line_count == 2 and
+                self.head[0][1:] == self.head[1][2:])
+
+    def copy_to(self, f):
+        self.buffer.seek(0)
+        shutil.copyfileobj(self.buffer, f, COPY_BLOCK_SIZE)
+        self.buffer.seek(0, os.SEEK_END)
+
+    def update_digest(self, digest):
+        self.buffer.seek(0)
+        while True:
+            block = self.buffer.read(COPY_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+        self.buffer.seek(0, os.SEEK_END)
+
+    def close(self):
+        self.buffer.close()
 
 
 class DaeExporter:
@@ -114,15 +226,6 @@ class DaeExporter:
 
     class Vertex:
 
-        def close_to(self, v):
-            if (self.vertex - v.vertex).length > CMP_EPSILON:
-                return False
-            for a, b in zip(self.uv, v.uv):
-                if (a - b).length > CMP_EPSILON:
-                    return False
-
-            return True
-
         __slots__ = ("vertex", "normal", "tangent", "bitangent", "color", "uv", "bones", "weights")
 
         def __init__(self):
@@ -135,110 +238,284 @@ class DaeExporter:
             self.bones = []
             self.weights = []
 
+        def weld_key(self):
+            # Same quantization as mesh_buffers.quantize
+            values = list(self.vertex) + list(self.normal)
+            if self.tangent is not None:
+                values += list(self.tangent) + list(self.bitangent)
+            for uv in self.uv:
+                values += list(uv)
+            if self.color is not None:
+                values += list(self.color)[:3]
+            values += self.weights
+            return tuple(round(x / CMP_EPSILON) for x in values) + tuple(self.bones)
+
+    def floats(self, values, kind):
+        """Serialize floats with the precision configured for kind
+        (see serializer.PRECISION_OPTIONS)."""
+        return serializer.floats(
+            values, self.float_formats.get(kind), self.float_stats)
+
+    def matrix(self, mtx):
+        return serializer.matrix(
+            mtx, self.float_formats["matrix"], self.float_stats)
+
+    def matrices(self, mtxs):
+        return serializer.matrices(
+            mtxs, self.float_formats["matrix"], self.float_stats)
+
     def writel(self, section, indent, text):
-        if (not (section in self.sections)):
-            self.sections[section] = []
         line = "{}{}".format(indent * "\t", text)
-        self.sections[section].append(line)
+        # Mesh fragments are built as lists of lines, see build_mesh_fragment
+        if self.capture is not None and section in self.capture:
+            self.capture[section].append(line)
+            return
+        if (not (section in self.sections)):
+            self.sections[section] = DaeSection()
+        self.sections[section].write_line(line)
+
+    def section_size(self, section):
+        """Bytes written to a section so far"""
+        if section not in self.sections:
+            return 0
+        return self.sections[section].size()
 
     def purge_empty_nodes(self):
         sections = {}
         for k, v in self.sections.items():
-            if not (len(v) == 2 and v[0][1:] == v[1][2:]):
+            if v.is_empty_node():
+                v.close()
+            else:
                 sections[k] = v
         self.sections = sections
 
-    def export_mesh(self, node, armature=None, skel_source=None, custom_name=None):
-        mesh = node.data
-        
-        if (node.data in self.mesh_cache):
-            return self.mesh_cache[mesh]
+    def vertex_skin_weights(self, node, mv, si):
+        bones = []
+        weights = []
+        wsum = 0.0
 
-        armature_modifier = None
-        armature_poses = None
-        armature_modifier_state = None
-        
-        if(self.config["use_exclude_armature_modifier"]):
-            armature_modifiers = [i for i in node.modifiers if i.type == "ARMATURE"]
-            if len(armature_modifiers) > 0:
-                armature_modifier = armature_modifiers[0]#node.modifiers.get("Armature")
-
-        # Set armature in rest pose
-        if(armature_modifier):  
-            # the armature modifier must be disabled too
-            armature_modifier_state = armature_modifier.show_viewport
-            armature_modifier.show_viewport = False         
-            #doing this per object is inefficient, should be improved, maybe?
-            armature_poses = [arm.pose_position for arm in bpy.data.armatures]
-            for arm in bpy.data.armatures:
-                arm.pose_position = "REST"
+        for vg in mv.groups:
+            if vg.group >= len(node.vertex_groups):
+                continue
+            name = node.vertex_groups[vg.group].name
+
+            if (name in si["bone_index"]):
+                # TODO: Try using 0.0001 since Blender uses
+                #       zero weight
+                if (vg.weight > 0.001):
+                    bones.append(si["bone_index"][name])
+                    weights.append(vg.weight)
+                    wsum += vg.weight
+        if (wsum == 0.0):
+            self.report_unassigned_weights(node)
+
+            # TODO: Explore how to deal with zero-weight bones,
+            #       which remain local
+            bones.append(0)
+            weights.append(1)
+
+        return bones, weights
+
+    def report_unassigned_weights(self, node):
+        self.unassigned_weights = True
+        if not self.wrongvtx_report:
+            self.operator.report(
+                {"WARNING"},
+                "Mesh for object \"{}\" has unassigned "
+                "weights. This may look wrong in exported "
+                "model.".format(node.name))
+            self.wrongvtx_report = True
+
+    def skin_group_table(self, node, si):
+        """Bone index of every vertex group of node, -1 for non-bone groups"""
+        np = mesh_buffers.np
+        return np.array(
+            [si["bone_index"].get(vg.name, -1) for vg in node.vertex_groups],
+            dtype=np.int64)
+
+    def limit_vertex_weights(self, node, groups, weights):
+        """Limit every vertex to 4 vertex groups and optionally normalize
+        them, with the same results as running vertex_group_limit_total and
+        vertex_group_normalize_all (which locks the active group) on the
+        object. Returns float64 weights, as read from MDeformWeight."""
+        np = mesh_buffers.np
+        group_count = len(node.vertex_groups)
+
+        groups, weights = mesh_buffers.limit_total(
+            groups, weights, group_count, 4)
+
+        if self.config["use_normalize_vert_groups"]:
+            locked = None
+            if any(vg.lock_weight for vg in node.vertex_groups):
+                locked = np.array(
+                    [vg.lock_weight for vg in node.vertex_groups], dtype=bool)
+            active = node.vertex_groups.active_index
+            if 0 <= active < group_count:
+                if locked is None:
+                    locked = np.zeros(group_count, dtype=bool)
+                locked[active] = True
+
+            # Blender refuses to normalize when every group is locked
+            if locked is None or not locked.all():
+                weights = mesh_buffers.normalize_all(
+                    groups, weights, group_count, locked)
+
+        weights = mesh_buffers.quantize_weights(
+            weights.astype(np.float64), self.config["weight_quantization"])
+        return groups, weights
+
+    def read_deform_weights(self, mesh):
+        """Group count of every vertex, and the group indices and weights of
+        all vertices after each other."""
+        counts = []
+        groups = []
+        weights = []
+        for mv in mesh.vertices:
+            vgs = mv.groups
+            counts.append(len(vgs))
+            for vg in vgs:
+                groups.append(vg.group)
+                weights.append(vg.weight)
+        return counts, groups, weights
+
+    def extract_skin_influences(self, node, mesh, si, loop_vertex):
+        """Resolve the deform weights of every mesh vertex once into
+        fixed-width bone/weight arrays (see mesh_buffers.skin_influences)."""
+        np = mesh_buffers.np
+
+        counts, groups, weights = self.read_deform_weights(mesh)
+        groups = mesh_buffers.pad_rows(counts, groups, -1, np.int64)
+        weights = mesh_buffers.pad_rows(counts, weights, 0.0, np.float32)
+        groups, weights = self.limit_vertex_weights(node, groups, weights)
+
+        bones, weights, unassigned = mesh_buffers.skin_influences(
+            self.skin_group_table(node, si), groups, weights, 0.001)
+
+        if unassigned[loop_vertex].any():
+            self.report_unassigned_weights(node)
+
+        return bones, weights
+
+    def extract_mesh_buffers(self, node, mesh, si, has_tangents, has_colors,
+                             loop_triangles=False):
+        """Build the vertex/index buffers of an evaluated mesh with
+        foreach_get and vectorized NumPy operations.
+        With loop_triangles, faces are taken from mesh.loop_triangles
+        (calc_loop_triangles must have been called) instead of polygons."""
+        np = mesh_buffers.np
+
+        vertex_count = len(mesh.vertices)
+        loop_count = len(mesh.loops)
+        polygon_count = len(mesh.polygons)
+
+        co = np.empty(vertex_count * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", co)
+
+        loop_vertex = np.empty(loop_count, dtype=np.int32)
+        mesh.loops.foreach_get("vertex_index", loop_vertex)
+
+        # Face loops in traversal order, and per face material / loop count
+        if loop_triangles:
+            triangle_count = len(mesh.loop_triangles)
+            order = np.empty(triangle_count * 3, dtype=np.int32)
+            mesh.loop_triangles.foreach_get("loops", order)
+            material_index = np.empty(triangle_count, dtype=np.int32)
+            mesh.loop_triangles.foreach_get("material_index", material_index)
+            loop_total = np.full(triangle_count, 3, dtype=np.int32)
+        else:
+            loop_start = np.empty(polygon_count, dtype=np.int32)
+            mesh.polygons.foreach_get("loop_start", loop_start)
+            loop_total = np.empty(polygon_count, dtype=np.int32)
+            mesh.polygons.foreach_get("loop_total", loop_total)
+            material_index = np.empty(polygon_count, dtype=np.int32)
+            mesh.polygons.foreach_get("material_index", material_index)
+            order = mesh_buffers.polygon_loop_order(loop_start, loop_total)
 
-        name_to_use = self.make_name(mesh.name)
-        if (custom_name is not None and custom_name != ""):
-            name_to_use = custom_name
+        loop_vertex = loop_vertex[order]
 
-        mesh = node.to_mesh(preserve_all_data_layers=False, depsgraph=bpy.context.evaluated_depsgraph_get()) 
-        # 2.8 update: warning, Blender does not support anymore the "RENDER" argument to apply modifier
-        # with render state, only current state
-        
-        # Restore armature and modifier state
-        if(armature_modifier):          
-            armature_modifier.show_viewport = armature_modifier_state           
-            for i,arm in enumerate(bpy.data.armatures):
-                arm.pose_position = armature_poses[i]
+        # Every exported attribute per loop, in traversal order
+        attributes = [co.reshape(-1, 3)[loop_vertex]]
 
-        self.temp_meshes.add(mesh)
-        triangulate = self.config["use_triangles"]
-        if (triangulate):
-            bm = bmesh.new()
-            bm.from_mesh(mesh)
-            bmesh.ops.triangulate(bm, faces=bm.faces)
-            bm.to_mesh(mesh)
-            bm.free()
+        normals = np.empty(loop_count * 3, dtype=np.float32)
+        mesh.loops.foreach_get("normal", normals)
+        attributes.append(normals.reshape(-1, 3)[order])
 
-        mesh.update(calc_edges=False, calc_edges_loose=False)
-        vertices = []
-        vertex_map = {}
-        surface_indices = {}
+        if (has_tangents):
+            tangents = np.empty(loop_count * 3, dtype=np.float32)
+            mesh.loops.foreach_get("tangent", tangents)
+            attributes.append(tangents.reshape(-1, 3)[order])
+            bitangents = np.empty(loop_count * 3, dtype=np.float32)
+            mesh.loops.foreach_get("bitangent", bitangents)
+            attributes.append(bitangents.reshape(-1, 3)[order])
+
+        for uv_layer in mesh.uv_layers:
+            uv = np.empty(loop_count * 2, dtype=np.float32)
+            uv_layer.data.foreach_get("uv", uv)
+            attributes.append(uv.reshape(-1, 2)[order])
 
-        si = None
-        if armature is not None:
-            si = self.skeleton_info[armature]
+        if (has_colors):
+            colors = np.empty(loop_count * 4, dtype=np.float32)
+            mesh.vertex_colors[0].data.foreach_get("color", colors)
+            attributes.append(colors.reshape(-1, 4)[order, :3])
 
-        # TODO: Implement automatic tangent detection
-        has_tangents = self.config["use_tangent"]
+        keys = [mesh_buffers.quantize(a, CMP_EPSILON) for a in attributes]
 
-        has_colors = len(mesh.vertex_colors)
+        if si is not None:
+            vertex_bones, vertex_weights = self.extract_skin_influences(
+                node, mesh, si, loop_vertex)
+            keys.append(vertex_bones[loop_vertex])
+            keys.append(mesh_buffers.quantize(
+                vertex_weights[loop_vertex], CMP_EPSILON))
 
-        uv_layer_count = len(mesh.uv_layers)
-        if has_tangents and len(mesh.uv_layers):
-            try:
-                mesh.calc_tangents()
-            except:
-                self.operator.report(
-                    {"WARNING"},
-                    "CalcTangets failed for mesh \"{}\", no tangets will be "
-                    "exported.".format(mesh.name))
-                mesh.calc_normals_split()
-                has_tangents = False
+        loop_to_vertex, source_loops = mesh_buffers.weld_vertices(
+            np.hstack(keys))
 
-        else:
-            mesh.calc_normals_split()
-            has_tangents = False
+        buffers = mesh_buffers.MeshBuffers()
+        buffers.vertex_count = len(source_loops)
+
+        attributes = [a[source_loops].reshape(-1) for a in attributes]
+        buffers.positions = attributes.pop(0)
+        buffers.normals = attributes.pop(0)
+        if (has_tangents):
+            buffers.tangents = attributes.pop(0)
+            buffers.bitangents = attributes.pop(0)
+        buffers.uvs = [attributes.pop(0) for uv_layer in mesh.uv_layers]
+        if (has_colors):
+            buffers.colors = attributes.pop(0)
 
-        vertices = [None for v in mesh.vertices]
+        if si is not None:
+            source_vertices = loop_vertex[source_loops]
+            (buffers.weight_counts, buffers.bones,
+             buffers.weights) = mesh_buffers.flatten_influences(
+                vertex_bones[source_vertices], vertex_weights[source_vertices])
 
-        for fi in range(len(mesh.polygons)):
-            f = mesh.polygons[fi]
+        buffers.surfaces = mesh_buffers.build_surfaces(
+            loop_to_vertex, material_index, loop_total)
 
+        return buffers
+
+    def extract_mesh_buffers_legacy(self, node, mesh, si, has_tangents, has_colors,
+                                    loop_triangles=False):
+        """Per-loop fallback of extract_mesh_buffers for when NumPy is
+        unavailable."""
+        surface_indices = {}
+        vertices = []
+        vertex_map = {}
+
+        faces = mesh.loop_triangles if loop_triangles else mesh.polygons
+        for f in faces:
             if not (f.material_index in surface_indices):
                 surface_indices[f.material_index] = []
 
             indices = surface_indices[f.material_index]
             vi = []
 
-            for lt in range(f.loop_total):
-                loop_index = f.loop_start + lt
+            if loop_triangles:
+                face_loops = f.loops
+            else:
+                face_loops = range(f.loop_start, f.loop_start + f.loop_total)
+
+            for loop_index in face_loops:
                 ml = mesh.loops[loop_index]
                 mv = mesh.vertices[ml.vertex_index]
 
@@ -258,66 +535,69 @@ class DaeExporter:
                     v.tangent = Vector(ml.tangent)
                     v.bitangent = Vector(ml.bitangent)
 
-                if armature is not None:
-                    wsum = 0.0
+                if si is not None:
+                    v.bones, v.weights = self.vertex_skin_weights(node, mv, si)
 
-                    for vg in mv.groups:
-                        if vg.group >= len(node.vertex_groups):
-                            continue
-                        name = node.vertex_groups[vg.group].name
-
-                        if (name in si["bone_index"]):
-                            # TODO: Try using 0.0001 since Blender uses
-                            #       zero weight
-                            if (vg.weight > 0.001):
-                                v.bones.append(si["bone_index"][name])
-                                v.weights.append(vg.weight)
-                                wsum += vg.weight
-                    if (wsum == 0.0):
-                        if not self.wrongvtx_report:
-                            self.operator.report(
-                                {"WARNING"},
-                                "Mesh for object \"{}\" has unassigned "
-                                "weights. This may look wrong in exported "
-                                "model.".format(node.name))
-                            self.wrongvtx_report = True
-
-                        # TODO: Explore how to deal with zero-weight bones,
-                        #       which remain local
-                        v.bones.append(0)
-                        v.weights.append(1)
-
-                if vertices[ml.vertex_index] is None or vertices[ml.vertex_index].close_to(v):
-                    vi.append(ml.vertex_index)
-                    vertices[ml.vertex_index] = v
+                key = v.weld_key()
+                if key in vertex_map:
+                    # The last loop merged into a vertex defines it, like
+                    # weld_vertices
+                    vertices[vertex_map[key]] = v
+                    vi.append(vertex_map[key])
                 else:
+                    vertex_map[key] = len(vertices)
                     vi.append(len(vertices))
                     vertices.append(v)
 
             if (len(vi) > 2):  # Only triangles and above
                 indices.append(vi)
 
-        meshid = self.new_id("mesh")
+        buffers = mesh_buffers.MeshBuffers()
+        buffers.vertex_count = len(vertices)
+        buffers.positions = [x for v in vertices for x in v.vertex]
+        buffers.normals = [x for v in vertices for x in v.normal]
+        if (has_tangents):
+            buffers.tangents = [x for v in vertices for x in v.tangent]
+            buffers.bitangents = [x for v in vertices for x in v.bitangent]
+        buffers.uvs = [[x for v in vertices for x in v.uv[uvi]]
+                       for uvi in range(len(mesh.uv_layers))]
+        if (has_colors):
+            buffers.colors = [x for v in vertices for x in v.color[:3]]
+        if si is not None:
+            buffers.weight_counts = [len(v.weights) for v in vertices]
+            buffers.bones = [b for v in vertices for b in v.bones]
+            buffers.weights = [w for v in vertices for w in v.weights]
+
+        for material_index, polygons in surface_indices.items():
+            buffers.surfaces.append((
+                material_index,
+                [i for p in polygons for i in p],
+                [len(p) for p in polygons]))
+
+        return buffers
+
+    def export_geometry(self, name, buffers, has_tangents, has_colors,
+                        uv_layer_count, triangulate, extra_lines):
+        """Write the <geometry> of extracted mesh buffers, with
+        mesh_fragments.MESH_ID as id."""
+        meshid = mesh_fragments.MESH_ID
         self.writel(
             S_GEOM, 1, "<geometry id=\"{}\" name=\"{}\">".format(
-                meshid, name_to_use))
+                meshid, name))
 
         self.writel(S_GEOM, 2, "<mesh>")
 
         # Vertex Array
         self.writel(S_GEOM, 3, "<source id=\"{}-positions\">".format(meshid))
-        float_values = ""
-        for v in vertices:
-            float_values += " {} {} {}".format(
-                v.vertex.x, v.vertex.y, v.vertex.z)
+        float_values = self.floats(buffers.positions, "position")
         self.writel(
             S_GEOM, 4, "<float_array id=\"{}-positions-array\" "
             "count=\"{}\">{}</float_array>".format(
-                meshid, len(vertices) * 3, float_values))
+                meshid, buffers.vertex_count * 3, float_values))
         self.writel(S_GEOM, 4, "<technique_common>")
         self.writel(
             S_GEOM, 4, "<accessor source=\"#{}-positions-array\" "
-            "count=\"{}\" stride=\"3\">".format(meshid, len(vertices)))
+            "count=\"{}\" stride=\"3\">".format(meshid, buffers.vertex_count))
         self.writel(S_GEOM, 5, "<param name=\"X\" type=\"float\"/>")
         self.writel(S_GEOM, 5, "<param name=\"Y\" type=\"float\"/>")
         self.writel(S_GEOM, 5, "<param name=\"Z\" type=\"float\"/>")
@@ -327,18 +607,15 @@ class DaeExporter:
 
         # Normals Array
         self.writel(S_GEOM, 3, "<source id=\"{}-normals\">".format(meshid))
-        float_values = ""
-        for v in vertices:
-            float_values += " {} {} {}".format(
-                v.normal.x, v.normal.y, v.normal.z)
+        float_values = self.floats(buffers.normals, "normal")
         self.writel(
             S_GEOM, 4, "<float_array id=\"{}-normals-array\" "
             "count=\"{}\">{}</float_array>".format(
-                meshid, len(vertices) * 3, float_values))
+                meshid, buffers.vertex_count * 3, float_values))
         self.writel(S_GEOM, 4, "<technique_common>")
         self.writel(
             S_GEOM, 4, "<accessor source=\"#{}-normals-array\" count=\"{}\" "
-            "stride=\"3\">".format(meshid, len(vertices)))
+            "stride=\"3\">".format(meshid, buffers.vertex_count))
         self.writel(S_GEOM, 5, "<param name=\"X\" type=\"float\"/>")
         self.writel(S_GEOM, 5, "<param name=\"Y\" type=\"float\"/>")
         self.writel(S_GEOM, 5, "<param name=\"Z\" type=\"float\"/>")
@@ -350,18 +627,15 @@ class DaeExporter:
             # Tangents
             self.writel(
                 S_GEOM, 3, "<source id=\"{}-tangents\">".format(meshid))
-            float_values = ""
-            for v in vertices:
-                float_values += " {} {} {}".format(
-                    v.tangent.x, v.tangent.y, v.tangent.z)
+            float_values = self.floats(buffers.tangents, "normal")
             self.writel(
                 S_GEOM, 4, "<float_array id=\"{}-tangents-array\" "
                 "count=\"{}\">{}</float_array>".format(
-                    meshid, len(vertices) * 3, float_values))
+                    meshid, buffers.vertex_count * 3, float_values))
             self.writel(S_GEOM, 4, "<technique_common>")
             self.writel(
                 S_GEOM, 4, "<accessor source=\"#{}-tangents-array\" "
-                "count=\"{}\" stride=\"3\">".format(meshid, len(vertices)))
+                "count=\"{}\" stride=\"3\">".format(meshid, buffers.vertex_count))
             self.writel(S_GEOM, 5, "<param name=\"X\" type=\"float\"/>")
             self.writel(S_GEOM, 5, "<param name=\"Y\" type=\"float\"/>")
             self.writel(S_GEOM, 5, "<param name=\"Z\" type=\"float\"/>")
@@ -372,18 +646,15 @@ class DaeExporter:
             # Bitangents
             self.writel(S_GEOM, 3, "<source id=\"{}-bitangents\">".format(
                 meshid))
-            float_values = ""
-            for v in vertices:
-                float_values += " {} {} {}".format(
-                    v.bitangent.x, v.bitangent.y, v.bitangent.z)
+            float_values = self.floats(buffers.bitangents, "normal")
             self.writel(
                 S_GEOM, 4, "<float_array id=\"{}-bitangents-array\" "
                 "count=\"{}\">{}</float_array>".format(
-                    meshid, len(vertices) * 3, float_values))
+                    meshid, buffers.vertex_count * 3, float_values))
             self.writel(S_GEOM, 4, "<technique_common>")
             self.writel(
                 S_GEOM, 4, "<accessor source=\"#{}-bitangents-array\" "
-                "count=\"{}\" stride=\"3\">".format(meshid, len(vertices)))
+                "count=\"{}\" stride=\"3\">".format(meshid, buffers.vertex_count))
             self.writel(S_GEOM, 5, "<param name=\"X\" type=\"float\"/>")
             self.writel(S_GEOM, 5, "<param name=\"Y\" type=\"float\"/>")
             self.writel(S_GEOM, 5, "<param name=\"Z\" type=\"float\"/>")
@@ -395,23 +666,17 @@ class DaeExporter:
         for uvi in range(uv_layer_count):
             self.writel(S_GEOM, 3, "<source id=\"{}-texcoord-{}\">".format(
                 meshid, uvi))
-            float_values = ""
-            for v in vertices:
-                try:
-                    float_values += " {} {}".format(v.uv[uvi].x, v.uv[uvi].y)
-                except:
-                    # TODO: Review, understand better the multi-uv-layer API
-                    float_values += " 0 0 "
+            float_values = self.floats(buffers.uvs[uvi], "uv")
 
             self.writel(
                 S_GEOM, 4, "<float_array id=\"{}-texcoord-{}-array\" "
                 "count=\"{}\">{}</float_array>".format(
-                    meshid, uvi, len(vertices) * 2, float_values))
+                    meshid, uvi, buffers.vertex_count * 2, float_values))
             self.writel(S_GEOM, 4, "<technique_common>")
             self.writel(
                 S_GEOM, 4, "<accessor source=\"#{}-texcoord-{}-array\" "
                 "count=\"{}\" stride=\"2\">".format(
-                    meshid, uvi, len(vertices)))
+                    meshid, uvi, buffers.vertex_count))
             self.writel(S_GEOM, 5, "<param name=\"S\" type=\"float\"/>")
             self.writel(S_GEOM, 5, "<param name=\"T\" type=\"float\"/>")
             self.writel(S_GEOM, 4, "</accessor>")
@@ -421,18 +686,15 @@ class DaeExporter:
         # Color Arrays
         if (has_colors):
             self.writel(S_GEOM, 3, "<source id=\"{}-colors\">".format(meshid))
-            float_values = ""
-            for v in vertices:
-                float_values += " {} {} {}".format(
-                    v.color.x, v.color.y, v.color.z)
+            float_values = self.floats(buffers.colors, "color")
             self.writel(
                 S_GEOM, 4, "<float_array id=\"{}-colors-array\" "
                 "count=\"{}\">{}</float_array>".format(
-                    meshid, len(vertices) * 3, float_values))
+                    meshid, buffers.vertex_count * 3, float_values))
             self.writel(S_GEOM, 4, "<technique_common>")
             self.writel(
                 S_GEOM, 4, "<accessor source=\"#{}-colors-array\" "
-                "count=\"{}\" stride=\"3\">".format(meshid, len(vertices)))
+                "count=\"{}\" stride=\"3\">".format(meshid, buffers.vertex_count))
             self.writel(S_GEOM, 5, "<param name=\"X\" type=\"float\"/>")
             self.writel(S_GEOM, 5, "<param name=\"Y\" type=\"float\"/>")
             self.writel(S_GEOM, 5, "<param name=\"Z\" type=\"float\"/>")
@@ -454,11 +716,9 @@ class DaeExporter:
         else:
             prim_type = "polygons"
 
-        for m in surface_indices:
-            indices = surface_indices[m]
-
+        for material_index, indices, counts in buffers.surfaces:
             self.writel(S_GEOM, 3, "<{} count=\"{}\">".format(
-                prim_type, int(len(indices))))
+                prim_type, int(len(counts))))
 
             self.writel(
                 S_GEOM, 4, "<input semantic=\"VERTEX\" "
@@ -486,26 +746,32 @@ class DaeExporter:
                     "source=\"#{}-bitangents\" offset=\"0\"/>".format(meshid))
 
             if (triangulate):
-                int_values = "<p>"
-                for p in indices:
-                    for i in p:
-                        int_values += " {}".format(i)
-                int_values += " </p>"
-                self.writel(S_GEOM, 4, int_values)
+                self.writel(S_GEOM, 4, "<p>{}</p>".format(
+                    serializer.ints(indices)))
             else:
-                for p in indices:
-                    int_values = "<p>"
-                    for i in p:
-                        int_values += " {}".format(i)
-                    int_values += " </p>"
-                    self.writel(S_GEOM, 4, int_values)
+                if hasattr(indices, "tolist"):
+                    indices = indices.tolist()
+                start = 0
+                for count in counts:
+                    self.writel(S_GEOM, 4, "<p>{}</p>".format(
+                        serializer.ints(indices[start:start + count])))
+                    start += count
 
             self.writel(S_GEOM, 3, "</{}>".format(prim_type))
 
         # LSLib model type / extra data
+        for indent, text in extra_lines:
+            self.writel(S_GEOM, indent, text)
+
+        self.writel(S_GEOM, 2, "</mesh>")
+        self.writel(S_GEOM, 1, "</geometry>")
+
+    def geometry_extra_lines(self, node):
+        """LSLib model type / extra data of a geometry, as (indent, text)"""
+        lines = []
         if self.config["extra_data_disabled"] == False:
-            self.writel(S_GEOM, 3, "<extra>")
-            self.writel(S_GEOM, 4, "<technique profile=\"LSTools\">")
+            lines.append((3, "<extra>"))
+            lines.append((4, "<technique profile=\"LSTools\">"))
             
             obj_check = bpy.data.objects[node.name]
 
@@ -513,167 +779,422 @@ class DaeExporter:
 
             ls_props = obj_check.data.ls_properties
             if ls_props.rigid or extra_settings == "RIGID":
-                self.writel(S_GEOM, 5, "<DivModelType>Rigid</DivModelType>")
+                lines.append((5, "<DivModelType>Rigid</DivModelType>"))
             if ls_props.cloth or extra_settings == "CLOTH":
-                self.writel(S_GEOM, 5, "<DivModelType>Cloth</DivModelType>")
+                lines.append((5, "<DivModelType>Cloth</DivModelType>"))
             if ls_props.mesh_proxy or extra_settings == "MESHPROXY":
-                self.writel(S_GEOM, 5, "<DivModelType>MeshProxy</DivModelType>")
+                lines.append((5, "<DivModelType>MeshProxy</DivModelType>"))
             if ls_props.proxy:
-                self.writel(S_GEOM, 5, "<DivModelType>ProxyGeometry</DivModelType>")
+                lines.append((5, "<DivModelType>ProxyGeometry</DivModelType>"))
             if ls_props.spring:
-                self.writel(S_GEOM, 5, "<DivModelType>Spring</DivModelType>")
+                lines.append((5, "<DivModelType>Spring</DivModelType>"))
             if ls_props.occluder:
-                self.writel(S_GEOM, 5, "<DivModelType>Occluder</DivModelType>")
+                lines.append((5, "<DivModelType>Occluder</DivModelType>"))
             if ls_props.cloth_physics:
-                self.writel(S_GEOM, 5, "<DivModelType>ClothPhysics</DivModelType>")
+                lines.append((5, "<DivModelType>ClothPhysics</DivModelType>"))
             if ls_props.cloth_flag1:
-                self.writel(S_GEOM, 5, "<DivModelType>Cloth01</DivModelType>")
+                lines.append((5, "<DivModelType>Cloth01</DivModelType>"))
             if ls_props.cloth_flag2:
-                self.writel(S_GEOM, 5, "<DivModelType>Cloth02</DivModelType>")
+                lines.append((5, "<DivModelType>Cloth02</DivModelType>"))
             if ls_props.cloth_flag4:
-                self.writel(S_GEOM, 5, "<DivModelType>Cloth04</DivModelType>")
+                lines.append((5, "<DivModelType>Cloth04</DivModelType>"))
             if ls_props.impostor:
-                self.writel(S_GEOM, 5, "<IsImpostor>1</IsImpostor>")
+                lines.append((5, "<IsImpostor>1</IsImpostor>"))
 
             if ls_props.export_order != 0:
-                self.writel(S_GEOM, 5, "<ExportOrder>" + str(ls_props.export_order - 1) + "</ExportOrder>")
+                lines.append((5, "<ExportOrder>" + str(ls_props.export_order - 1) + "</ExportOrder>"))
 
             if ls_props.lod != 0:
-                self.writel(S_GEOM, 5, "<LOD>" + str(ls_props.lod) + "</LOD>")
+                lines.append((5, "<LOD>" + str(ls_props.lod) + "</LOD>"))
 
             if ls_props.lod_distance != 0:
-                self.writel(S_GEOM, 5, "<LODDistance>" + str(ls_props.lod_distance) + "</LODDistance>")
-
-            self.writel(S_GEOM, 4, "</technique>")
-            self.writel(S_GEOM, 3, "</extra>")
-
-        self.writel(S_GEOM, 2, "</mesh>")
-        self.writel(S_GEOM, 1, "</geometry>")
+                lines.append((5, "<LODDistance>" + str(ls_props.lod_distance) + "</LODDistance>"))
+
+            lines.append((4, "</technique>"))
+            lines.append((3, "</extra>"))
+
+        return lines
+
+    def bind_shape_matrix(self, node, si):
+        if node.parent is not None and si["name"] == node.parent.name:
+            return self.local_matrix(node)
+        return self.world_matrix(node)
+
+    def mesh_fragment_key(self, node, mesh, si, skel_source, name):
+        """Hash of an evaluated mesh and of everything else its fragment
+        depends on: export settings, extra data, transforms and skeleton.
+        The raw mesh attributes are hashed rather than the extracted buffers,
+        so a hit skips calc_tangents and the extraction; on a miss, they are
+        read twice."""
+        np = mesh_buffers.np
+        key = mesh_fragments.KeyBuilder()
+
+        key.add(
+            name, self.config["use_tangent"], self.config["use_triangles"],
+            self.config["use_normalize_vert_groups"],
+            self.config["weight_quantization"],
+            sorted(self.float_formats.items()),
+            self.geometry_extra_lines(node),
+            [slot.material.name if slot.material else ""
+             for slot in node.material_slots])
+        if self.config["use_depsgraph_export"] and node not in self.instances:
+            key.add_matrix(self.bake_matrices[node])
+
+        def add_attribute(collection, attr, width, dtype=np.float32):
+            values = np.empty(len(collection) * width, dtype=dtype)
+            collection.foreach_get(attr, values)
+            key.add_array(values)
+
+        mesh.calc_normals_split()
+        add_attribute(mesh.vertices, "co", 3)
+        add_attribute(mesh.loops, "vertex_index", 1, np.int32)
+        add_attribute(mesh.loops, "normal", 3)
+        add_attribute(mesh.polygons, "loop_start", 1, np.int32)
+        add_attribute(mesh.polygons, "loop_total", 1, np.int32)
+        add_attribute(mesh.polygons, "material_index", 1, np.int32)
+        key.add(len(mesh.uv_layers), len(mesh.vertex_colors))
+        for uv_layer in mesh.uv_layers:
+            add_attribute(uv_layer.data, "uv", 2)
+        if len(mesh.vertex_colors):
+            add_attribute(mesh.vertex_colors[0].data, "color", 4)
+
+        if si is not None:
+            key.add(
+                skel_source, len(si["bone_names"]),
+                sorted(si["bone_index"].items()),
+                [(vg.name, vg.lock_weight) for vg in node.vertex_groups],
+                node.vertex_groups.active_index)
+            key.add_matrix(self.bind_shape_matrix(node, si))
+            for bind_pose in si["bone_bind_poses"]:
+                key.add_matrix(bind_pose)
+            counts, groups, weights = self.read_deform_weights(mesh)
+            key.add_array(np.array(counts, dtype=np.int32))
+            key.add_array(np.array(groups, dtype=np.int32))
+            key.add_array(np.array(weights, dtype=np.float32))
+
+        return key.hexdigest()
+
+    def build_mesh_fragment(self, node, si, buffers, skel_source, name,
+                            has_tangents, has_colors, uv_layer_count,
+                            triangulate):
+        """Serialize the geometry and skin of extracted mesh buffers."""
+        fragment = mesh_fragments.MeshFragment()
+        fragment.unassigned_weights = self.unassigned_weights
+
+        extra_lines = self.geometry_extra_lines(node)
+
+        # Identical geometry (e.g. duplicated instead of linked meshes) is
+        # written once and referenced by id, see write_mesh_fragment
+        if self.config["use_geometry_dedup"] or self.fragment_cache is not None:
+            fragment.digest = mesh_buffers.buffers_digest(
+                buffers, triangulate, extra_lines,
+                [slot.material.name if slot.material else ""
+                 for slot in node.material_slots]).hex()
+
+        self.capture = {S_GEOM: fragment.geometry, S_SKIN: fragment.skin}
+        try:
+            self.export_geometry(
+                name, buffers, has_tangents, has_colors, uv_layer_count,
+                triangulate, extra_lines)
+            if si is not None:
+                self.export_skin(node, si, buffers, skel_source)
+        finally:
+            self.capture = None
+
+        return fragment
+
+    def cached_fragment(self, key):
+        path = self.fragment_cache.get(key)
+        if path is None:
+            return None
+        return mesh_fragments.load(path)
+
+    def remember_fragment_key(self, node, key):
+        if self.export_record is not None:
+            self.export_record.fragment_keys[self.source_key(node)] = key
+
+    def write_cached_fragment(self, node, key, fragment, si):
+        self.fragment_stats.hits += 1
+        self.remember_fragment_key(node, key)
+        if fragment.unassigned_weights:
+            self.report_unassigned_weights(node)
+        return self.write_mesh_fragment(node, fragment, si)
+
+    def write_mesh_fragment(self, node, fragment, si):
+        """Write a mesh fragment with new ids, returns the mesh data of the
+        node (geometry and controller ids)."""
+        meshid = None
+        if self.config["use_geometry_dedup"] and fragment.digest:
+            meshid = self.geometry_ids.get(fragment.digest)
+
+        if meshid is None:
+            meshid = self.new_id("mesh")
+            geometry_start = self.section_size(S_GEOM)
+            for line in mesh_fragments.fill(
+                    fragment.geometry, {mesh_fragments.MESH_ID: meshid}):
+                self.writel(S_GEOM, 0, line)
+            if self.config["use_geometry_dedup"] and fragment.digest:
+                self.geometry_ids[fragment.digest] = meshid
+                self.geometry_sizes[meshid] = self.section_size(S_GEOM) - geometry_start
+        else:
+            self.dedup_stats.add(0, self.geometry_sizes[meshid])
 
         meshdata = {}
         meshdata["id"] = meshid
-        self.mesh_cache[node.data] = meshdata
+        self.mesh_cache[self.geometry_key(node)] = meshdata
 
         # Export armature data (if armature exists)
-        if armature is not None:
+        if fragment.skin:
             contid = self.new_id("controller")
+            ids = {
+                mesh_fragments.MESH_ID: meshid,
+                mesh_fragments.CONTROLLER_ID: contid,
+                mesh_fragments.SKELETON_ID: si["id"],
+            }
+            for line in mesh_fragments.fill(fragment.skin, ids):
+                self.writel(S_SKIN, 0, line)
+            meshdata["skin_id"] = contid
 
-            self.writel(S_SKIN, 1, "<controller id=\"{}\">".format(contid))
-            if (skel_source is not None):
-                self.writel(S_SKIN, 2, "<skin source=\"#{}\">".format(
-                    skel_source))
-            else:
-                self.writel(S_SKIN, 2, "<skin source=\"#{}\">".format(meshid))
+        return meshdata
 
-            if node.parent is not None and armature.name == node.parent.name:
-                self.writel(
-                    S_SKIN, 3, "<bind_shape_matrix>{}</bind_shape_matrix>".format(
-                        strmtx(node.matrix_local)))
-            else:
-                self.writel(
-                    S_SKIN, 3, "<bind_shape_matrix>{}</bind_shape_matrix>".format(
-                        strmtx(node.matrix_world)))
-                
-            # Joint Names
-            self.writel(S_SKIN, 3, "<source id=\"{}-joints\">".format(contid))
-            name_values = ""
-            for v in si["bone_names"]:
-                name_values += " {}".format(v)
+    def export_mesh(self, node, armature=None, skel_source=None, custom_name=None):
+        mesh = node.data
+        
+        if (self.geometry_key(node) in self.mesh_cache):
+            return self.mesh_cache[self.geometry_key(node)]
 
-            self.writel(
-                S_SKIN, 4, "<Name_array id=\"{}-joints-array\" "
-                "count=\"{}\">{}</Name_array>".format(
-                    contid, len(si["bone_names"]), name_values))
-            self.writel(S_SKIN, 4, "<technique_common>")
-            self.writel(
-                S_SKIN, 4, "<accessor source=\"#{}-joints-array\" "
-                "count=\"{}\" stride=\"1\">".format(
-                    contid, len(si["bone_names"])))
-            self.writel(S_SKIN, 5, "<param name=\"JOINT\" type=\"Name\"/>")
-            self.writel(S_SKIN, 4, "</accessor>")
-            self.writel(S_SKIN, 4, "</technique_common>")
-            self.writel(S_SKIN, 3, "</source>")
-            # Pose Matrices!
-            self.writel(S_SKIN, 3, "<source id=\"{}-bind_poses\">".format(
-                contid))
-            pose_values = ""
-            for v in si["bone_bind_poses"]:
-                pose_values += " {}".format(strmtx(v))
+        name_to_use = self.make_name(mesh.name)
+        if (custom_name is not None and custom_name != ""):
+            name_to_use = custom_name
 
-            self.writel(
-                S_SKIN, 4, "<float_array id=\"{}-bind_poses-array\" "
-                "count=\"{}\">{}</float_array>".format(
-                    contid, len(si["bone_bind_poses"]) * 16, pose_values))
-            self.writel(S_SKIN, 4, "<technique_common>")
-            self.writel(
-                S_SKIN, 4, "<accessor source=\"#{}-bind_poses-array\" "
-                "count=\"{}\" stride=\"16\">".format(
-                    contid, len(si["bone_bind_poses"])))
-            self.writel(
-                S_SKIN, 5, "<param name=\"TRANSFORM\" type=\"float4x4\"/>")
-            self.writel(S_SKIN, 4, "</accessor>")
-            self.writel(S_SKIN, 4, "</technique_common>")
-            self.writel(S_SKIN, 3, "</source>")
-            # Skin Weights!
-            self.writel(S_SKIN, 3, "<source id=\"{}-skin_weights\">".format(
-                contid))
-            skin_weights = ""
-            skin_weights_total = 0
-            for v in vertices:
-                skin_weights_total += len(v.weights)
-                for w in v.weights:
-                    skin_weights += " {}".format(w)
+        si = None
+        if armature is not None:
+            si = self.skeleton_info[armature]
 
-            self.writel(
-                S_SKIN, 4, "<float_array id=\"{}-skin_weights-array\" "
-                "count=\"{}\">{}</float_array>".format(
-                    contid, skin_weights_total, skin_weights))
-            self.writel(S_SKIN, 4, "<technique_common>")
-            self.writel(
-                S_SKIN, 4, "<accessor source=\"#{}-skin_weights-array\" "
-                "count=\"{}\" stride=\"1\">".format(
-                    contid, skin_weights_total))
-            self.writel(S_SKIN, 5, "<param name=\"WEIGHT\" type=\"float\"/>")
-            self.writel(S_SKIN, 4, "</accessor>")
-            self.writel(S_SKIN, 4, "</technique_common>")
-            self.writel(S_SKIN, 3, "</source>")
-
-            self.writel(S_SKIN, 3, "<joints>")
-            self.writel(
-                S_SKIN, 4,
-                "<input semantic=\"JOINT\" source=\"#{}-joints\"/>".format(
-                    contid))
-            self.writel(
-                S_SKIN, 4, "<input semantic=\"INV_BIND_MATRIX\" "
-                "source=\"#{}-bind_poses\"/>".format(contid))
-            self.writel(S_SKIN, 3, "</joints>")
-            self.writel(
-                S_SKIN, 3, "<vertex_weights count=\"{}\">".format(
-                    len(vertices)))
-            self.writel(
-                S_SKIN, 4, "<input semantic=\"JOINT\" "
-                "source=\"#{}-joints\" offset=\"0\"/>".format(contid))
-            self.writel(
-                S_SKIN, 4, "<input semantic=\"WEIGHT\" "
-                "source=\"#{}-skin_weights\" offset=\"1\"/>".format(contid))
-            vcounts = ""
-            vs = ""
-            vcount = 0
-            for v in vertices:
-                vcounts += " {}".format(len(v.weights))
-                for b in v.bones:
-                    vs += " {} {}".format(b, vcount)
-                    vcount += 1
-            self.writel(S_SKIN, 4, "<vcount>{}</vcount>".format(vcounts))
-            self.writel(S_SKIN, 4, "<v>{}</v>".format(vs))
-            self.writel(S_SKIN, 3, "</vertex_weights>")
-
-            self.writel(S_SKIN, 2, "</skin>")
-            self.writel(S_SKIN, 1, "</controller>")
-            meshdata["skin_id"] = contid
+        # Unchanged since the previous export to this file, see
+        # find_reusable_fragments
+        reused_key = self.reused_fragments.get(node)
+        if reused_key is not None:
+            fragment = self.cached_fragment(reused_key)
+            if fragment is not None:
+                return self.write_cached_fragment(node, reused_key, fragment, si)
+            self.evaluate_exported_meshes([node])
+        elif node in self.pending_meshes:
+            self.evaluate_pending_meshes(node)
+
+        # Meshes evaluated up front, see evaluate_meshes
+        mesh = self.evaluated_meshes.pop(node, None)
+        if mesh is None:
+            mesh = node.to_mesh(preserve_all_data_layers=False, depsgraph=bpy.context.evaluated_depsgraph_get())
+        # 2.8 update: warning, Blender does not support anymore the "RENDER" argument to apply modifier
+        # with render state, only current state
+
+        # Evaluated meshes belong to their object until to_mesh_clear
+        if not self.config["use_bounded_memory"]:
+            self.temp_mesh_owners.add(node)
+
+        # Meshes that are unchanged since an earlier export are copied from
+        # the fragment cache
+        fragment_key = None
+        if self.fragment_cache is not None:
+            fragment_key = self.mesh_fragment_key(node, mesh, si, skel_source, name_to_use)
+            fragment = self.cached_fragment(fragment_key)
+            if fragment is not None:
+                if self.config["use_bounded_memory"]:
+                    mesh = None
+                    node.to_mesh_clear()
+                return self.write_cached_fragment(node, fragment_key, fragment, si)
+            self.fragment_stats.misses += 1
+
+        triangulate = self.config["use_triangles"]
+
+        # Triangles are read from loop_triangles, leaving the mesh as is.
+        # calc_tangents only handles tris and quads though, so meshes with
+        # ngons still need a real triangulation when tangents are exported.
+        # Note that loop_triangles splits quads along a fixed diagonal and
+        # ngons by ear clipping, while bmesh.ops.triangulate picks the
+        # "beauty" split: the triangles (and tangents computed on quads) can
+        # differ from exports before loop_triangles were used.
+        use_loop_triangles = triangulate
+        if (triangulate and self.config["use_tangent"] and len(mesh.uv_layers)
+                and any(p.loop_total > 4 for p in mesh.polygons)):
+            use_loop_triangles = False
+            bm = bmesh.new()
+            bm.from_mesh(mesh)
+            bmesh.ops.triangulate(bm, faces=bm.faces)
+            bm.to_mesh(mesh)
+            bm.free()
+
+        mesh.update(calc_edges=False, calc_edges_loose=False)
+
+        # TODO: Implement automatic tangent detection
+        has_tangents = self.config["use_tangent"]
+
+        has_colors = len(mesh.vertex_colors)
+
+        uv_layer_count = len(mesh.uv_layers)
+        if has_tangents and len(mesh.uv_layers):
+            try:
+                mesh.calc_tangents()
+            except:
+                self.operator.report(
+                    {"WARNING"},
+                    "CalcTangets failed for mesh \"{}\", no tangets will be "
+                    "exported.".format(mesh.name))
+                mesh.calc_normals_split()
+                has_tangents = False
+
+        else:
+            mesh.calc_normals_split()
+            has_tangents = False
+
+        if (use_loop_triangles):
+            mesh.calc_loop_triangles()
+
+        self.unassigned_weights = False
+        if mesh_buffers.HAS_NUMPY:
+            buffers = self.extract_mesh_buffers(
+                node, mesh, si, has_tangents, has_colors, use_loop_triangles)
+        else:
+            buffers = self.extract_mesh_buffers_legacy(
+                node, mesh, si, has_tangents, has_colors, use_loop_triangles)
+
+        if self.config["use_depsgraph_export"] and node not in self.instances:
+            mesh_buffers.transform_buffers(buffers, self.bake_matrices[node])
+
+        fragment = self.build_mesh_fragment(
+            node, si, buffers, skel_source, name_to_use, has_tangents,
+            has_colors, uv_layer_count, triangulate)
+        if fragment_key is not None:
+            try:
+                self.fragment_cache.put_bytes(
+                    fragment_key, mesh_fragments.dumps(fragment))
+                self.remember_fragment_key(node, fragment_key)
+            except OSError as e:
+                self.operator.report(
+                    {"WARNING"}, "Could not write mesh \"{}\" to the fragment "
+                    "cache: {}".format(node.name, e))
+
+        meshdata = self.write_mesh_fragment(node, fragment, si)
+        # The evaluated mesh and its buffers are still held here
+        if self.memory is not None:
+            self.memory.sample()
+
+        # Geometry and skin are serialized, nothing refers to the evaluated
+        # mesh or its buffers anymore
+        if self.config["use_bounded_memory"]:
+            buffers = None
+            fragment = None
+            mesh = None
+            node.to_mesh_clear()
 
         return meshdata
 
+    def export_skin(self, node, si, buffers, skel_source=None):
+        """Write the skin <controller> of extracted mesh buffers, with
+        mesh_fragments.CONTROLLER_ID as id, referring to the geometry as
+        mesh_fragments.MESH_ID and to the skeleton as
+        mesh_fragments.SKELETON_ID."""
+        contid = mesh_fragments.CONTROLLER_ID
+        meshid = mesh_fragments.MESH_ID
+        # Same as si["bone_names"], relative to the skeleton id
+        bone_names = ["{}-{}".format(mesh_fragments.SKELETON_ID, i)
+                      for i in range(len(si["bone_names"]))]
+
+        self.writel(S_SKIN, 1, "<controller id=\"{}\">".format(contid))
+        if (skel_source is not None):
+            self.writel(S_SKIN, 2, "<skin source=\"#{}\">".format(
+                skel_source))
+        else:
+            self.writel(S_SKIN, 2, "<skin source=\"#{}\">".format(meshid))
+
+        self.writel(
+            S_SKIN, 3, "<bind_shape_matrix>{}</bind_shape_matrix>".format(
+                self.matrix(self.bind_shape_matrix(node, si))))
+
+        # Joint Names
+        self.writel(S_SKIN, 3, "<source id=\"{}-joints\">".format(contid))
+        name_values = serializer.names(bone_names)
+
+        self.writel(
+            S_SKIN, 4, "<Name_array id=\"{}-joints-array\" "
+            "count=\"{}\">{}</Name_array>".format(
+                contid, len(bone_names), name_values))
+        self.writel(S_SKIN, 4, "<technique_common>")
+        self.writel(
+            S_SKIN, 4, "<accessor source=\"#{}-joints-array\" "
+            "count=\"{}\" stride=\"1\">".format(
+                contid, len(bone_names)))
+        self.writel(S_SKIN, 5, "<param name=\"JOINT\" type=\"Name\"/>")
+        self.writel(S_SKIN, 4, "</accessor>")
+        self.writel(S_SKIN, 4, "</technique_common>")
+        self.writel(S_SKIN, 3, "</source>")
+        # Pose Matrices!
+        self.writel(S_SKIN, 3, "<source id=\"{}-bind_poses\">".format(
+            contid))
+        pose_values = self.matrices(si["bone_bind_poses"])
+
+        self.writel(
+            S_SKIN, 4, "<float_array id=\"{}-bind_poses-array\" "
+            "count=\"{}\">{}</float_array>".format(
+                contid, len(si["bone_bind_poses"]) * 16, pose_values))
+        self.writel(S_SKIN, 4, "<technique_common>")
+        self.writel(
+            S_SKIN, 4, "<accessor source=\"#{}-bind_poses-array\" "
+            "count=\"{}\" stride=\"16\">".format(
+                contid, len(si["bone_bind_poses"])))
+        self.writel(
+            S_SKIN, 5, "<param name=\"TRANSFORM\" type=\"float4x4\"/>")
+        self.writel(S_SKIN, 4, "</accessor>")
+        self.writel(S_SKIN, 4, "</technique_common>")
+        self.writel(S_SKIN, 3, "</source>")
+        # Skin Weights!
+        self.writel(S_SKIN, 3, "<source id=\"{}-skin_weights\">".format(
+            contid))
+        skin_weights = self.floats(buffers.weights, "weight")
+        skin_weights_total = len(buffers.weights)
+
+        self.writel(
+            S_SKIN, 4, "<float_array id=\"{}-skin_weights-array\" "
+            "count=\"{}\">{}</float_array>".format(
+                contid, skin_weights_total, skin_weights))
+        self.writel(S_SKIN, 4, "<technique_common>")
+        self.writel(
+            S_SKIN, 4, "<accessor source=\"#{}-skin_weights-array\" "
+            "count=\"{}\" stride=\"1\">".format(
+                contid, skin_weights_total))
+        self.writel(S_SKIN, 5, "<param name=\"WEIGHT\" type=\"float\"/>")
+        self.writel(S_SKIN, 4, "</accessor>")
+        self.writel(S_SKIN, 4, "</technique_common>")
+        self.writel(S_SKIN, 3, "</source>")
+
+        self.writel(S_SKIN, 3, "<joints>")
+        self.writel(
+            S_SKIN, 4,
+            "<input semantic=\"JOINT\" source=\"#{}-joints\"/>".format(
+                contid))
+        self.writel(
+            S_SKIN, 4, "<input semantic=\"INV_BIND_MATRIX\" "
+            "source=\"#{}-bind_poses\"/>".format(contid))
+        self.writel(S_SKIN, 3, "</joints>")
+        self.writel(
+            S_SKIN, 3, "<vertex_weights count=\"{}\">".format(
+                buffers.vertex_count))
+        self.writel(
+            S_SKIN, 4, "<input semantic=\"JOINT\" "
+            "source=\"#{}-joints\" offset=\"0\"/>".format(contid))
+        self.writel(
+            S_SKIN, 4, "<input semantic=\"WEIGHT\" "
+            "source=\"#{}-skin_weights\" offset=\"1\"/>".format(contid))
+        vcounts = serializer.ints(buffers.weight_counts)
+        vs = serializer.ints(mesh_buffers.joint_weight_pairs(buffers.bones))
+        self.writel(S_SKIN, 4, "<vcount>{}</vcount>".format(vcounts))
+        self.writel(S_SKIN, 4, "<v>{}</v>".format(vs))
+        self.writel(S_SKIN, 3, "</vertex_weights>")
+
+        self.writel(S_SKIN, 2, "</skin>")
+        self.writel(S_SKIN, 1, "</controller>")
+
     def export_mesh_node(self, node, il):
         if (node.data is None):
             return
@@ -685,9 +1206,10 @@ class DaeExporter:
                 if n.object:# make sure the armature modifier is not null
                     armcount += 1
 
-        if (node.parent is not None):
-            if (node.parent.type == "ARMATURE"):
-                armature = node.parent
+        parent = self.parent_of(node)
+        if (parent is not None):
+            if (parent.type == "ARMATURE"):
+                armature = parent
                 if (armcount > 1):
                     self.operator.report(
                         {"WARNING"}, "Object \"{}\" refers "
@@ -763,20 +1285,20 @@ class DaeExporter:
         if (is_ctrl_bone is False):
             il += 1
 
-        xform = bone.matrix_local
+        xform = si["rest_matrices"][bone.name]
         if (is_ctrl_bone is False):
             si["bone_bind_poses"].append(
                     (si["armature_xform"] @ xform).inverted_safe())
 
         if (bone.parent is not None):
-            xform = bone.parent.matrix_local.inverted_safe() @ xform
+            xform = si["rest_matrices"][bone.parent.name].inverted_safe() @ xform
         else:
             si["skeleton_nodes"].append(boneid)
 
         if (is_ctrl_bone is False):
             self.writel(
                 S_NODES, il, "<matrix sid=\"transform\">{}</matrix>".format(
-                    strmtx(xform)))
+                    self.matrix(xform)))
 
         for c in bone.children:
             self.export_armature_bone(c, il, si)
@@ -810,7 +1332,9 @@ class DaeExporter:
             "bone_names": [],
             "bone_bind_poses": [],
             "skeleton_nodes": [],
-            "armature_xform": node.matrix_world
+            "armature_xform": self.world_matrix(node),
+            "rest_matrices": self.bone_rest_matrices.get(node) or
+                             self.armature_rest_matrices(node)
         }
 
         for b in armature.bones:
@@ -824,7 +1348,7 @@ class DaeExporter:
                     if (x.type == "ACTION"):
                         self.action_constraints.append(x.action)
 
-    def export_curve(self, curve):
+    def export_curve(self, curve, bake_matrix=None):
         splineid = self.new_id("spline")
 
         self.writel(
@@ -872,10 +1396,13 @@ class DaeExporter:
                     tilts.append(s.tilt)
                     interps.append("LINEAR")
 
+        if bake_matrix is not None:
+            points = transform_points(points, bake_matrix)
+            handles_in = transform_points(handles_in, bake_matrix)
+            handles_out = transform_points(handles_out, bake_matrix)
+
         self.writel(S_GEOM, 3, "<source id=\"{}-positions\">".format(splineid))
-        position_values = ""
-        for x in points:
-            position_values += " {}".format(x)
+        position_values = self.floats(points, "position")
         self.writel(
             S_GEOM, 4, "<float_array id=\"{}-positions-array\" "
             "count=\"{}\">{}</float_array>".format(
@@ -893,9 +1420,7 @@ class DaeExporter:
 
         self.writel(
             S_GEOM, 3, "<source id=\"{}-intangents\">".format(splineid))
-        intangent_values = ""
-        for x in handles_in:
-            intangent_values += " {}".format(x)
+        intangent_values = self.floats(handles_in, "position")
         self.writel(
             S_GEOM, 4, "<float_array id=\"{}-intangents-array\" "
             "count=\"{}\">{}</float_array>".format(
@@ -913,9 +1438,7 @@ class DaeExporter:
 
         self.writel(S_GEOM, 3, "<source id=\"{}-outtangents\">".format(
             splineid))
-        outtangent_values = ""
-        for x in handles_out:
-            outtangent_values += " {}".format(x)
+        outtangent_values = self.floats(handles_out, "position")
         self.writel(
             S_GEOM, 4, "<float_array id=\"{}-outtangents-array\" "
             "count=\"{}\">{}</float_array>".format(
@@ -933,9 +1456,7 @@ class DaeExporter:
 
         self.writel(
             S_GEOM, 3, "<source id=\"{}-interpolations\">".format(splineid))
-        interpolation_values = ""
-        for x in interps:
-            interpolation_values += " {}".format(x)
+        interpolation_values = serializer.names(interps)
         self.writel(
             S_GEOM, 4, "<Name_array id=\"{}-interpolations-array\" "
             "count=\"{}\">{}</Name_array>"
@@ -950,9 +1471,7 @@ class DaeExporter:
         self.writel(S_GEOM, 3, "</source>")
 
         self.writel(S_GEOM, 3, "<source id=\"{}-tilts\">".format(splineid))
-        tilt_values = ""
-        for x in tilts:
-            tilt_values += " {}".format(x)
+        tilt_values = serializer.floats(tilts)
         self.writel(
             S_GEOM, 4,
             "<float_array id=\"{}-tilts-array\" count=\"{}\">{}</float_array>"
@@ -995,7 +1514,7 @@ class DaeExporter:
         if (node.data is None):
             return
 
-        curveid = self.export_curve(node.data)
+        curveid = self.export_curve(node.data, self.bake_matrices.get(node))
 
         self.writel(S_NODES, il, "<instance_geometry url=\"#{}\">".format(
             curveid))
@@ -1015,7 +1534,7 @@ class DaeExporter:
 
         self.writel(
             S_NODES, il, "<matrix sid=\"transform\">{}</matrix>".format(
-                strmtx(node.matrix_local)))
+                self.matrix(self.local_matrix(node))))
         if (node.type == "MESH"):
             self.export_mesh_node(node, il)
         elif (node.type == "CURVE"):
@@ -1023,7 +1542,7 @@ class DaeExporter:
         elif (node.type == "ARMATURE"):
             self.export_armature_node(node, il)
 
-        for x in sorted(node.children, key=lambda x: x.name):
+        for x in self.scene_index.children_of(node):
             self.export_node(x, il)
 
         il -= 1
@@ -1034,77 +1553,300 @@ class DaeExporter:
         if (node.type not in self.config["object_types"]):
             return False
 
+        # use collections instead of layers
         if (self.config["use_active_layers"]):
-            valid = True
-            # use collections instead of layers
-            for col in node.users_collection:
-                if col.hide_viewport == True:
-                    valid = False
-                    break
-                    
-            if (not valid):
+            if (not self.scene_index.in_visible_collections(node)):
                 return False
 
         return True
 
+    def geometry_key(self, node):
+        """Geometry is shared between objects using the same data, unless
+        object transforms are baked into it (which instances never get)."""
+        if self.config["use_depsgraph_export"]:
+            return self.instances.get(node, node)
+        return node.data
+
+    def parent_of(self, node):
+        """Parent of node in the exported hierarchy. Exporting from the
+        depsgraph flattens the hierarchy the same way the copy stage does:
+        meshes stay parented to exported armatures only, other objects to
+        any exported parent."""
+        parent = node.parent
+        if not self.config["use_depsgraph_export"] or parent is None:
+            return parent
+        if parent not in self.exported:
+            return None
+        if node.type == "MESH" and parent.type != "ARMATURE":
+            return None
+        return parent
+
+    def local_matrix(self, node):
+        if self.config["use_depsgraph_export"]:
+            # Instances are never parented, see instancing.instance_key
+            if node in self.instances:
+                return self.bake_matrices[node]
+            return Matrix.Identity(4)
+        return node.matrix_local
+
+    def world_matrix(self, node):
+        if self.config["use_depsgraph_export"]:
+            return Matrix.Identity(4)
+        return node.matrix_world
+
+    def compute_bake_matrices(self):
+        """World transform of every exported object as the copy stage would
+        leave it before applying transforms: flattened parents, and root
+        objects rotated to Y-up in their local space."""
+        yup = Matrix.Rotation(math.radians(-90), 3, "X")
+        for node in self.scene_index.traversal():
+            parent = self.parent_of(node)
+            if parent is not None:
+                self.bake_matrices[node] = (
+                    self.bake_matrices[parent] @
+                    parent.matrix_world.inverted_safe() @ node.matrix_world)
+            elif (self.config["yup_enabled"] == "ROTATE" and
+                    (node.parent is None or node.parent not in self.exported)):
+                loc, rot, scale = node.matrix_world.decompose()
+                self.bake_matrices[node] = Matrix.LocRotScale(
+                    loc, rot.to_matrix() @ yup, scale)
+            else:
+                self.bake_matrices[node] = node.matrix_world.copy()
+
+    def armature_rest_matrices(self, node):
+        """Armature space rest matrix of every bone. When exporting from the
+        depsgraph, the object transform is baked in, and the current pose
+        is used as rest pose where the copy stage would apply it."""
+        if not self.config["use_depsgraph_export"]:
+            return {b.name: b.matrix_local for b in node.data.bones}
+
+        bake_matrix = self.bake_matrices[node]
+        if self.config["use_exclude_armature_modifier"] and node.pose:
+            return {b.name: (bake_matrix @ b.matrix).normalized()
+                    for b in node.pose.bones}
+        return {b.name: (bake_matrix @ b.matrix_local).normalized()
+                for b in node.data.bones}
+
+    def evaluate_meshes(self, nodes, modifiers, rest_pose):
+        """Evaluate the meshes of nodes from a single depsgraph with the
+        given modifiers disabled and, with rest_pose, all armatures in rest
+        pose. Armature and modifier state is changed and restored only once,
+        so the rigs are re-evaluated once for the whole export instead of
+        once per mesh."""
+        if not nodes:
+            return
+
+        modifier_states = [(m, m.show_viewport) for m in modifiers]
+        for modifier in modifiers:
+            modifier.show_viewport = False
+
+        armature_poses = []
+        if rest_pose:
+            armature_poses = [(arm, arm.pose_position) for arm in bpy.data.armatures]
+            for arm in bpy.data.armatures:
+                arm.pose_position = "REST"
+
+        try:
+            depsgraph = bpy.context.evaluated_depsgraph_get()
+            for node in nodes:
+                self.evaluated_meshes[node] = node.to_mesh(
+                    preserve_all_data_layers=False, depsgraph=depsgraph)
+        finally:
+            # Restore armature and modifier state
+            for modifier, state in modifier_states:
+                modifier.show_viewport = state
+            for arm, pose_position in armature_poses:
+                arm.pose_position = pose_position
+
+    def exported_meshes(self):
+        return [node for node in self.scene_index.traversal()
+                if node in self.valid_nodes and node.type == "MESH"
+                and node.data is not None]
+
+    def evaluate_rest_pose_meshes(self, meshes):
+        """Evaluate every mesh that has an armature modifier with the
+        modifier disabled and all armatures in rest pose."""
+        nodes = []
+        modifiers = []
+        for node in meshes:
+            armature_modifiers = [m for m in node.modifiers if m.type == "ARMATURE"]
+            if armature_modifiers:
+                nodes.append(node)
+                # the armature modifier must be disabled too
+                modifiers.append(armature_modifiers[0])
+
+        self.evaluate_meshes(nodes, modifiers, True)
+
+    def evaluate_scene_meshes(self, meshes):
+        """Evaluate meshes with the modifiers the copy stage would have left
+        on their copies, when exporting without copies."""
+        # One evaluation per instanced geometry
+        nodes = []
+        keys = set()
+        for node in meshes:
+            key = self.geometry_key(node)
+            if key not in keys:
+                keys.add(key)
+                nodes.append(node)
+
+        modifiers = []
+        for node in nodes:
+            parent = self.parent_of(node)
+            skinned = parent is not None and parent.type == "ARMATURE"
+            for modifier in node.modifiers:
+                if modifier.type == "ARMATURE":
+                    if self.config["use_exclude_armature_modifier"] or not skinned:
+                        modifiers.append(modifier)
+                elif not self.config["use_mesh_modifiers"]:
+                    modifiers.append(modifier)
+
+        self.evaluate_meshes(
+            nodes, modifiers,
+            self.config["use_exclude_armature_modifier"] or self.config["use_rest_pose"])
+
+    def evaluate_exported_meshes(self, meshes):
+        """Evaluate meshes up front, when the export mode needs them
+        evaluated in a different state than the scene is in."""
+        if (self.config["use_depsgraph_export"]):
+            self.evaluate_scene_meshes(meshes)
+        elif (self.config["use_exclude_armature_modifier"]):
+            self.evaluate_rest_pose_meshes(meshes)
+
+    def evaluate_pending_meshes(self, node):
+        """Evaluate node and the next few meshes waiting for evaluation.
+        Low memory mode evaluates in small chunks as the export goes, so
+        only a few evaluated meshes are held at a time, while the armature
+        and modifier state is still switched once per chunk rather than
+        once per mesh."""
+        del self.pending_meshes[node]
+        chunk = [node]
+        for pending in list(self.pending_meshes):
+            if len(chunk) >= BOUNDED_EVALUATION_CHUNK:
+                break
+            del self.pending_meshes[pending]
+            # Instances of an exported geometry are not evaluated again
+            if self.geometry_key(pending) not in self.mesh_cache:
+                chunk.append(pending)
+        self.evaluate_exported_meshes(chunk)
+
+    def source_of(self, node):
+        """Scene object an exported object was copied from."""
+        return self.export_sources.get(node, node)
+
+    def source_key(self, node):
+        source = self.source_of(node)
+        return (source.name, source.data.name)
+
+    def find_reusable_fragments(self):
+        """Fragment keys of the meshes that didn't change since the previous
+        export to the same file and are still cached, so they don't need to
+        be evaluated again. Without the fragment cache (a preference, off by
+        default), every mesh of a changed export is evaluated again."""
+        previous = self.previous_export
+        if previous is None or self.fragment_cache is None:
+            return
+
+        tracker = change_tracker.tracker
+        for node in self.exported_meshes():
+            key = previous.fragment_keys.get(self.source_key(node))
+            if (key is not None and key in self.fragment_cache.entries and
+                    tracker.is_clean(self.source_of(node), previous.generation)):
+                self.reused_fragments[node] = key
+
     def export_scene(self):
         self.writel(S_NODES, 0, "<library_visual_scenes>")
         self.writel(
             S_NODES, 1, "<visual_scene id=\"{}\" name=\"scene\">".format(
                 self.scene_name))
 
+        self.exported = set(self.objects)
+        self.scene_index = SceneIndex(self.objects, self.parent_of)
+
         for obj in self.objects:
             if (obj in self.valid_nodes):
                 continue
             if (self.is_node_valid(obj)):
                 n = obj
-                while (n is not None):
-                    if (n not in self.valid_nodes):
-                        self.valid_nodes.append(n)
-                    n = n.parent
+                # ancestors of a valid node are already in the set
+                while (n is not None and n not in self.valid_nodes):
+                    self.valid_nodes.add(n)
+                    n = self.parent_of(n)
+
+        if (self.config["use_depsgraph_export"]):
+            if self.config["use_instancing"]:
+                self.instances = instancing.instance_groups(
+                    self.exported_meshes(), self.config["use_mesh_modifiers"])
+            self.compute_bake_matrices()
+            # Read before evaluating, as that puts the armatures in rest pose
+            for node in self.scene_index.traversal():
+                if node in self.valid_nodes and node.type == "ARMATURE" and node.data:
+                    self.bone_rest_matrices[node] = self.armature_rest_matrices(node)
+
+        self.find_reusable_fragments()
+        meshes = [node for node in self.exported_meshes()
+                  if node not in self.reused_fragments]
+        if self.config["use_bounded_memory"]:
+            # In export order, see evaluate_pending_meshes
+            self.pending_meshes = dict.fromkeys(meshes)
+        else:
+            self.evaluate_exported_meshes(meshes)
 
-        for obj in sorted(self.objects, key=lambda x: x.name):
-            if (obj in self.valid_nodes and obj.parent is None):
+        for obj in self.scene_index.roots():
+            if (obj in self.valid_nodes and obj in self.exported):
                 self.export_node(obj, 2)
 
         self.writel(S_NODES, 1, "</visual_scene>")
         self.writel(S_NODES, 0, "</library_visual_scenes>")
 
-    def export_asset(self):
-        self.writel(S_ASSET, 0, "<asset>")
-        self.writel(S_ASSET, 1, "<contributor>")
-        self.writel(S_ASSET, 2, "<author></author>")
-        self.writel(
-            S_ASSET, 2, "<authoring_tool>Collada Exporter for Blender 2.6+, "
-            "by Juan Linietsky (juan@codenix.com)</authoring_tool>")
-        self.writel(S_ASSET, 1, "</contributor>")
-        self.writel(S_ASSET, 1, "<created>{}</created>".format(
-            time.strftime("%Y-%m-%dT%H:%M:%SZ")))
-        self.writel(S_ASSET, 1, "<modified>{}</modified>".format(
-            time.strftime("%Y-%m-%dT%H:%M:%SZ")))
-        self.writel(S_ASSET, 1, "<unit meter=\"1.0\" name=\"meter\"/>")
+    def asset_lines(self, timestamp):
+        """The <asset> element as (indent, text)"""
+        lines = []
+        lines.append((0, "<asset>"))
+        lines.append((1, "<contributor>"))
+        lines.append((2, "<author></author>"))
+        lines.append((
+            2, "<authoring_tool>Collada Exporter for Blender 2.6+, "
+            "by Juan Linietsky (juan@codenix.com)</authoring_tool>"))
+        lines.append((1, "</contributor>"))
+        lines.append((1, "<created>{}</created>".format(timestamp)))
+        lines.append((1, "<modified>{}</modified>".format(timestamp)))
+        lines.append((1, "<unit meter=\"1.0\" name=\"meter\"/>"))
         if self.config["yup_enabled"] != "DISABLED":
-            self.writel(S_ASSET, 1, "<up_axis>Y_UP</up_axis>")
+            lines.append((1, "<up_axis>Y_UP</up_axis>"))
         else:
-            self.writel(S_ASSET, 1, "<up_axis>Z_UP</up_axis>")
-        self.writel(S_ASSET, 0, "</asset>")
+            lines.append((1, "<up_axis>Z_UP</up_axis>"))
+        lines.append((0, "</asset>"))
+        return lines
+
+    def export_asset(self):
+        timestamp = NO_TIMESTAMP
+        if self.config["use_timestamp"]:
+            timestamp = time.strftime("%Y-%m-%dT%H:%M:%SZ")
+        for indent, text in self.asset_lines(timestamp):
+            self.writel(S_ASSET, indent, text)
+
+    def document_fingerprint(self):
+        """Hash of the document, leaving out the export time."""
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(DOCUMENT_HEADER)
+        for indent, text in self.asset_lines(NO_TIMESTAMP):
+            digest.update("{}{}\n".format(indent * "\t", text).encode("utf-8"))
+        for x in sorted(self.sections.keys()):
+            if x != S_ASSET:
+                self.sections[x].update_digest(digest)
+        digest.update(DOCUMENT_FOOTER)
+        return digest.hexdigest()
 
     def export_animation_transform_channel(self, target, keys, matrices=True):
         frame_total = len(keys)
         anim_id = self.new_id("anim")
         self.writel(S_ANIM, 1, "<animation id=\"{}\">".format(anim_id))
-        source_frames = ""
-        source_transforms = ""
-        source_interps = ""
-
-        for k in keys:
-            source_frames += " {}".format(k[0])
-            if (matrices):
-                source_transforms += " {}".format(strmtx(k[1]))
-            else:
-                source_transforms += " {}".format(k[1])
-
-            source_interps += " LINEAR"
+        source_frames = serializer.floats([k[0] for k in keys])
+        if (matrices):
+            source_transforms = self.matrices([k[1] for k in keys])
+        else:
+            source_transforms = serializer.floats([k[1] for k in keys])
+        source_interps = serializer.names(["LINEAR"] * frame_total)
 
         # Time Source
         self.writel(S_ANIM, 2, "<source id=\"{}-input\">".format(anim_id))
@@ -1385,6 +2127,9 @@ class DaeExporter:
         self.writel(S_ANIM, 0, "</library_animations>")
 
     def export(self):
+        if self.config["use_bounded_memory"]:
+            self.memory = MemorySampler()
+
         self.writel(S_GEOM, 0, "<library_geometries>")
         self.writel(S_CONT, 0, "<library_controllers>")
 
@@ -1395,14 +2140,12 @@ class DaeExporter:
 
         # Morphs always go before skin controllers
         if S_MORPH in self.sections:
-            for l in self.sections[S_MORPH]:
-                self.writel(S_CONT, 0, l)
-            del self.sections[S_MORPH]
+            self.sections[S_CONT].append_section(self.sections[S_MORPH])
+            self.sections.pop(S_MORPH).close()
 
         if S_SKIN in self.sections:
-            for l in self.sections[S_SKIN]:
-                self.writel(S_CONT, 0, l)
-            del self.sections[S_SKIN]
+            self.sections[S_CONT].append_section(self.sections[S_SKIN])
+            self.sections.pop(S_SKIN).close()
 
         self.writel(S_CONT, 0, "</library_controllers>")
 
@@ -1429,31 +2172,72 @@ class DaeExporter:
                 self.scene_name))
         self.writel(S_SCENE, 0, "</scene>")
 
+        # An output generated from the same document is left untouched
+        if self.output_manifest is not None:
+            self.output_manifest.fingerprint = self.document_fingerprint()
+            if self.output_manifest.is_current():
+                self.output_manifest.unchanged = True
+                self.operator.report(
+                    {"INFO"}, "\"{}\" is up to date, it was not written again.".format(
+                        os.path.basename(self.output_manifest.output_path)))
+                return True
+
         try:
             f = open(self.path, "wb")
         except:
             return False
 
-        f.write(bytes("<?xml version=\"1.0\" encoding=\"utf-8\"?>\n", "UTF-8"))
-        f.write(bytes(
-            "<COLLADA xmlns=\"http://www.collada.org/2005/11/COLLADASchema\" "
-            "version=\"1.4.1\">\n", "UTF-8"))
-
-        s = []
-        for x in self.sections.keys():
-            s.append(x)
-        s.sort()
-        for x in s:
-            for l in self.sections[x]:
-                f.write(bytes(l + "\n", "UTF-8"))
-        f.write(bytes("</COLLADA>\n", "UTF-8"))
+        f.write(DOCUMENT_HEADER)
+
+        for x in sorted(self.sections.keys()):
+            self.sections[x].copy_to(f)
+        f.write(DOCUMENT_FOOTER)
+        f.close()
+
+        if self.dedup_stats.saved > 0:
+            self.operator.report(
+                {"INFO"}, "Writing duplicate geometry once saved {:.1f} KB.".format(
+                    self.dedup_stats.saved / 1024.0))
+
+        if self.fragment_stats.lookups > 0:
+            self.operator.report(
+                {"INFO"}, "Mesh fragment cache: {} of {} meshes reused "
+                "({:.0f}% hit rate).".format(
+                    self.fragment_stats.hits, self.fragment_stats.lookups,
+                    100.0 * self.fragment_stats.hit_rate))
+
+        if self.memory is not None:
+            self.memory.sample()
+            growth = self.memory.growth
+            if growth is not None:
+                self.operator.report(
+                    {"INFO"}, "Memory grew by up to {:.1f} MB during the export.".format(
+                        growth / (1024.0 * 1024.0)))
+            else:
+                self.operator.report(
+                    {"INFO"}, "Memory usage is not available on this platform.")
+
+        if self.float_stats.full > 0:
+            self.operator.report(
+                {"INFO"}, "Float precision settings saved {:.1f} KB ({:.1f}% of "
+                "reduced numeric data), file size is {:.1f} KB.".format(
+                    self.float_stats.saved / 1024.0,
+                    100.0 * self.float_stats.saved / self.float_stats.full,
+                    os.path.getsize(self.path) / 1024.0))
         return True
 
     __slots__ = ("operator", "scene", "last_id", "scene_name", "objects", "sections",
                  "path", "mesh_cache", "curve_cache",
-                 "skeleton_info", "config", "valid_nodes",
+                 "skeleton_info", "config", "valid_nodes", "scene_index",
                  "used_bones", "wrongvtx_report",
-                 "skeletons", "action_constraints", "temp_meshes")
+                 "skeletons", "action_constraints", "temp_mesh_owners",
+                 "evaluated_meshes", "pending_meshes", "exported", "bake_matrices",
+                 "bone_rest_matrices", "instances",
+                 "geometry_ids", "geometry_sizes", "dedup_stats",
+                 "capture", "unassigned_weights", "fragment_cache",
+                 "fragment_stats", "export_record", "previous_export",
+                 "export_sources", "reused_fragments", "output_manifest",
+                 "float_formats", "float_stats", "memory")
 
     def __init__(self, path, context, objects, kwargs, operator):
         self.operator = operator
@@ -1464,25 +2248,53 @@ class DaeExporter:
         self.sections = {}
         self.path = path
         self.mesh_cache = {}
-        self.temp_meshes = set()
+        self.temp_mesh_owners = set()
+        self.evaluated_meshes = {}
+        self.pending_meshes = {}
+        self.exported = set()
+        self.bake_matrices = {}
+        self.bone_rest_matrices = {}
+        self.instances = {}
+        self.geometry_ids = {}
+        self.geometry_sizes = {}
+        self.dedup_stats = serializer.SizeStats()
+        self.capture = None
+        self.unassigned_weights = False
+        self.fragment_cache = kwargs.get("fragment_cache")
+        self.fragment_stats = lru_cache.CacheStats()
+        self.export_record = kwargs.get("export_record")
+        self.previous_export = kwargs.get("previous_export")
+        self.export_sources = kwargs.get("export_sources") or {}
+        self.reused_fragments = {}
+        self.output_manifest = kwargs.get("output_manifest")
         self.curve_cache = {}
         self.skeleton_info = {}
         self.config = kwargs
-        self.valid_nodes = []
+        self.valid_nodes = set()
+        self.scene_index = None
         self.used_bones = []
         self.wrongvtx_report = False
         self.skeletons = []
         self.action_constraints = []
+        self.float_formats = serializer.precision_formats(kwargs)
+        self.float_stats = serializer.SizeStats()
+        self.memory = None
 
     def __enter__(self):
         return self
 
     def __exit__(self, *exc):
-        pass
-        """    
-        for mesh in self.temp_meshes:
-            bpy.data.meshes.remove(mesh)
-        """
+        # Evaluated meshes of nodes that ended up not being exported
+        for node in self.evaluated_meshes:
+            node.to_mesh_clear()
+        self.evaluated_meshes = {}
+        for section in self.sections.values():
+            section.close()
+        self.sections = {}
+
+        for node in self.temp_mesh_owners:
+            node.to_mesh_clear()
+        self.temp_mesh_owners = set()
 
 def save(operator, context, objects, filepath="", **kwargs):
     with DaeExporter(filepath, context, objects, kwargs, operator) as exp:
@@ -0,0 +1,111 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""
+Detection of mesh objects that can be exported as instances of one geometry.
+
+Objects are instances of each other when they link the same mesh data and
+evaluate to the same local space mesh: equal modifier stacks that don't
+depend on other objects, and no skinning. Their object transforms then go to
+the node matrices instead of being applied to the geometry. This is only
+done with the use_instancing export option.
+"""
+
+# Modifier properties that don't change the evaluated mesh
+IGNORED_MODIFIER_PROPERTIES = {
+    "rna_type", "name", "show_expanded", "show_on_cage", "show_in_editmode",
+    "is_active", "is_override_data", "use_pin_to_last", "persistent_uid",
+    "execution_time", "use_apply_on_spline",
+}
+
+
+def property_value(value):
+    """Hashable form of an RNA property value, None for ID references."""
+    if isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, set):
+        return tuple(sorted(value))
+    try:
+        return tuple(property_value(v) for v in value)
+    except TypeError:
+        return None
+
+
+def modifier_signature(obj, use_modifiers=True):
+    """Hashable description of the modifier stack of obj, or None when the
+    evaluated mesh may depend on more than the object's own data."""
+    if not use_modifiers:
+        return ()
+
+    signature = []
+    for modifier in obj.modifiers:
+        if modifier.type == "ARMATURE":
+            return None
+        if not modifier.show_viewport:
+            signature.append((modifier.type, False))
+            continue
+
+        values = []
+        for prop in modifier.bl_rna.properties:
+            if prop.identifier in IGNORED_MODIFIER_PROPERTIES:
+                continue
+            value = getattr(modifier, prop.identifier)
+            if prop.type == "COLLECTION":
+                # e.g. UV projectors, which reference objects
+                if len(value):
+                    return None
+                continue
+            if prop.type == "POINTER":
+                # Objects, collections, textures... are evaluated with their
+                # own transforms and state
+                if value is not None:
+                    return None
+                continue
+            value = property_value(value)
+            if value is None:
+                return None
+            values.append((prop.identifier, value))
+        signature.append((modifier.type, tuple(values)))
+
+    return tuple(signature)
+
+
+def instance_key(obj, use_modifiers=True):
+    """(mesh data, modifier signature) of an object that could be exported as
+    an instance, None for objects that need their own geometry."""
+    if obj.type != "MESH" or obj.data is None:
+        return None
+    if obj.parent is not None and obj.parent.type == "ARMATURE":
+        return None
+
+    signature = modifier_signature(obj, use_modifiers)
+    if signature is None:
+        return None
+    return (obj.data, signature)
+
+
+def instance_groups(objects, use_modifiers=True):
+    """Instance key of every object sharing its geometry with at least one
+    other object of objects."""
+    groups = {}
+    for obj in objects:
+        key = instance_key(obj, use_modifiers)
+        if key is not None:
+            groups.setdefault(key, []).append(obj)
+
+    return {obj: key for key, group in groups.items() if len(group) > 1
+            for obj in group}
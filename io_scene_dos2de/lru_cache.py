@@ -0,0 +1,189 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""
+Size-bounded, least recently used file cache in a directory.
+
+Entries are files named after their (hex) key. Reading an entry marks it as
+used by touching its modification time, so the eviction order survives
+restarts. When the total size goes over the limit, the least recently used
+entries are deleted. A cache can be used from several threads.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# Entries being written, left behind by interrupted writes
+TEMP_SUFFIX = ".tmp"
+
+
+class CacheStats:
+    """Hit/miss counters of a cache."""
+
+    __slots__ = ("hits", "misses")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def lookups(self):
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self):
+        """Fraction of lookups that were hits, 0 without lookups."""
+        if self.lookups == 0:
+            return 0.0
+        return self.hits / self.lookups
+
+
+class DiskLRUCache:
+    __slots__ = ("directory", "max_size", "suffix", "entries", "size", "stats",
+                 "lock")
+
+    def __init__(self, directory, max_size, suffix=""):
+        self.directory = directory
+        self.max_size = max_size
+        self.suffix = suffix
+        # key -> (last use, size), filled from the directory once
+        self.entries = {}
+        self.size = 0
+        self.stats = CacheStats()
+        self.lock = threading.RLock()
+
+        os.makedirs(directory, exist_ok=True)
+        for entry in os.scandir(directory):
+            if (entry.is_file() and entry.name.endswith(suffix) and
+                    not entry.name.endswith(TEMP_SUFFIX)):
+                stat = entry.stat()
+                key = entry.name[:len(entry.name) - len(suffix)]
+                self.entries[key] = (stat.st_mtime, stat.st_size)
+                self.size += stat.st_size
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key):
+        """Path of the entry for key, or None. Counts as a use of the entry."""
+        with self.lock:
+            if key not in self.entries:
+                self.stats.misses += 1
+                return None
+
+            path = self.path(key)
+            now = time.time()
+            try:
+                os.utime(path, (now, now))
+            except OSError:
+                # Removed behind our back
+                self.forget(key)
+                self.stats.misses += 1
+                return None
+
+            self.entries[key] = (now, self.entries[key][1])
+            self.stats.hits += 1
+            return path
+
+    def copy(self, key, destination):
+        """Copy the entry for key to destination. Returns False if there is
+        no entry. The entry can't be evicted while it is copied."""
+        with self.lock:
+            path = self.get(key)
+            if path is None:
+                return False
+            try:
+                shutil.copyfile(path, destination)
+            except OSError:
+                self.stats.hits -= 1
+                self.stats.misses += 1
+                raise
+            return True
+
+    def put_bytes(self, key, data):
+        """Store data under key."""
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=TEMP_SUFFIX)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        self.commit(key, temp_path)
+
+    def put_file(self, key, source_path):
+        """Store a copy of the file at source_path under key."""
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=TEMP_SUFFIX)
+        os.close(fd)
+        shutil.copyfile(source_path, temp_path)
+        self.commit(key, temp_path)
+
+    def commit(self, key, temp_path):
+        # Written next to the final path and renamed, so readers never see
+        # partial entries
+        size = os.path.getsize(temp_path)
+        with self.lock:
+            os.replace(temp_path, self.path(key))
+            if key in self.entries:
+                self.size -= self.entries[key][1]
+            self.entries[key] = (time.time(), size)
+            self.size += size
+            self.evict()
+
+    def forget(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits."""
+        with self.lock:
+            if self.size <= self.max_size:
+                return
+
+            for key, _ in sorted(self.entries.items(), key=lambda e: e[1][0]):
+                if self.size <= self.max_size:
+                    break
+                try:
+                    os.remove(self.path(key))
+                except OSError:
+                    pass
+                self.forget(key)
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.entries):
+                try:
+                    os.remove(self.path(key))
+                except OSError:
+                    pass
+                self.forget(key)
+
+
+# One instance per directory, so the directory is only scanned once per session
+open_caches = {}
+
+
+def open_cache(directory, max_size, suffix=""):
+    """Shared DiskLRUCache for a directory, with an updated size limit."""
+    key = (os.path.normcase(os.path.abspath(directory)), suffix)
+    cache = open_caches.get(key)
+    if cache is None:
+        cache = open_caches[key] = DiskLRUCache(directory, max_size, suffix)
+    else:
+        cache.max_size = max_size
+        cache.evict()
+    return cache
@@ -0,0 +1,355 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""
+Vertex/index buffer construction for the Collada exporter.
+
+Everything in here works on flat arrays (as filled by foreach_get) and never
+touches bpy, so the heavy lifting of export_mesh stays vectorized.
+NumPy ships with Blender, but the exporter falls back to its per-loop code
+path when it's missing, so check HAS_NUMPY before calling into this module.
+"""
+
+import array
+import hashlib
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    np = None
+    HAS_NUMPY = False
+
+
+class MeshBuffers:
+    """Final per-vertex attribute arrays and per-material index lists of a mesh.
+
+    Attribute arrays are flat (x y z x y z ...); uvs holds one flat array per
+    UV layer. Skin data is flat as well: weight_counts holds the number of
+    influences of each vertex, bones/weights the influences themselves.
+    surfaces is a list of (material_index, indices, counts) tuples in the
+    order the materials first appear, where counts is the number of indices
+    of each polygon.
+    """
+
+    __slots__ = ("vertex_count", "positions", "normals", "tangents", "bitangents",
+                 "uvs", "colors", "weight_counts", "bones", "weights", "surfaces")
+
+    def __init__(self):
+        self.vertex_count = 0
+        self.positions = []
+        self.normals = []
+        self.tangents = None
+        self.bitangents = None
+        self.uvs = []
+        self.colors = None
+        self.weight_counts = None
+        self.bones = None
+        self.weights = None
+        self.surfaces = []
+
+
+def polygon_loop_order(loop_start, loop_total):
+    """Loop indices in polygon traversal order (polygon 0's loops first, etc.)"""
+    total = int(loop_total.sum())
+    offsets = np.cumsum(loop_total) - loop_total
+    return (np.arange(total, dtype=np.int64)
+            - np.repeat(offsets, loop_total)
+            + np.repeat(loop_start.astype(np.int64), loop_total))
+
+
+def quantize(values, step):
+    """Snap float attribute values to a grid of the given step as int64, so
+    values closer than the step compare (and hash) equal."""
+    values = np.nan_to_num(np.asarray(values, dtype=np.float64))
+    return np.rint(values / step).astype(np.int64)
+
+
+def weld_vertices(keys):
+    """Merge loops whose quantized attributes are identical into one vertex.
+
+    keys: (loops, n) int64 array holding every exported attribute of each
+    loop (see quantize), in traversal order.
+    Returns (loop_to_vertex, source_loops): the output vertex of every loop,
+    and for each output vertex the loop its attributes are taken from. That
+    is the last loop merged into it, as loops closer than the quantization
+    step can still differ, and the vertex used to be overwritten by every
+    loop merged into it. Vertices are numbered in order of first appearance,
+    so the buffer layout follows the index order.
+    """
+    loop_count = len(keys)
+    if loop_count == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    keys = np.ascontiguousarray(keys, dtype=np.int64)
+    packed = keys.view(np.dtype((np.void, keys.itemsize * keys.shape[1]))).reshape(-1)
+    _, first, inverse = np.unique(packed, return_index=True, return_inverse=True)
+
+    by_appearance = np.argsort(first, kind="stable")
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[by_appearance] = np.arange(len(first), dtype=np.int64)
+
+    inverse = inverse.reshape(-1)
+    last = np.zeros(len(first), dtype=np.int64)
+    np.maximum.at(last, inverse, np.arange(loop_count, dtype=np.int64))
+
+    return rank[inverse], last[by_appearance]
+
+
+def pad_rows(counts, values, fill, dtype):
+    """Spread a flat list of variable-length rows into a fixed-width
+    (rows, max count) array, padding short rows with fill."""
+    counts = np.asarray(counts, dtype=np.int64)
+    width = int(counts.max()) if len(counts) else 0
+    out = np.full((len(counts), width), fill, dtype=dtype)
+    out[np.arange(width) < counts[:, None]] = values
+    return out
+
+
+def skin_influences(group_bones, groups, weights, min_weight):
+    """Resolve per-vertex deform weights to bone influences.
+
+    group_bones: int array mapping vertex group index to bone index, -1 for
+    groups that don't belong to a bone of the skeleton.
+    groups/weights: (vertices, n) vertex group indices and weights, -1 padded
+    (see pad_rows).
+    Influences on non-bone groups or not above min_weight are dropped, the
+    rest keep their order. Returns (bones, weights, unassigned) as
+    fixed-width (vertices, top n) arrays padded with -1/0, plus a mask of
+    vertices left without influences; these get bone 0 at full weight.
+    """
+    bones = np.full(groups.shape, -1, dtype=np.int64)
+    known = (groups >= 0) & (groups < len(group_bones))
+    bones[known] = group_bones[groups[known]]
+
+    keep = (bones >= 0) & (weights > min_weight)
+    unassigned = ~keep.any(axis=1)
+
+    # Move kept influences to the front of each row, then cut the padding
+    order = np.argsort(~keep, axis=1, kind="stable")
+    bones = np.take_along_axis(np.where(keep, bones, -1), order, axis=1)
+    weights = np.take_along_axis(np.where(keep, weights, 0.0), order, axis=1)
+    width = max(1, int(keep.sum(axis=1).max())) if len(keep) else 1
+    if bones.shape[1] < width:
+        bones = np.full((len(bones), width), -1, dtype=np.int64)
+        weights = np.zeros((len(weights), width), dtype=np.float64)
+    bones = bones[:, :width]
+    weights = weights[:, :width]
+
+    bones[unassigned, 0] = 0
+    weights[unassigned, 0] = 1.0
+    return bones, weights, unassigned
+
+
+def limit_total(groups, weights, group_count, limit):
+    """Remove the smallest deform weights of vertices in more than limit
+    vertex groups, like bpy.ops.object.vertex_group_limit_total on all groups.
+
+    groups/weights: (vertices, n) vertex group indices and weights, -1
+    padded (see pad_rows), in the order they are stored on the vertex.
+    Limited vertices are reordered the way Blender leaves them: entries with
+    an invalid group index first, then the remaining weights in decreasing
+    order. Blender's qsort leaves the order of equal weights unspecified,
+    here they stay in reverse storage order. Other vertices are unchanged.
+    """
+    valid = (groups >= 0) & (groups < group_count)
+    over = valid.sum(axis=1) > limit
+    if not over.any():
+        return groups, weights
+
+    groups = groups.copy()
+    weights = weights.copy()
+    g = groups[over]
+    w = weights[over]
+    v = valid[over]
+
+    position = np.broadcast_to(np.arange(g.shape[1]), g.shape)
+    category = np.where(v, 1, np.where(g >= 0, 0, 2))
+    order = np.lexsort((np.where(category == 0, position, -position),
+                        np.where(v, -w, 0.0),
+                        category), axis=1)
+    g = np.take_along_axis(g, order, axis=1)
+    w = np.take_along_axis(w, order, axis=1)
+    v = np.take_along_axis(v, order, axis=1)
+
+    drop = v & (np.cumsum(v, axis=1) > limit)
+    g[drop] = -1
+    w[drop] = 0.0
+    groups[over] = g
+    weights[over] = w
+    return groups, weights
+
+
+def normalize_all(groups, weights, group_count, locked=None):
+    """Normalize the deform weights of every vertex to sum up to 1, like
+    bpy.ops.object.vertex_group_normalize_all on all groups.
+
+    groups/weights: as for limit_total, weights as float32. Arithmetic is
+    done in float32 in storage order, so results match Blender's bit for bit.
+    locked: optional bool array of vertex groups whose weights are kept;
+    the others are scaled to fill up the remaining weight.
+    """
+    weights = weights.astype(np.float32)
+    valid = (groups >= 0) & (groups < group_count)
+    if locked is None:
+        unlocked = valid
+    else:
+        locked = np.asarray(locked, dtype=bool)
+        unlocked = valid.copy()
+        unlocked[valid] = ~locked[groups[valid]]
+
+    total = np.zeros(len(weights), dtype=np.float32)
+    locked_total = np.zeros(len(weights), dtype=np.float32)
+    for column in range(weights.shape[1]):
+        total += np.where(unlocked[:, column], weights[:, column], np.float32(0.0))
+        locked_total += np.where(valid[:, column] & ~unlocked[:, column],
+                                 weights[:, column], np.float32(0.0))
+
+    remaining = np.maximum(np.float32(0.0), np.float32(1.0) - locked_total)
+    scalar = np.ones(len(weights), dtype=np.float32)
+    np.divide(np.float32(1.0), total, out=scalar, where=total > 0.0)
+    scalar = scalar * remaining
+
+    count = (groups >= 0).sum(axis=1)
+    scale = unlocked & ((count > 1) & (total > 0.0))[:, None]
+    weights[scale] = np.clip(
+        weights * scalar[:, None], np.float32(0.0), np.float32(1.0))[scale]
+
+    # A single weight is set to 1 outright
+    single = unlocked & (count == 1)[:, None]
+    weights[single] = np.float32(1.0)
+    return weights
+
+
+def quantize_weights(weights, step):
+    """Round weights to multiples of step (e.g. 1/255 to match 8 bit
+    weights), 0 disables rounding."""
+    if step <= 0.0:
+        return weights
+    return np.rint(weights / step) * step
+
+
+def transform_buffers(buffers, matrix):
+    """Bake a 4x4 transform into the vertex attributes of a MeshBuffers:
+    positions are transformed, normals by the inverse transpose and
+    tangents/bitangents as directions. Negative scale flips the polygon
+    winding, the same way applying a mirroring transform does."""
+    matrix = np.asarray(matrix, dtype=np.float64)
+    linear = matrix[:3, :3]
+    translation = matrix[:3, 3]
+
+    def directions(values, mtx):
+        values = np.asarray(values, dtype=np.float64).reshape(-1, 3) @ mtx
+        length = np.linalg.norm(values, axis=1, keepdims=True)
+        np.divide(values, length, out=values, where=length > 0.0)
+        return values.astype(np.float32).reshape(-1)
+
+    positions = np.asarray(buffers.positions, dtype=np.float64).reshape(-1, 3)
+    buffers.positions = (positions @ linear.T + translation).astype(np.float32).reshape(-1)
+    buffers.normals = directions(buffers.normals, np.linalg.inv(linear))
+    if buffers.tangents is not None:
+        buffers.tangents = directions(buffers.tangents, linear.T)
+        buffers.bitangents = directions(buffers.bitangents, linear.T)
+
+    if np.linalg.det(linear) < 0.0:
+        surfaces = []
+        for material_index, indices, counts in buffers.surfaces:
+            counts = np.asarray(counts, dtype=np.int64)
+            ends = np.repeat(np.cumsum(counts), counts)
+            starts = ends - np.repeat(counts, counts)
+            # Index i of a polygon becomes index (count - 1 - i)
+            position = np.arange(len(indices), dtype=np.int64)
+            surfaces.append((material_index,
+                             np.asarray(indices)[starts + ends - 1 - position],
+                             counts))
+        buffers.surfaces = surfaces
+
+
+def buffers_digest(buffers, *layout):
+    """Content hash of the geometry in a MeshBuffers: vertex attributes and
+    per-material index lists, plus any extra hashable layout data (e.g.
+    primitive type or material slots). Skin data is not part of it, it goes
+    to the skin controller instead of the geometry."""
+    digest = hashlib.blake2b(digest_size=20)
+
+    def add(values, typecode):
+        if values is None:
+            digest.update(b"-")
+            return
+        # The type is hashed too: the same values are written differently
+        # as float32 and float64 (see serializer.floats)
+        if HAS_NUMPY and isinstance(values, np.ndarray):
+            kind = values.dtype.str
+            data = np.ascontiguousarray(values).tobytes()
+        else:
+            kind = typecode
+            data = array.array(typecode, values).tobytes()
+        digest.update(kind.encode("ascii"))
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+
+    digest.update(buffers.vertex_count.to_bytes(8, "little"))
+    add(buffers.positions, "d")
+    add(buffers.normals, "d")
+    add(buffers.tangents, "d")
+    add(buffers.bitangents, "d")
+    digest.update(len(buffers.uvs).to_bytes(8, "little"))
+    for uv in buffers.uvs:
+        add(uv, "d")
+    add(buffers.colors, "d")
+    for material_index, indices, counts in buffers.surfaces:
+        digest.update(int(material_index).to_bytes(8, "little", signed=True))
+        add(indices, "q")
+        add(counts, "q")
+
+    digest.update(repr(layout).encode("utf-8"))
+    return digest.digest()
+
+
+def flatten_influences(bones, weights):
+    """Flatten fixed-width influences into (weight_counts, bones, weights)
+    as written to <vertex_weights>."""
+    used = bones >= 0
+    return used.sum(axis=1), bones[used], weights[used]
+
+
+def joint_weight_pairs(bones):
+    """Interleave each influence's bone index with its weight index, as in the
+    <v> element of <vertex_weights>."""
+    if HAS_NUMPY and isinstance(bones, np.ndarray):
+        return np.column_stack((bones, np.arange(len(bones)))).reshape(-1)
+    return [x for i, b in enumerate(bones) for x in (b, i)]
+
+
+def build_surfaces(loop_to_vertex, polygon_material, polygon_loop_total):
+    """Group polygon indices by material in order of first appearance."""
+    surfaces = []
+    if len(polygon_material) == 0:
+        return surfaces
+
+    polygon_loop_total = polygon_loop_total.astype(np.int64)
+    polygon_offsets = np.cumsum(polygon_loop_total) - polygon_loop_total
+    _, first = np.unique(polygon_material, return_index=True)
+    for material in polygon_material[np.sort(first)]:
+        polygons = np.flatnonzero(polygon_material == material)
+        counts = polygon_loop_total[polygons]
+        loops = (np.arange(int(counts.sum()), dtype=np.int64)
+                 - np.repeat(np.cumsum(counts) - counts, counts)
+                 + np.repeat(polygon_offsets[polygons], counts))
+        surfaces.append((int(material), loop_to_vertex[loops], counts))
+
+    return surfaces
@@ -0,0 +1,120 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""
+Serialized <geometry> and <controller> blocks of a mesh, reusable between
+exports.
+
+The blocks are written with placeholders instead of the ids the exporter
+generates, as those depend on what else is exported. Placeholders contain a
+NUL character, which can't occur in names or numbers.
+"""
+
+import hashlib
+
+# Bump whenever the written XML or the fragment key changes
+FORMAT_VERSION = 1
+
+MESH_ID = "\0mesh\0"
+CONTROLLER_ID = "\0controller\0"
+SKELETON_ID = "\0skeleton\0"
+
+HEADER = "dos2de-mesh-fragment"
+
+
+class MeshFragment:
+    """geometry and skin are lists of lines. digest is the content hash of
+    the geometry used to write it once (see mesh_buffers.buffers_digest),
+    unassigned_weights whether any vertex had no bone weight."""
+
+    __slots__ = ("geometry", "skin", "digest", "unassigned_weights")
+
+    def __init__(self):
+        self.geometry = []
+        self.skin = []
+        self.digest = ""
+        self.unassigned_weights = False
+
+
+def fill(lines, ids):
+    """Lines with placeholders replaced by ids ({placeholder: id})."""
+    for line in lines:
+        if "\0" in line:
+            for placeholder, value in ids.items():
+                line = line.replace(placeholder, value)
+        yield line
+
+
+def dumps(fragment):
+    header = "{} {} {} {} {} {}".format(
+        HEADER, FORMAT_VERSION, fragment.digest or "-",
+        int(fragment.unassigned_weights), len(fragment.geometry),
+        len(fragment.skin))
+    return "\n".join([header] + fragment.geometry + fragment.skin).encode("utf-8")
+
+
+def loads(data):
+    """Fragment from dumps() output, None if it isn't one of this version."""
+    lines = data.decode("utf-8").split("\n")
+    header = lines[0].split(" ")
+    if (len(header) != 6 or header[0] != HEADER
+            or header[1] != str(FORMAT_VERSION)):
+        return None
+
+    geometry_count = int(header[4])
+    skin_count = int(header[5])
+    if len(lines) != 1 + geometry_count + skin_count:
+        return None
+
+    fragment = MeshFragment()
+    fragment.digest = "" if header[2] == "-" else header[2]
+    fragment.unassigned_weights = header[3] == "1"
+    fragment.geometry = lines[1:1 + geometry_count]
+    fragment.skin = lines[1 + geometry_count:]
+    return fragment
+
+
+def load(path):
+    try:
+        with open(path, "rb") as f:
+            return loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+class KeyBuilder:
+    """Hash of everything a fragment is built from."""
+
+    __slots__ = ("hash", )
+
+    def __init__(self):
+        self.hash = hashlib.blake2b(digest_size=20)
+        self.add(FORMAT_VERSION)
+
+    def add(self, *values):
+        """Plain values: numbers, strings and (nested) tuples/lists of them."""
+        self.hash.update(repr(values).encode("utf-8"))
+
+    def add_array(self, array):
+        self.add(array.dtype.str, array.shape)
+        self.hash.update(array.tobytes())
+
+    def add_matrix(self, matrix):
+        self.add(tuple(tuple(row) for row in matrix))
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
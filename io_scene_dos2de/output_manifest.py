@@ -0,0 +1,100 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""
+Sidecar manifest of an exported file.
+
+The manifest next to an output records the fingerprint of the document it
+was generated from, the GR2 conversion options, and the size and
+modification time the output had afterwards. An export producing the same
+document for an untouched output can leave the file (and its mtime) alone.
+"""
+
+import json
+import os
+
+MANIFEST_VERSION = 1
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+def manifest_path(output_path):
+    return output_path + MANIFEST_SUFFIX
+
+
+def output_state(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class OutputManifest:
+    """conversion describes how the document is converted into the output
+    (None when the document is the output). fingerprint is set by the
+    exporter, unchanged when it found the output up to date."""
+
+    __slots__ = ("output_path", "conversion", "fingerprint", "unchanged")
+
+    def __init__(self, output_path, conversion=None):
+        self.output_path = output_path
+        self.conversion = conversion
+        self.fingerprint = None
+        self.unchanged = False
+
+    def read(self):
+        try:
+            with open(manifest_path(self.output_path), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION:
+            return None
+        return data
+
+    def is_current(self):
+        """Whether the output was generated from a document with the same
+        fingerprint and conversion, and wasn't modified since."""
+        data = self.read()
+        if data is None or self.fingerprint is None:
+            return False
+        # A missing output is never current, whatever the manifest says
+        state = output_state(self.output_path)
+        return (state is not None and
+                data.get("fingerprint") == self.fingerprint and
+                data.get("conversion") == self.conversion and
+                data.get("output") == state)
+
+    def save(self):
+        data = {
+            "version": MANIFEST_VERSION,
+            "fingerprint": self.fingerprint,
+            "conversion": self.conversion,
+            "output": output_state(self.output_path),
+        }
+        try:
+            with open(manifest_path(self.output_path), "w", encoding="utf-8") as f:
+                json.dump(data, f, indent="\t")
+        except OSError:
+            return False
+        return True
+
+    def remove(self):
+        try:
+            os.remove(manifest_path(self.output_path))
+        except OSError:
+            pass
@@ -0,0 +1,103 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""
+Per-export index of the object hierarchy.
+
+Object.children scans every object of the file on each access, so walking a
+hierarchy through it is quadratic. The index reads each object's parent and
+collections once and answers the same questions from dicts.
+"""
+
+
+def sort_key(obj):
+    return obj.name
+
+
+def parent(obj):
+    return obj.parent
+
+
+class SceneIndex:
+    """Parent -> children map of a set of objects (and their ancestors),
+    with children sorted by name, plus the viewport visibility of every
+    collection they are linked to.
+    parent_of overrides the hierarchy, e.g. to flatten parents that won't
+    be exported; it defaults to Object.parent."""
+
+    __slots__ = ("children", "collection_hidden")
+
+    def __init__(self, objects, parent_of=None):
+        self.children = {}
+        self.collection_hidden = {}
+
+        if parent_of is None:
+            parent_of = parent
+
+        seen = set()
+        for obj in objects:
+            # Ancestors are indexed as well, so traversals from a root
+            # reach every object
+            while obj is not None and obj not in seen:
+                seen.add(obj)
+                obj_parent = parent_of(obj)
+                self.children.setdefault(obj_parent, []).append(obj)
+                for col in obj.users_collection:
+                    if col not in self.collection_hidden:
+                        self.collection_hidden[col] = col.hide_viewport
+                obj = obj_parent
+
+        for children in self.children.values():
+            children.sort(key=sort_key)
+
+    def children_of(self, obj):
+        """Indexed children of obj, sorted by name."""
+        return self.children.get(obj, ())
+
+    def roots(self):
+        """Indexed objects without a parent, sorted by name."""
+        return self.children.get(None, ())
+
+    def traversal(self, roots=None):
+        """Depth-first, parent before children, siblings sorted by name."""
+        order = []
+        stack = list(reversed(self.roots() if roots is None else roots))
+        while stack:
+            obj = stack.pop()
+            order.append(obj)
+            stack.extend(reversed(self.children_of(obj)))
+        return order
+
+    def in_visible_collections(self, obj):
+        """False when any collection the object is linked to is hidden in
+        the viewport."""
+        for col in obj.users_collection:
+            hidden = self.collection_hidden.get(col)
+            if hidden is None:
+                hidden = self.collection_hidden[col] = col.hide_viewport
+            if hidden:
+                return False
+        return True
+
+
+def visible_top_collections(layer_collection):
+    """Top-level collections of a view layer (given its layer_collection)
+    that are neither excluded nor hidden in the viewport, in their order in
+    the outliner."""
+    return [child.collection for child in layer_collection.children
+            if not child.exclude and not child.hide_viewport
+            and not child.collection.hide_viewport]
@@ -0,0 +1,129 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""
+Bulk text serialization of numeric arrays for Collada documents.
+
+Arrays are formatted in one pass and joined once, instead of growing a
+string value by value. Inputs may be NumPy arrays, array.array, mathutils
+vectors/matrices or plain sequences.
+
+Values are written as Python floats, so float32 input shows its exact value
+(0.3 is written 0.30000001192092896). Unlike the string building this
+replaced, arrays have no leading space.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Shortest repr that round-trips, same as str(float)
+FULL_PRECISION = None
+
+# Float kinds -> export option holding their significant digits
+PRECISION_OPTIONS = {
+    "position": "precision_positions",
+    "normal": "precision_normals",
+    "uv": "precision_uvs",
+    "color": "precision_colors",
+    "weight": "precision_weights",
+    "matrix": "precision_matrices",
+}
+
+
+def float_format(significant_digits):
+    """Format pattern writing the given number of significant digits without
+    trailing zeros; 0 means FULL_PRECISION."""
+    if significant_digits <= 0:
+        return FULL_PRECISION
+    return "{{:.{}g}}".format(significant_digits)
+
+
+def precision_formats(settings):
+    """Float kind -> format pattern, from the precision options in settings
+    (the export keywords)."""
+    return {kind: float_format(settings[option])
+            for kind, option in PRECISION_OPTIONS.items()}
+
+
+class SizeStats:
+    """Characters written with a reduced float format, next to what the same
+    values would have taken at full precision."""
+
+    __slots__ = ("written", "full")
+
+    def __init__(self):
+        self.written = 0
+        self.full = 0
+
+    def add(self, written, full):
+        self.written += written
+        self.full += full
+
+    @property
+    def saved(self):
+        return self.full - self.written
+
+
+def to_list(values):
+    """Plain list of Python numbers from an array-like."""
+    if hasattr(values, "tolist"):
+        return values.tolist()
+    return values
+
+
+def flatten_matrices(matrices):
+    """Row-major values of a sequence of 4x4 matrices as one flat list."""
+    if np is not None and isinstance(matrices, np.ndarray):
+        return matrices.reshape(-1).tolist()
+    return [x for mtx in matrices for row in mtx for x in row]
+
+
+def floats(values, fmt=FULL_PRECISION, stats=None):
+    """Space separated floats. fmt is a str.format pattern (e.g. "{:.6g}"),
+    FULL_PRECISION writes the shortest round-tripping repr.
+    When a SizeStats is passed, reduced formats record how much they saved."""
+    values = to_list(values)
+    if fmt is FULL_PRECISION:
+        return " ".join(map(repr, map(float, values)))
+
+    text = " ".join(map(fmt.format, values))
+    if stats is not None and values:
+        full = sum(map(len, map(repr, map(float, values)))) + len(values) - 1
+        stats.add(len(text), full)
+    return text
+
+
+def ints(values):
+    """Space separated integers."""
+    return " ".join(map(str, map(int, to_list(values))))
+
+
+def names(values):
+    """Space separated names (Name_array / IDREF_array content)."""
+    return " ".join(values)
+
+
+def matrix(mtx, fmt=FULL_PRECISION, stats=None):
+    """The 16 values of a 4x4 matrix, row-major."""
+    return floats(flatten_matrices((mtx, )), fmt, stats)
+
+
+def matrices(mtxs, fmt=FULL_PRECISION, stats=None):
+    """A stack of 4x4 matrices, row-major, as written to float4x4 sources."""
+    return floats(flatten_matrices(mtxs), fmt, stats)
@@ -0,0 +1,25 @@
+"""
+The add-on package imports bpy in __init__.py. The modules tested here don't
+use bpy, so they are loaded from the add-on folder as a bare package without
+running __init__.py.
+"""
+
+import os
+import sys
+import types
+
+import pytest
+
+ADDON_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "io_scene_dos2de")
+PACKAGE = "dos2de_modules"
+
+if PACKAGE not in sys.modules:
+    package = types.ModuleType(PACKAGE)
+    package.__path__ = [ADDON_DIR]
+    sys.modules[PACKAGE] = package
+
+
+@pytest.fixture
+def standin_command():
+    """Command starting the stand-in conversion server in fake mode"""
+    return [sys.executable, os.path.join(ADDON_DIR, "divine_server_standin.py")]
@@ -0,0 +1,42 @@
+import os
+
+from dos2de_modules import batch_conversion, conversion_pool, conversion_server
+
+
+def test_batch_conversion_through_standin(tmp_path, standin_command):
+    batch = batch_conversion.BatchConversion(str(tmp_path))
+    items = [batch.add(str(tmp_path / "out" / name)) for name in ("Chair.GR2", "Table.GR2", "Lamp.GR2")]
+    os.mkdir(str(tmp_path / "out"))
+    for item in items:
+        with open(item.collada_path, "w") as f:
+            f.write("FAKE_FAILURE" if item is items[1] else "<COLLADA/>")
+
+    # Left out of the batch, like a DAE whose export failed
+    batch.discard(items[2].collada_path)
+    assert not os.path.exists(items[2].collada_path)
+
+    pool = conversion_server.get_server_pool(standin_command)
+    try:
+        job = conversion_pool.ConversionJob(
+            batch.divine_args("divine.exe", "bg3", "-e flip-uvs "), batch.input_dir,
+            batch.output_dir, 30, server=pool).run()
+    finally:
+        conversion_server.shutdown_servers()
+
+    assert job.succeeded
+    batch.collect(job.stdout + "\n" + job.stderr, job.error)
+    chair, table = batch.items
+    assert chair.succeeded
+    assert open(chair.gr2_path).read() == "<COLLADA/>"
+    assert not table.succeeded
+    assert "fake failure" in table.error
+    assert not os.path.exists(table.gr2_path)
+
+    batch.cleanup()
+    assert not os.path.exists(batch.directory)
+
+
+def test_failed_files_matches_whole_names():
+    log = "[INFO] Converting\n[ERROR] Failed to convert C:\\stage\\dae\\10001_a.dae: boom\n"
+    assert batch_conversion.failed_files(log, ["0001_a", "10001_a"]) == {
+        "10001_a": "[ERROR] Failed to convert C:\\stage\\dae\\10001_a.dae: boom"}
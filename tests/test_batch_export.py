@@ -0,0 +1,83 @@
+import json
+import os
+
+import pytest
+
+from dos2de_modules import batch_export
+
+
+def write_manifest(tmp_path, manifest):
+    path = tmp_path / "manifest.json"
+    path.write_text(json.dumps(manifest), encoding="utf-8")
+    return str(path)
+
+
+def test_read_manifest(tmp_path):
+    absolute = str(tmp_path / "elsewhere" / "Walk.blend")
+    path = write_manifest(tmp_path, {
+        "blender": "blender.exe",
+        "defaults": {"preset": "MODEL", "options": {"use_change_tracking": False, "use_tangent": True}},
+        "jobs": [
+            {"blend": "Models/Chair.blend", "output": "Export/Chair.GR2"},
+            {"blend": absolute, "output": "Export/Walk.GR2",
+             "preset": "ANIMATION", "options": {"use_tangent": False}},
+        ],
+    })
+
+    manifest, jobs = batch_export.read_manifest(path)
+
+    assert manifest["blender"] == "blender.exe"
+    chair, walk = jobs
+    # Relative to the manifest, absolute paths are kept
+    assert chair.blend == os.path.join(str(tmp_path), "Models/Chair.blend")
+    assert chair.output == os.path.join(str(tmp_path), "Export/Chair.GR2")
+    assert walk.blend == absolute
+    # Job settings override the defaults
+    assert (chair.preset, chair.options) == ("MODEL", {"use_change_tracking": False, "use_tangent": True})
+    assert (walk.preset, walk.options) == ("ANIMATION", {"use_change_tracking": False, "use_tangent": False})
+
+
+def test_read_manifest_without_defaults(tmp_path):
+    path = write_manifest(tmp_path, {"jobs": [{"blend": "a.blend", "output": "a.dae"}]})
+
+    _, (job, ) = batch_export.read_manifest(path)
+
+    assert (job.preset, job.options) == ("NONE", {})
+    assert batch_export.read_manifest(write_manifest(tmp_path, {}))[1] == []
+
+
+@pytest.mark.parametrize("manifest, message", [
+    ({"jobs": [{"output": "a.dae"}]}, "Job 1 of the manifest has no \"blend\"."),
+    ({"jobs": [{"blend": "a.blend", "output": "a.dae"}, {"blend": "b.blend"}]},
+     "Job 2 of the manifest has no \"output\"."),
+    ([], "The manifest must be a JSON object."),
+])
+def test_invalid_manifest(tmp_path, manifest, message):
+    with pytest.raises(ValueError) as error:
+        batch_export.read_manifest(write_manifest(tmp_path, manifest))
+    assert str(error.value) == message
+
+
+def test_command():
+    job = batch_export.ExportJob("C:/Mods/Chair.blend", "C:/Export/Chair.GR2", "MODEL",
+                                 {"use_tangent": False})
+
+    command = job.command("blender.exe")
+
+    assert command[:6] == ["blender.exe", "-b", "C:/Mods/Chair.blend",
+                           "--python-exit-code", "1", "--python-expr"]
+    expr = command[6]
+    assert len(command) == 7
+    assert "sys.path.append({!r})".format(batch_export.ADDON_PARENT) in expr
+    assert "import io_scene_dos2de.batch_export as batch" in expr
+    assert "batch.export_current('C:/Export/Chair.GR2', 'MODEL', json.loads('{\"use_tangent\": false}'))" in expr
+    # The expression is valid Python
+    compile(expr, "<expr>", "exec")
+
+
+def test_invalid_manifest_exits_with_usage_error(tmp_path, capsys):
+    path = write_manifest(tmp_path, {"jobs": [{}]})
+    with pytest.raises(SystemExit) as exit:
+        batch_export.main([path])
+    assert exit.value.code == 2
+    assert "has no \"blend\"" in capsys.readouterr().err
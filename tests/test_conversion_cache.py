@@ -0,0 +1,24 @@
+from dos2de_modules import conversion_cache
+
+DOCUMENT = """<?xml version="1.0" encoding="utf-8"?>
+<COLLADA xmlns="http://www.collada.org/2005/11/COLLADASchema" version="1.4.1">
+<asset>
+\t<created>{0}</created>
+\t<modified>{0}</modified>
+</asset>
+<library_geometries>{1}</library_geometries>
+</COLLADA>
+"""
+
+
+def write(path, timestamp, content):
+    path.write_text(DOCUMENT.format(timestamp, content), encoding="utf-8")
+    return str(path)
+
+
+def test_document_digest_ignores_export_time(tmp_path):
+    first = write(tmp_path / "a.dae", "2024-01-01T10:00:00Z", "mesh")
+    second = write(tmp_path / "b.dae", "2024-01-02T11:30:05Z", "mesh")
+    changed = write(tmp_path / "c.dae", "2024-01-01T10:00:00Z", "other mesh")
+    assert conversion_cache.document_digest(first) == conversion_cache.document_digest(second)
+    assert conversion_cache.document_digest(first) != conversion_cache.document_digest(changed)
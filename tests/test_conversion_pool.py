@@ -0,0 +1,23 @@
+from dos2de_modules import conversion_pool
+
+
+def test_failed_job_keeps_other_results(tmp_path):
+    def fail(job):
+        raise ValueError("broken")
+
+    def succeed(job):
+        pass
+
+    pool = conversion_pool.ConversionPool(2)
+    try:
+        failing = pool.submit(conversion_pool.ConversionJob(None, "a.dae", "a.gr2", on_success=fail))
+        working = pool.submit(conversion_pool.ConversionJob(None, "b.dae", "b.gr2", on_success=succeed))
+        jobs = pool.wait()
+    finally:
+        pool.shutdown()
+
+    assert jobs == [failing, working]
+    assert not failing.succeeded
+    assert failing.error == "Conversion failed: broken"
+    assert failing.finished
+    assert working.succeeded
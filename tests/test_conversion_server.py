@@ -0,0 +1,81 @@
+import pytest
+
+from dos2de_modules import conversion_server
+
+
+@pytest.fixture
+def server(standin_command):
+    server = conversion_server.ConversionServer(standin_command)
+    yield server
+    server.stop()
+
+
+def convert_args(source, destination):
+    return ["-g", "bg3", "-s", str(source), "-d", str(destination), "-a", "convert-model"]
+
+
+def test_handshake(server):
+    server.start()
+    assert server.running
+
+
+def test_job_round_trip(server, tmp_path):
+    source = tmp_path / "in.dae"
+    source.write_text("<COLLADA/>")
+    returncode, stdout, stderr = server.convert(convert_args(source, tmp_path / "out.gr2"), 30)
+    assert returncode == 0
+    assert "Converted" in stdout
+    assert (tmp_path / "out.gr2").read_text() == "<COLLADA/>"
+
+    # Same process for the next job
+    process = server.process
+    returncode, _, stderr = server.convert(convert_args(tmp_path / "missing.dae", tmp_path / "x.gr2"), 30)
+    assert returncode == 1
+    assert stderr
+    assert server.process is process
+
+
+def test_restart_after_crash(server, tmp_path):
+    source = tmp_path / "in.dae"
+    source.write_text("<COLLADA/>")
+    server.start()
+    crashed = server.process
+    crashed.kill()
+    crashed.wait()
+
+    returncode, _, _ = server.convert(convert_args(source, tmp_path / "out.gr2"), 30)
+    assert returncode == 0
+    assert server.process is not crashed
+
+
+def test_timeout_stops_server(standin_command, tmp_path):
+    server = conversion_server.ConversionServer(standin_command + ["--delay", "5"])
+    source = tmp_path / "in.dae"
+    source.write_text("<COLLADA/>")
+    server.start()
+    process = server.process
+    try:
+        with pytest.raises(conversion_server.ServerTimeout):
+            server.run(convert_args(source, tmp_path / "out.gr2"), 0.5)
+        assert process.poll() is not None
+        assert not server.running
+    finally:
+        server.stop()
+
+
+def test_unavailable_server():
+    server = conversion_server.ConversionServer(["/nonexistent/conversion-server"])
+    with pytest.raises(conversion_server.ServerUnavailable):
+        server.convert(["-a", "convert-model"], 5)
+
+
+def test_pool_reuses_servers(standin_command, tmp_path):
+    source = tmp_path / "in.dae"
+    source.write_text("<COLLADA/>")
+    pool = conversion_server.get_server_pool(standin_command)
+    try:
+        for name in ("a.gr2", "b.gr2"):
+            assert pool.convert(convert_args(source, tmp_path / name), 30)[0] == 0
+        assert len(pool.idle) == 1
+    finally:
+        conversion_server.shutdown_servers()
@@ -0,0 +1,56 @@
+import pytest
+
+from dos2de_modules import divine_log
+
+
+@pytest.mark.parametrize("line, level, phase, mesh, bone", [
+    ("[INFO] Loading model: C:\\Mods\\Body.dae", "INFO", "load", None, None),
+    ("[INFO] Exporting model to C:\\Mods\\Body.GR2", "INFO", "save", None, None),
+    ("[DEBUG] Deduplicating vertices", "DEBUG", "process", None, None),
+    ("[WARN] Mesh 'Body_LOD0' has no tangents, generating them", "WARN", "process", "Body_LOD0", None),
+    ("[WARNING] Mesh \"Hair\" has no UV map", "WARN", None, "Hair", None),
+    ("[ERROR] Bone \"Dummy_Root\" is not in the skeleton", "ERROR", None, None, "Dummy_Root"),
+    ("[ERROR] Could not conform mesh: Body_LOD1 to the skeleton", "ERROR", "conform", "Body_LOD1", None),
+    ("[FATAL] Failed to save model: access denied", "FATAL", "save", None, None),
+])
+def test_prefixed_lines(line, level, phase, mesh, bone):
+    record = divine_log.parse_line(line + "\r\n")
+    assert (record.level, record.phase, record.mesh, record.bone) == (level, phase, mesh, bone)
+    assert record.subject == (mesh or bone)
+    assert record.is_error == (level in ("ERROR", "FATAL"))
+    assert record.is_fatal == (level == "FATAL")
+
+
+def test_message_without_prefix():
+    record = divine_log.parse_line("[ERROR] Mesh 'Body' has no skin")
+    assert record.message == "Mesh 'Body' has no skin"
+    assert str(record) == "[ERROR] Mesh 'Body' has no skin"
+
+
+@pytest.mark.parametrize("line, stream, level", [
+    ("Unhandled exception. System.IO.IOException: The process cannot access the file", "stderr", "FATAL"),
+    ("Conversion complete.", "stdout", "INFO"),
+    ("System.NullReferenceException: Object reference not set", "stderr", "ERROR"),
+    ("[VERBOSE] Unknown level", "stdout", "INFO"),
+])
+def test_lines_without_level(line, stream, level):
+    record = divine_log.parse_line(line, stream)
+    assert record.level == level
+    assert record.stream == stream
+    assert record.phase is None
+
+
+def test_continuation_lines_inherit_the_record():
+    error = divine_log.parse_line("[ERROR] Failed to convert mesh 'Body'", "stderr")
+    trace = divine_log.parse_line("   at LSLib.Granny.Model.ColladaImporter.Import()", "stderr", error)
+    assert (trace.level, trace.phase, trace.mesh) == ("ERROR", "process", "Body")
+    assert trace.message == "at LSLib.Granny.Model.ColladaImporter.Import()"
+
+    # Other streams don't continue it
+    other = divine_log.parse_line("Done", "stdout", error)
+    assert (other.level, other.mesh) == ("INFO", None)
+
+
+def test_empty_lines():
+    assert divine_log.parse_line("") is None
+    assert divine_log.parse_line("  \r\n") is None
@@ -0,0 +1,34 @@
+import pytest
+
+from dos2de_modules import lru_cache
+
+
+def test_copy_entry(tmp_path):
+    cache = lru_cache.DiskLRUCache(str(tmp_path / "cache"), 1024)
+    cache.put_bytes("key", b"gr2")
+    destination = tmp_path / "out.gr2"
+
+    assert cache.copy("key", str(destination))
+    assert destination.read_bytes() == b"gr2"
+    assert not cache.copy("missing", str(destination))
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+
+def test_failed_copy_is_a_miss(tmp_path):
+    cache = lru_cache.DiskLRUCache(str(tmp_path / "cache"), 1024)
+    cache.put_bytes("key", b"gr2")
+
+    with pytest.raises(OSError):
+        cache.copy("key", str(tmp_path / "missing" / "out.gr2"))
+    assert (cache.stats.hits, cache.stats.misses) == (0, 1)
+
+
+def test_scan_skips_interrupted_writes(tmp_path):
+    directory = tmp_path / "cache"
+    directory.mkdir()
+    (directory / "key").write_bytes(b"gr2")
+    (directory / "tmpabc123.tmp").write_bytes(b"partial entry")
+
+    cache = lru_cache.DiskLRUCache(str(directory), 1024)
+    assert list(cache.entries) == ["key"]
+    assert cache.size == 3
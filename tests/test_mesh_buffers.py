@@ -0,0 +1,254 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from dos2de_modules import mesh_buffers
+
+
+def test_weld_keeps_last_loop_attributes():
+    positions = np.array([[0.0], [1.0], [1e-9], [1.0 + 1e-9], [2.0]])
+    keys = mesh_buffers.quantize(positions, 1e-6)
+
+    loop_to_vertex, source_loops = mesh_buffers.weld_vertices(keys)
+
+    assert loop_to_vertex.tolist() == [0, 1, 0, 1, 2]
+    assert source_loops.tolist() == [2, 3, 4]
+
+
+def test_weld_empty():
+    loop_to_vertex, source_loops = mesh_buffers.weld_vertices(np.empty((0, 3), dtype=np.int64))
+    assert len(loop_to_vertex) == 0
+    assert len(source_loops) == 0
+
+
+def test_limit_total_drops_smallest_weights():
+    groups = np.array([[0, 1, 2, 3, 4], [0, 1, -1, -1, -1]])
+    weights = np.array([[0.1, 0.5, 0.3, 0.2, 0.4], [0.6, 0.4, 0.0, 0.0, 0.0]])
+
+    limited_groups, limited_weights = mesh_buffers.limit_total(groups, weights, 5, 4)
+
+    assert limited_groups.tolist() == [[1, 4, 2, 3, -1], [0, 1, -1, -1, -1]]
+    assert limited_weights.tolist() == [[0.5, 0.4, 0.3, 0.2, 0.0], [0.6, 0.4, 0.0, 0.0, 0.0]]
+
+
+def test_limit_total_ties_keep_reverse_storage_order():
+    groups = np.array([[0, 1, 2], [0, 1, 2]])
+    weights = np.array([[0.5, 0.5, 0.5], [0.0, 0.0, 0.0]])
+
+    limited_groups, limited_weights = mesh_buffers.limit_total(groups, weights, 3, 2)
+
+    assert limited_groups.tolist() == [[2, 1, -1], [2, 1, -1]]
+    assert limited_weights.tolist() == [[0.5, 0.5, 0.0], [0.0, 0.0, 0.0]]
+
+
+def test_limit_total_leaves_single_group_alone():
+    groups = np.array([[3]])
+    weights = np.array([[0.7]])
+
+    limited_groups, limited_weights = mesh_buffers.limit_total(groups, weights, 4, 1)
+
+    assert limited_groups is groups
+    assert limited_weights is weights
+
+
+def test_limit_total_moves_invalid_groups_first():
+    # Group 5 doesn't exist: it isn't counted, kept, and sorted first
+    groups = np.array([[5, 0, 1, 2, -1]])
+    weights = np.array([[0.9, 0.1, 0.2, 0.3, 0.0]])
+
+    limited_groups, limited_weights = mesh_buffers.limit_total(groups, weights, 3, 2)
+
+    assert limited_groups.tolist() == [[5, 2, 1, -1, -1]]
+    assert limited_weights.tolist() == [[0.9, 0.3, 0.2, 0.0, 0.0]]
+
+
+def test_normalize_all_in_float32():
+    f = np.float32
+    groups = np.array([[0, 1, 2, 3, 4]])
+    weights = np.array([[0.1, 0.2, 0.3, 0.2, 0.4]], dtype=np.float32)
+
+    normalized = mesh_buffers.normalize_all(groups, weights, 5)
+
+    total = f(0.0)
+    for w in weights[0]:
+        total += w
+    expected = np.minimum(weights[0] * (f(1.0) / total * f(1.0)), f(1.0))
+    assert normalized.dtype == np.float32
+    assert normalized[0].tolist() == expected.tolist()
+
+
+def test_normalize_all_single_and_zero_weights():
+    groups = np.array([[2, -1], [0, 1]])
+    weights = np.array([[0.3, 0.0], [0.0, 0.0]], dtype=np.float32)
+
+    normalized = mesh_buffers.normalize_all(groups, weights, 3)
+
+    assert normalized.tolist() == [[1.0, 0.0], [0.0, 0.0]]
+
+
+def test_normalize_all_skips_invalid_groups():
+    groups = np.array([[0, 7]])
+    weights = np.array([[0.5, 0.9]], dtype=np.float32)
+
+    normalized = mesh_buffers.normalize_all(groups, weights, 2)
+
+    assert normalized.tolist() == [[1.0, np.float32(0.9)]]
+
+
+def test_normalize_all_keeps_locked_group():
+    f = np.float32
+    groups = np.array([[0, 1, 2]])
+    weights = np.array([[0.5, 0.2, 0.2]], dtype=np.float32)
+
+    normalized = mesh_buffers.normalize_all(
+        groups, weights, 3, locked=np.array([True, False, False]))
+
+    # The unlocked groups share the weight left by the locked one
+    scalar = f(1.0) / (f(0.2) + f(0.2)) * (f(1.0) - f(0.5))
+    assert normalized.tolist() == [[f(0.5), f(0.2) * scalar, f(0.2) * scalar]]
+
+
+def test_quantize_weights():
+    weights = np.array([0.5, 0.0, 1.0, 0.3])
+
+    quantized = mesh_buffers.quantize_weights(weights, 1.0 / 255.0)
+
+    # 127.5 and 76.5 steps round to even
+    assert quantized.tolist() == (np.array([128.0, 0.0, 255.0, 76.0]) * (1.0 / 255.0)).tolist()
+    assert mesh_buffers.quantize_weights(weights, 0.0) is weights
+
+
+def make_buffers(positions, normals, surfaces, tangents=None):
+    buffers = mesh_buffers.MeshBuffers()
+    buffers.positions = np.array(positions, dtype=np.float32)
+    buffers.normals = np.array(normals, dtype=np.float32)
+    if tangents is not None:
+        buffers.tangents = np.array(tangents, dtype=np.float32)
+        buffers.bitangents = np.array(tangents, dtype=np.float32)
+    buffers.surfaces = surfaces
+    return buffers
+
+
+def test_transform_mirror_flips_winding():
+    buffers = make_buffers([1, 2, 3] * 3, [1, 0, 0] * 3, [(0, [0, 1, 2], [3])])
+
+    mesh_buffers.transform_buffers(buffers, np.diag([-1.0, 1.0, 1.0, 1.0]))
+
+    assert buffers.positions.tolist() == [-1, 2, 3] * 3
+    assert buffers.normals.tolist() == [-1, 0, 0] * 3
+    assert [s[1].tolist() for s in buffers.surfaces] == [[2, 1, 0]]
+
+
+def test_transform_mirror_flips_every_polygon():
+    buffers = make_buffers([0, 0, 0] * 7, [0, 0, 1] * 7,
+                           [(0, [0, 1, 2, 3, 4, 5, 6], [4, 3]), (1, [6, 5, 4], [3])])
+
+    mesh_buffers.transform_buffers(buffers, np.diag([1.0, 1.0, -1.0, 1.0]))
+
+    assert [s[1].tolist() for s in buffers.surfaces] == [[3, 2, 1, 0, 6, 5, 4], [4, 5, 6]]
+    assert [s[2].tolist() for s in buffers.surfaces] == [[4, 3], [3]]
+
+
+def test_transform_non_uniform_scale():
+    # A face on the plane x + y = 1, scaled by 2 along x, lies on x / 2 + y = 1
+    s = 1.0 / np.sqrt(2.0)
+    buffers = make_buffers([1, 0, 0], [s, s, 0], [(0, [0, 1, 2], [3])], tangents=[s, -s, 0])
+    matrix = np.diag([2.0, 1.0, 1.0, 1.0])
+    matrix[:3, 3] = [0.0, 0.0, 5.0]
+
+    mesh_buffers.transform_buffers(buffers, matrix)
+
+    r = 1.0 / np.sqrt(5.0)
+    assert buffers.positions.tolist() == [2, 0, 5]
+    assert buffers.normals == pytest.approx([r, 2 * r, 0])
+    assert buffers.tangents == pytest.approx([2 * r, -r, 0])
+    # Normals stay perpendicular to the transformed surface
+    assert np.dot(buffers.normals, buffers.tangents) == pytest.approx(0.0, abs=1e-6)
+    assert [s[1] for s in buffers.surfaces] == [[0, 1, 2]]
+
+
+def digest_buffers(dtype=np.float32, positions=None, surfaces=None, tangents=False):
+    buffers = mesh_buffers.MeshBuffers()
+    buffers.vertex_count = 3
+    buffers.positions = np.array(positions or [0, 0, 0, 1, 0, 0, 0, 1, 0], dtype=dtype)
+    buffers.normals = np.array([0, 0, 1] * 3, dtype=dtype)
+    if tangents:
+        buffers.tangents = np.array([1, 0, 0] * 3, dtype=dtype)
+        buffers.bitangents = np.array([0, 1, 0] * 3, dtype=dtype)
+    buffers.uvs = [np.array([0, 0, 1, 0, 0, 1], dtype=dtype)]
+    buffers.surfaces = surfaces or [(0, np.array([0, 1, 2]), np.array([3]))]
+    return buffers
+
+
+def test_identical_buffers_share_a_digest():
+    assert (mesh_buffers.buffers_digest(digest_buffers(), True, ["Skin"]) ==
+            mesh_buffers.buffers_digest(digest_buffers(), True, ["Skin"]))
+
+
+def test_list_buffers_share_a_digest():
+    def list_buffers(positions):
+        buffers = mesh_buffers.MeshBuffers()
+        buffers.vertex_count = 1
+        buffers.positions = positions
+        buffers.normals = [0.0, 0.0, 1.0]
+        buffers.surfaces = [(0, [0, 0, 0], [3])]
+        return buffers
+
+    digest = mesh_buffers.buffers_digest(list_buffers([0.1, 0.2, 0.3]))
+    assert mesh_buffers.buffers_digest(list_buffers([0.1, 0.2, 0.3])) == digest
+    # Values that only differ below float32 precision are written differently
+    assert mesh_buffers.buffers_digest(list_buffers([0.1, 0.2, 0.30000000001])) != digest
+
+
+@pytest.mark.parametrize("changed", [
+    # float32 and float64 values are written differently
+    dict(dtype=np.float64),
+    dict(positions=[0, 0, 0, 1, 0, 0, 0, 2, 0]),
+    dict(tangents=True),
+    dict(surfaces=[(1, np.array([0, 1, 2]), np.array([3]))]),
+    dict(surfaces=[(0, np.array([0, 2, 1]), np.array([3]))]),
+    dict(surfaces=[(0, np.array([0, 1, 2]), np.array([2, 1]))]),
+    dict(surfaces=[(0, np.array([0]), np.array([1])), (1, np.array([1, 2]), np.array([2]))]),
+])
+def test_changed_buffers_get_another_digest(changed):
+    assert (mesh_buffers.buffers_digest(digest_buffers(**changed)) !=
+            mesh_buffers.buffers_digest(digest_buffers()))
+
+
+def test_layout_is_part_of_the_digest():
+    buffers = digest_buffers()
+    assert (mesh_buffers.buffers_digest(buffers, True, ["Skin"]) !=
+            mesh_buffers.buffers_digest(buffers, False, ["Skin"]))
+    assert (mesh_buffers.buffers_digest(buffers, True, ["Skin"]) !=
+            mesh_buffers.buffers_digest(buffers, True, ["Cloth"]))
+
+
+def test_pad_rows():
+    rows = mesh_buffers.pad_rows([2, 0, 3], [4, 5, 6, 7, 8], -1, np.int64)
+    assert rows.tolist() == [[4, 5, -1], [-1, -1, -1], [6, 7, 8]]
+    assert mesh_buffers.pad_rows([], [], -1, np.int64).shape == (0, 0)
+
+
+def test_skin_influences():
+    # Vertex group 1 isn't a bone of the skeleton
+    group_bones = np.array([0, -1, 2])
+    groups = np.array([[0, 1, 2], [2, -1, -1], [5, 0, -1], [2, 0, -1]])
+    weights = np.array([[0.5, 0.9, 0.3], [0.0005, 0.0, 0.0], [0.4, 0.6, 0.0], [0.001, 0.2, 0.0]])
+
+    bones, bone_weights, unassigned = mesh_buffers.skin_influences(
+        group_bones, groups, weights, 0.001)
+
+    assert bones.tolist() == [[0, 2], [0, -1], [0, -1], [0, -1]]
+    # Weights at or below min_weight and on non-bone or unknown groups are
+    # dropped; vertices without weights get bone 0 at full weight
+    assert bone_weights.tolist() == [[0.5, 0.3], [1.0, 0.0], [0.6, 0.0], [0.2, 0.0]]
+    assert unassigned.tolist() == [False, True, False, False]
+
+
+def test_skin_influences_all_unassigned():
+    bones, weights, unassigned = mesh_buffers.skin_influences(
+        np.array([-1]), np.array([[0, -1], [-1, -1]]), np.array([[0.7, 0.0], [0.0, 0.0]]), 0.001)
+
+    assert bones.tolist() == [[0], [0]]
+    assert weights.tolist() == [[1.0], [1.0]]
+    assert unassigned.tolist() == [True, True]
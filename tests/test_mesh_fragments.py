@@ -0,0 +1,53 @@
+from dos2de_modules import mesh_fragments
+
+
+def make_fragment(digest="0a1b", skin=True):
+    fragment = mesh_fragments.MeshFragment()
+    fragment.geometry = [
+        "<geometry id=\"{}\" name=\"Body\">".format(mesh_fragments.MESH_ID),
+        "\t<float_array count=\"3\">0.5 1.0 -2.0</float_array>",
+        "</geometry>",
+    ]
+    if skin:
+        fragment.skin = [
+            "<controller id=\"{}\">".format(mesh_fragments.CONTROLLER_ID),
+            "\t<skin source=\"#{}\"/>".format(mesh_fragments.MESH_ID),
+            "</controller>",
+        ]
+    fragment.digest = digest
+    fragment.unassigned_weights = skin
+    return fragment
+
+
+def test_round_trip():
+    for fragment in (make_fragment(), make_fragment(digest="", skin=False)):
+        loaded = mesh_fragments.loads(mesh_fragments.dumps(fragment))
+        assert loaded.geometry == fragment.geometry
+        assert loaded.skin == fragment.skin
+        assert loaded.digest == fragment.digest
+        assert loaded.unassigned_weights == fragment.unassigned_weights
+
+
+def test_other_versions_and_truncated_data():
+    data = mesh_fragments.dumps(make_fragment())
+    other_version = data.replace(
+        " {} ".format(mesh_fragments.FORMAT_VERSION).encode(), b" 999 ", 1)
+    assert mesh_fragments.loads(other_version) is None
+    assert mesh_fragments.loads(data.rsplit(b"\n", 1)[0]) is None
+
+
+def test_fill():
+    lines = mesh_fragments.fill(make_fragment().skin, {
+        mesh_fragments.MESH_ID: "mesh-1", mesh_fragments.CONTROLLER_ID: "controller-2"})
+    assert list(lines) == [
+        "<controller id=\"controller-2\">", "\t<skin source=\"#mesh-1\"/>", "</controller>"]
+
+
+def test_key_builder():
+    def key(*values):
+        builder = mesh_fragments.KeyBuilder()
+        builder.add(*values)
+        return builder.hexdigest()
+
+    assert key("Body", True) == key("Body", True)
+    assert key("Body", True) != key("Body", False)
@@ -0,0 +1,93 @@
+import json
+import os
+
+import pytest
+
+from dos2de_modules import output_manifest
+
+
+@pytest.fixture
+def output(tmp_path):
+    path = tmp_path / "Body.GR2"
+    path.write_bytes(b"gr2")
+    return str(path)
+
+
+def saved_manifest(output, fingerprint="abc", conversion="bg3 -e x"):
+    manifest = output_manifest.OutputManifest(output, conversion)
+    manifest.fingerprint = fingerprint
+    assert manifest.save()
+    return manifest
+
+
+def test_round_trip(output):
+    saved_manifest(output)
+
+    manifest = output_manifest.OutputManifest(output, "bg3 -e x")
+    manifest.fingerprint = "abc"
+    assert manifest.is_current()
+    data = manifest.read()
+    assert data["version"] == output_manifest.MANIFEST_VERSION
+    assert data["fingerprint"] == "abc"
+    assert data["output"] == output_manifest.output_state(output)
+
+
+@pytest.mark.parametrize("fingerprint, conversion", [
+    ("other", "bg3 -e x"),
+    ("abc", "dos2de -e x"),
+    (None, "bg3 -e x"),
+])
+def test_changed_document_or_conversion(output, fingerprint, conversion):
+    saved_manifest(output)
+
+    manifest = output_manifest.OutputManifest(output, conversion)
+    manifest.fingerprint = fingerprint
+    assert not manifest.is_current()
+
+
+def test_modified_or_missing_output(output):
+    manifest = saved_manifest(output)
+
+    with open(output, "ab") as f:
+        f.write(b"edited")
+    assert not manifest.is_current()
+
+    manifest.save()
+    assert manifest.is_current()
+    os.remove(output)
+    assert not manifest.is_current()
+
+    # Not even when the manifest was written without an output
+    manifest.save()
+    assert manifest.read()["output"] is None
+    assert not manifest.is_current()
+
+
+@pytest.mark.parametrize("content", [
+    "{not json",
+    "[1, 2]",
+    json.dumps({"version": output_manifest.MANIFEST_VERSION + 1, "fingerprint": "abc"}),
+    "",
+])
+def test_corrupt_sidecar(output, content):
+    manifest = saved_manifest(output)
+    with open(output_manifest.manifest_path(output), "w", encoding="utf-8") as f:
+        f.write(content)
+
+    assert manifest.read() is None
+    assert not manifest.is_current()
+
+
+def test_remove(output):
+    manifest = saved_manifest(output)
+    manifest.remove()
+    assert not os.path.exists(output_manifest.manifest_path(output))
+    # Removing twice is fine
+    manifest.remove()
+    assert manifest.read() is None
+
+
+def test_save_failure(tmp_path):
+    manifest = output_manifest.OutputManifest(str(tmp_path / "missing" / "Body.GR2"))
+    manifest.fingerprint = "abc"
+    assert not manifest.save()
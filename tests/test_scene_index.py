@@ -0,0 +1,135 @@
+from dos2de_modules import scene_index
+
+
+class Collection:
+    def __init__(self, name, hide_viewport=False):
+        self.name = name
+        self.hidden = hide_viewport
+        self.reads = 0
+
+    @property
+    def hide_viewport(self):
+        self.reads += 1
+        return self.hidden
+
+
+class Object:
+    def __init__(self, name, parent=None, collections=()):
+        self.name = name
+        self.parent = parent
+        self.users_collection = list(collections)
+
+
+class LayerCollection:
+    def __init__(self, collection, exclude=False, hide_viewport=False, children=()):
+        self.collection = collection
+        self.exclude = exclude
+        self.hide_viewport = hide_viewport
+        self.children = list(children)
+
+
+def test_visible_top_collections():
+    nested = LayerCollection(Collection("Nested"))
+    view_layer = LayerCollection(Collection("Scene Collection"), children=[
+        LayerCollection(Collection("Body"), children=[nested]),
+        LayerCollection(Collection("Excluded"), exclude=True),
+        LayerCollection(Collection("Hidden"), hide_viewport=True),
+        LayerCollection(Collection("Disabled", hide_viewport=True)),
+        LayerCollection(Collection("Armor")),
+    ])
+
+    collections = scene_index.visible_top_collections(view_layer)
+
+    # Outliner order, nested collections are exported with their parent
+    assert [c.name for c in collections] == ["Body", "Armor"]
+
+
+def make_hierarchy():
+    scene = Collection("Scene")
+    root = Object("Root", collections=[scene])
+    b = Object("B", root, [scene])
+    a = Object("A", root, [scene])
+    a_child = Object("A.child", a, [scene])
+    other = Object("Other", collections=[scene])
+    return scene, [a_child, b, other, a, root]
+
+
+def recursive_walk(objects, roots):
+    """The walk SceneIndex replaced: Object.children, sorted by name"""
+    order = []
+
+    def visit(obj):
+        order.append(obj)
+        for child in sorted((o for o in objects if o.parent is obj), key=lambda o: o.name):
+            visit(child)
+
+    for root in sorted(roots, key=lambda o: o.name):
+        visit(root)
+    return order
+
+
+def test_children_sorted_by_name():
+    scene, objects = make_hierarchy()
+    a_child, b, other, a, root = objects
+
+    index = scene_index.SceneIndex(objects)
+
+    assert list(index.children_of(root)) == [a, b]
+    assert list(index.children_of(a)) == [a_child]
+    assert list(index.children_of(b)) == []
+    assert list(index.roots()) == [other, root]
+
+
+def test_ancestors_are_indexed():
+    scene, objects = make_hierarchy()
+    a_child, b, other, a, root = objects
+
+    # Only the leaf is passed, its parents are reached through it
+    index = scene_index.SceneIndex([a_child])
+
+    assert list(index.roots()) == [root]
+    assert index.traversal() == [root, a, a_child]
+
+
+def test_traversal_matches_recursive_walk():
+    scene, objects = make_hierarchy()
+    a_child, b, other, a, root = objects
+
+    index = scene_index.SceneIndex(objects)
+
+    assert index.traversal() == recursive_walk(objects, [root, other])
+    assert index.traversal() == [other, root, a, a_child, b]
+    assert index.traversal([a]) == [a, a_child]
+
+
+def test_parent_override():
+    scene, objects = make_hierarchy()
+    a_child, b, other, a, root = objects
+
+    # Flatten everything below the root
+    index = scene_index.SceneIndex(
+        objects, parent_of=lambda obj: root if obj.parent is not None else None)
+
+    assert list(index.children_of(root)) == [a, a_child, b]
+
+
+def test_visible_collections_are_read_once():
+    scene, objects = make_hierarchy()
+    hidden = Collection("Hidden", hide_viewport=True)
+    late = Collection("Late")
+    shown = Object("Shown", collections=[scene])
+    in_hidden = Object("InHidden", collections=[scene, hidden])
+
+    index = scene_index.SceneIndex(objects + [in_hidden])
+    reads = scene.reads
+    assert reads == 1
+    assert index.in_visible_collections(shown)
+    assert not index.in_visible_collections(in_hidden)
+    assert scene.reads == reads
+    assert hidden.reads == 1
+
+    # Collections that weren't indexed are read once, on first use
+    shown.users_collection.append(late)
+    assert index.in_visible_collections(shown)
+    assert index.in_visible_collections(shown)
+    assert late.reads == 1
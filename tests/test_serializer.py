@@ -0,0 +1,102 @@
+import array
+
+import pytest
+
+from dos2de_modules import serializer
+
+
+class Vector:
+    """Sequence without tolist, like mathutils.Vector"""
+
+    def __init__(self, *values):
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+
+def test_empty_array():
+    stats = serializer.SizeStats()
+    assert serializer.floats([]) == ""
+    assert serializer.floats([], "{:.3g}", stats) == ""
+    assert (stats.written, stats.full) == (0, 0)
+
+
+def test_float32_input_writes_the_float32_value():
+    np = pytest.importorskip("numpy")
+    assert serializer.floats(np.float32([0.3])) == "0.30000001192092896"
+
+
+def test_array_and_sequence_inputs():
+    assert serializer.floats(array.array("f", [0.5, -2.0])) == "0.5 -2.0"
+    assert serializer.floats(Vector(1, 0.25, -3)) == "1.0 0.25 -3.0"
+    assert serializer.ints(array.array("i", [3, 0, -1])) == "3 0 -1"
+
+
+def test_full_precision_round_trip():
+    values = [0.1, 1.0 / 3.0, -1e-300, 12345.678901234567]
+    text = serializer.floats(values)
+    assert [float(x) for x in text.split(" ")] == values
+
+
+def test_reduced_precision_round_trip():
+    fmt = serializer.float_format(4)
+    stats = serializer.SizeStats()
+    values = [1.0 / 3.0, 2.5, 100.0, -0.000123456]
+
+    text = serializer.floats(values, fmt, stats)
+
+    assert text == "0.3333 2.5 100 -0.0001235"
+    assert [float(x) for x in text.split(" ")] == pytest.approx(values, rel=1e-3)
+    full = "0.3333333333333333 2.5 100.0 -0.000123456"
+    assert (stats.written, stats.full) == (len(text), len(full))
+    assert stats.saved == len(full) - len(text)
+
+
+def test_float_format():
+    assert serializer.float_format(0) is serializer.FULL_PRECISION
+    assert serializer.float_format(6) == "{:.6g}"
+
+
+def test_matrices():
+    identity = [[1.0 if row == column else 0.0 for column in range(4)] for row in range(4)]
+    assert serializer.matrix(identity, "{:g}") == "1 0 0 0 0 1 0 0 0 0 1 0 0 0 0 1"
+    assert serializer.matrices([identity, identity]).count(" ") == 31
+
+
+PRECISION_SETTINGS = {
+    "precision_positions": 5,
+    "precision_normals": 3,
+    "precision_uvs": 4,
+    "precision_colors": 2,
+    "precision_weights": 3,
+    "precision_matrices": 0,
+}
+
+
+@pytest.mark.parametrize("kind, values, text", [
+    ("position", [1.234567, -20.0], "1.2346 -20"),
+    ("normal", [0.70710678, 0.0], "0.707 0"),
+    ("uv", [0.123456, 1.0], "0.1235 1"),
+    ("color", [0.501960813999176, 1.0], "0.5 1"),
+    ("weight", [0.33333334, 0.66666666], "0.333 0.667"),
+])
+def test_precision_settings(kind, values, text):
+    formats = serializer.precision_formats(PRECISION_SETTINGS)
+    stats = serializer.SizeStats()
+
+    assert serializer.floats(values, formats[kind], stats) == text
+    full = " ".join(repr(float(v)) for v in values)
+    assert stats.saved == len(full) - len(text)
+
+
+def test_full_precision_setting_records_nothing():
+    formats = serializer.precision_formats(PRECISION_SETTINGS)
+    stats = serializer.SizeStats()
+
+    assert formats["matrix"] is serializer.FULL_PRECISION
+    assert serializer.floats([0.1, 2.0], formats["matrix"], stats) == "0.1 2.0"
+    assert stats.saved == 0